@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Sync code runs on changing threads under ASGI, so share a pool instead of keeping one connection per thread.
+os.environ.setdefault('DB_CONN_MODE', 'pool')
 
 application = get_asgi_application()
+
+from config.db_connections import install  # noqa: E402  (needs settings loaded)
+
+install()
@@ -0,0 +1,18 @@
+"""
+Which cache aliases every worker process sees.
+
+Some caches hold answers that must agree across processes (blacklisted
+tokens, replica pins). ``locmem`` is private to each process and ``dummy``
+keeps nothing, so code that relies on such an answer checks ``is_shared()``
+before trusting the cache and falls back to the database otherwise.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared(alias):
+    """Whether entries written to `alias` by one process are read by the others."""
+    return not isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
@@ -0,0 +1,127 @@
+"""
+Database connection reuse, as seen from /metrics/.
+
+``DB_CONN_MODE`` (see settings) picks how connections are reused:
+
+* ``persistent``: each worker thread keeps its connection open for
+  ``CONN_MAX_AGE`` seconds and checks it before reusing it. Best for WSGI
+  workers with a fixed set of threads.
+* ``pool``: one psycopg 3 pool per process and alias, shared by all threads.
+  The ASGI entry point defaults to it, because sync code there runs on
+  changing threads and thread-held connections would pile up.
+* ``none``: a new connection for every request.
+
+``install()`` runs from both entry points. It counts the connections this
+process opens (churn) and which of them are still open, and adds pool usage,
+wait time and connection counts from ``psycopg_pool``'s statistics to the
+metrics output. Multiply the open or pool-size numbers by the worker count
+to compare them with the server's ``max_connections``.
+"""
+import threading
+import weakref
+from collections import Counter
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import _number, registry
+
+# metric name -> (type, help text, key in psycopg_pool's get_stats(), divisor)
+POOL_METRICS = {
+    'db_pool_size': ('gauge', "Connections held by the pool.", 'pool_size', 1),
+    'db_pool_available': ('gauge', "Idle connections in the pool.", 'pool_available', 1),
+    'db_pool_max_size': ('gauge', "Most connections the pool may hold.", 'pool_max', 1),
+    'db_pool_requests_waiting': ('gauge', "Threads currently waiting for a connection.", 'requests_waiting', 1),
+    'db_pool_requests_total': ('counter', "Connections handed out by the pool.", 'requests_num', 1),
+    'db_pool_requests_queued_total': ('counter', "Requests that had to wait for a connection.", 'requests_queued', 1),
+    'db_pool_wait_seconds_total': ('counter', "Time spent waiting for a connection.", 'requests_wait_ms', 1000),
+    'db_pool_timeouts_total': ('counter', "Requests that gave up waiting for a connection.", 'requests_errors', 1),
+    'db_pool_connections_opened_total': ('counter', "Connections the pool opened.", 'connections_num', 1),
+    'db_pool_connect_seconds_total': ('counter', "Time spent opening connections.", 'connections_ms', 1000),
+    'db_pool_connections_lost_total': ('counter', "Connections found broken and discarded.", 'connections_lost', 1),
+}
+
+
+def _existing_pool(wrapper):
+    """The alias's connection pool if one has been opened; reading ``wrapper.pool`` would open it."""
+    return getattr(type(wrapper), '_connection_pools', {}).get(wrapper.alias)
+
+
+class ConnectionTracker:
+    """Counts connections as Django opens them and remembers the wrappers to see which are still open."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = Counter()  # alias -> connections opened by this process
+        self._wrappers = weakref.WeakSet()
+
+    def connection_created(self, sender, connection, **kwargs):
+        with self._lock:
+            self.opened[connection.alias] += 1
+            self._wrappers.add(connection)
+
+    def open_connections(self):
+        """alias -> connections currently open in this process, across threads (pooled ones excluded)."""
+        with self._lock:
+            wrappers = list(self._wrappers)
+        counts = Counter()
+        for wrapper in wrappers:
+            if wrapper.connection is not None and not wrapper.settings_dict['OPTIONS'].get('pool'):
+                counts[wrapper.alias] += 1
+        return counts
+
+    def collect(self):
+        """Exposition lines for the metrics endpoint."""
+        with self._lock:
+            opened = dict(self.opened)
+        open_now = self.open_connections()
+        aliases = sorted(connections.settings)
+        lines = [
+            "# HELP db_connections_opened_total Database connections opened by Django in this process (churn).",
+            "# TYPE db_connections_opened_total counter",
+        ]
+        lines += [f'db_connections_opened_total{{alias="{alias}"}} {opened.get(alias, 0)}' for alias in aliases]
+        lines += [
+            "# HELP db_connections_open Thread-held database connections currently open in this process.",
+            "# TYPE db_connections_open gauge",
+        ]
+        lines += [f'db_connections_open{{alias="{alias}"}} {open_now.get(alias, 0)}' for alias in aliases]
+        lines += [
+            "# HELP db_connection_max_age_seconds CONN_MAX_AGE of each alias; 0 closes connections after each request.",
+            "# TYPE db_connection_max_age_seconds gauge",
+        ]
+        for alias in aliases:
+            max_age = connections.settings[alias].get('CONN_MAX_AGE', 0)
+            if max_age is not None:  # None keeps connections forever, which a gauge cannot express
+                lines.append(f'db_connection_max_age_seconds{{alias="{alias}"}} {max_age}')
+
+        pool_stats = {}
+        for alias in aliases:
+            pool = _existing_pool(connections[alias])
+            if pool is not None:
+                pool_stats[alias] = pool.get_stats()
+        for name, (kind, help_text, key, divisor) in POOL_METRICS.items():
+            if not pool_stats:
+                break
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for alias, stats in pool_stats.items():
+                value = stats.get(key, 0)
+                lines.append(f'{name}{{alias="{alias}"}} {_number(value / divisor if divisor != 1 else value)}')
+        return lines
+
+
+tracker = ConnectionTracker()
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install():
+    """Start counting connections and add them to /metrics/; safe to call more than once."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        connection_created.connect(tracker.connection_created, dispatch_uid='config.db_connections')
+        registry.register_collector(tracker.collect)
+        _installed = True
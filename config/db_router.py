@@ -0,0 +1,216 @@
+"""
+Read replicas with read-your-writes consistency.
+
+``PrimaryReplicaRouter`` sends reads made while serving a GET/HEAD/OPTIONS
+request to a replica and everything else to ``default``. Writes, reads
+inside a write request, and reads outside of requests (management commands,
+the notification worker) all use the primary.
+
+After a user writes, ``ReplicaRoutingMiddleware`` pins them to the primary
+for ``REPLICAS['PIN_SECONDS']``, so a tweet they just posted shows up in
+their own feed even while replicas lag behind. The pin is recorded twice:
+in the cache under the JWT user id, and in a short-lived cookie for
+browser/admin sessions. API clients rarely keep the cookie and their next
+request may reach another worker, so ``REPLICAS['CACHE_ALIAS']`` must be a
+cache every process shares; ``manage.py check`` fails otherwise.
+
+Each replica is health-checked at most every ``HEALTH_CHECK_INTERVAL``
+seconds as it is picked: it must accept a connection and, on PostgreSQL,
+replay within ``MAX_LAG`` seconds of the primary. A replica that has
+replayed all the WAL it received is current however old its last replayed
+commit is (the primary may simply be idle). Unhealthy replicas are
+skipped until their next check; with none left, reads go to the primary.
+
+Replicas come from the ``DB_REPLICA_HOSTS`` environment variable (see
+settings). To try it locally, point it at the primary's own host: the alias
+then reads the same database, and tests mirror it onto the test database.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .caches import is_shared
+
+logger = logging.getLogger(__name__)
+
+REPLICAS_DEFAULTS = {
+    'ALIASES': [],  # DATABASES aliases of the read replicas
+    'PIN_SECONDS': 5,  # How long a writer keeps reading from the primary; should exceed the usual replica lag
+    'PIN_COOKIE': 'db_pin',
+    'CACHE_ALIAS': 'default',
+    'HEALTH_CHECK_INTERVAL': 10,  # Seconds between checks of one replica
+    'MAX_LAG': 30,  # Seconds of replay lag after which a PostgreSQL replica is skipped
+}
+
+_routing = contextvars.ContextVar('replica_routing', default=None)
+
+
+def replica_setting(name):
+    """Read a REPLICAS setting, falling back to the defaults above."""
+    return getattr(settings, 'REPLICAS', {}).get(name, REPLICAS_DEFAULTS[name])
+
+
+@checks.register(checks.Tags.caches, checks.Tags.database)
+def check_pin_cache(app_configs, **kwargs):
+    """Pins written by one worker must be read by all of them, or writers read their own writes from a replica."""
+    alias = replica_setting('CACHE_ALIAS')
+    if replica_setting('ALIASES') and not is_shared(alias):
+        return [checks.Error(
+            f"REPLICAS['CACHE_ALIAS'] ({alias!r}) is private to each process, so a user who writes through one "
+            "worker can read a stale replica through another.",
+            hint="Use a shared cache backend such as Redis (set REDIS_URL).",
+            id='replicas.E001',
+        )]
+    return []
+
+
+def _pin_key(user_id):
+    return f'db-pin:{user_id}'
+
+
+class ReplicaHealth:
+    """Last known health of each replica, refreshed lazily by whichever thread picks it next."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = {}  # alias -> monotonic time of the last check
+        self._healthy = {}
+
+    def _check(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(
+                        "SELECT pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn(), "
+                        "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())")
+                    caught_up, since_replay = cursor.fetchone()
+                    # The last replayed commit ages while the primary is idle; it only measures lag while WAL
+                    # received from the primary is still waiting to be replayed.
+                    lag = 0 if caught_up or since_replay is None else since_replay
+                    if lag > replica_setting('MAX_LAG'):
+                        logger.warning("Replica %s is %.1fs behind; reading from other databases", alias, lag)
+                        return False
+                else:
+                    cursor.execute("SELECT 1")
+            return True
+        except DatabaseError:
+            logger.warning("Replica %s is unreachable; reading from other databases", alias, exc_info=True)
+            connection.close()
+            return False
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            due = now - self._checked_at.get(alias, float('-inf')) >= replica_setting('HEALTH_CHECK_INTERVAL')
+            if due:
+                self._checked_at[alias] = now  # Other threads keep using the previous answer meanwhile
+        if due:
+            healthy = self._check(alias)
+            with self._lock:
+                self._healthy[alias] = healthy
+        return self._healthy.get(alias, True)
+
+
+health = ReplicaHealth()
+
+
+class RequestRouting:
+    """Routing decision for one request, worked out on its first read."""
+
+    def __init__(self, request):
+        self.request = request
+        self._use_primary = None
+        self.replica = None  # Replica chosen for this request, so its reads see one consistent snapshot
+
+    def use_primary(self):
+        if self._use_primary is None:
+            self._use_primary = self.request.method not in SAFE_METHODS or self._pinned()
+        return self._use_primary
+
+    def _pinned(self):
+        if self.request.COOKIES.get(replica_setting('PIN_COOKIE')):
+            return True
+        user_id = token_user_id(self.request)
+        return user_id is not None and caches[replica_setting('CACHE_ALIAS')].get(_pin_key(user_id)) is not None
+
+
+def token_user_id(request):
+    """The user id claimed by a valid JWT on the request, without touching the database."""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+    except InvalidToken:
+        return None
+
+
+def pick_replica():
+    """A random healthy replica alias, or None."""
+    aliases = list(replica_setting('ALIASES'))
+    random.shuffle(aliases)
+    for alias in aliases:
+        if health.is_healthy(alias):
+            return alias
+    return None
+
+
+class PrimaryReplicaRouter:
+    """Route reads of safe, unpinned requests to a healthy replica; everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.use_primary() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if routing.replica is None:
+            routing.replica = pick_replica() or DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Replicas hold the same rows as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replica_setting('ALIASES')  # Replicas get their schema through replication
+
+
+class ReplicaRoutingMiddleware:
+    """Scope routing to the request and pin users to the primary after they write."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_setting('ALIASES'):
+            return self.get_response(request)
+
+        token = _routing.set(RequestRouting(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_seconds = replica_setting('PIN_SECONDS')
+            user_id = token_user_id(request)
+            if user_id is not None:
+                caches[replica_setting('CACHE_ALIAS')].set(_pin_key(user_id), True, pin_seconds)
+            response.set_cookie(replica_setting('PIN_COOKIE'), '1', max_age=pin_seconds, httponly=True,
+                                samesite='Lax')
+        return response
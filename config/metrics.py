@@ -0,0 +1,272 @@
+"""
+Per-request instrumentation.
+
+``MetricsMiddleware`` measures a sample of requests: SQL query count and time
+(through a database execute wrapper), time spent in serializers (around
+``Serializer.data``, minus the SQL it runs), the rest of the view, response
+rendering time, total time and response size. Each measured
+response gets a ``Server-Timing`` header, which browser dev tools and most
+HTTP clients display, and the numbers are aggregated per resolved URL name
+(``personalized-feed``, ``comment-list``, ...) into histograms served in the
+Prometheus text format at ``/metrics/``.
+
+Histograms are kept per process; scrape every worker, or run one worker
+per container, to see the whole picture. Unsampled requests skip all of
+this and cost one ``random()`` call.
+"""
+import contextvars
+import hmac
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from rest_framework.serializers import ListSerializer, Serializer
+
+METRICS_DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,  # Share of requests measured, 0.0-1.0
+    'SERVER_TIMING': True,  # Add a Server-Timing header to measured responses
+    'TOKEN': None,  # Bearer token required by /metrics/; without one it is only served when DEBUG is on
+    'DURATION_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),  # Seconds
+    'QUERY_BUCKETS': (0, 1, 2, 3, 5, 10, 20, 50, 100),
+    'SIZE_BUCKETS': (256, 1024, 4096, 16384, 65536, 262144, 1048576),  # Bytes
+}
+
+# name -> (help text, buckets setting)
+HISTOGRAMS = {
+    'api_request_duration_seconds': ("Time spent handling the request.", 'DURATION_BUCKETS'),
+    'api_db_duration_seconds': ("Time spent executing SQL.", 'DURATION_BUCKETS'),
+    'api_app_duration_seconds': ("Time spent outside SQL, serializers and rendering: view logic.",
+                                 'DURATION_BUCKETS'),
+    'api_serialize_duration_seconds': ("Time spent in serializers, excluding the SQL they run.", 'DURATION_BUCKETS'),
+    'api_render_duration_seconds': ("Time spent rendering the response body.", 'DURATION_BUCKETS'),
+    'api_db_queries': ("SQL queries executed per request.", 'QUERY_BUCKETS'),
+    'api_response_bytes': ("Size of the response body.", 'SIZE_BUCKETS'),
+}
+
+
+def metrics_setting(name):
+    """Read a METRICS setting, falling back to the defaults above."""
+    return getattr(settings, 'METRICS', {}).get(name, METRICS_DEFAULTS[name])
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """(upper bound, cumulative count) pairs, ending with +Inf."""
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield bound, cumulative
+
+
+class MetricsRegistry:
+    """Per-endpoint histograms and response counts for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (metric, endpoint) -> Histogram
+        self._responses = {}  # (endpoint, status) -> count
+        self._collectors = []
+
+    def observe(self, endpoint, status, measurements):
+        with self._lock:
+            self._responses[endpoint, status] = self._responses.get((endpoint, status), 0) + 1
+            for metric, value in measurements.items():
+                histogram = self._histograms.get((metric, endpoint))
+                if histogram is None:
+                    histogram = self._histograms[metric, endpoint] = Histogram(metrics_setting(HISTOGRAMS[metric][1]))
+                histogram.observe(value)
+
+    def register_collector(self, collector):
+        """Add a callable returning extra exposition lines, e.g. gauges read at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP api_metrics_sample_rate Share of requests included in the api_* metrics.",
+            "# TYPE api_metrics_sample_rate gauge",
+            f"api_metrics_sample_rate {_number(float(metrics_setting('SAMPLE_RATE')))}",
+            "# HELP api_responses_total Measured responses by endpoint and status code.",
+            "# TYPE api_responses_total counter",
+        ]
+        with self._lock:
+            for (endpoint, status), count in sorted(self._responses.items()):
+                lines.append(f'api_responses_total{{endpoint="{_label(endpoint)}",status="{status}"}} {count}')
+            for metric, (help_text, _) in HISTOGRAMS.items():
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for (name, endpoint), histogram in sorted(self._histograms.items()):
+                    if name != metric:
+                        continue
+                    labels = f'endpoint="{_label(endpoint)}"'
+                    for bound, count in histogram.samples():
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{metric}_sum{{{labels}}} {_number(histogram.sum)}')
+                    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+_measurement = contextvars.ContextVar('request_measurement', default=None)
+
+
+class QueryRecorder:
+    """Database execute wrapper that counts and times every query of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestMeasurement:
+    def __init__(self):
+        self.queries = QueryRecorder()
+        self.render_start = None
+        self.render_duration = 0.0
+        self.serialize_duration = 0.0
+        self._serializing = False
+
+    def rendered(self, response):
+        self.render_duration = time.perf_counter() - self.render_start
+        return response
+
+    @contextmanager
+    def serializing(self):
+        """Add the enclosed time, less its SQL, to the serializer phase; nested serializers count once."""
+        if self._serializing:
+            yield
+            return
+        self._serializing = True
+        start, db_before = time.perf_counter(), self.queries.duration
+        try:
+            yield
+        finally:
+            self._serializing = False
+            self.serialize_duration += time.perf_counter() - start - (self.queries.duration - db_before)
+
+
+def _timed_data(data):
+    def timed(self):
+        measurement = _measurement.get()
+        if measurement is None:
+            return data.fget(self)
+        with measurement.serializing():
+            return data.fget(self)
+    timed.measured = True
+    return property(timed)
+
+
+def instrument_serializers():
+    """Time every DRF serializer's `.data`, where views turn objects into primitives."""
+    for serializer_class in (Serializer, ListSerializer):
+        if not getattr(serializer_class.data.fget, 'measured', False):
+            serializer_class.data = _timed_data(serializer_class.data)
+
+
+class MetricsMiddleware:
+    """Measure a sample of requests; should be the first entry in MIDDLEWARE so it sees everything."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        if not metrics_setting('ENABLED') or random.random() >= metrics_setting('SAMPLE_RATE'):
+            return self.get_response(request)
+
+        measurement = request._metrics = RequestMeasurement()
+        token = _measurement.set(measurement)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(measurement.queries))
+                response = self.get_response(request)
+        finally:
+            _measurement.reset(token)
+        total = time.perf_counter() - start
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        endpoint = resolver_match.view_name if resolver_match else 'unresolved'
+        queries = measurement.queries
+        serialize = max(0.0, measurement.serialize_duration)
+        app = max(0.0, total - queries.duration - serialize - measurement.render_duration)
+        measurements = {
+            'api_request_duration_seconds': total,
+            'api_db_duration_seconds': queries.duration,
+            'api_app_duration_seconds': app,
+            'api_serialize_duration_seconds': serialize,
+            'api_render_duration_seconds': measurement.render_duration,
+            'api_db_queries': queries.count,
+        }
+        if not response.streaming:
+            measurements['api_response_bytes'] = len(response.content)
+        registry.observe(endpoint, response.status_code, measurements)
+
+        if metrics_setting('SERVER_TIMING'):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={queries.duration * 1000:.2f};desc="{queries.count} queries"',
+                f'app;dur={app * 1000:.2f};desc="view"',
+                f'serialize;dur={serialize * 1000:.2f};desc="serializers"',
+                f'render;dur={measurement.render_duration * 1000:.2f}',
+                f'total;dur={total * 1000:.2f}',
+            ])
+        return response
+
+    def process_template_response(self, request, response):
+        """DRF responses are rendered after this hook; time the rendering with a post-render callback."""
+        measurement = getattr(request, '_metrics', None)
+        if measurement is not None:
+            measurement.render_start = time.perf_counter()
+            response.add_post_render_callback(measurement.rendered)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint."""
+    token = metrics_setting('TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -60,6 +60,8 @@ AUTH_USER_MODEL = 'users.CustomUser'
 
 
 MIDDLEWARE = [
+    'config.metrics.MetricsMiddleware',  # First, so it measures everything below it
+    'config.db_router.ReplicaRoutingMiddleware',  # Before anything that reads the database
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,10 +73,33 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'config.urls'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'follow_graph': {
+        # Per-user following-id sets; locmem evicts least recently used entries past MAX_ENTRIES.
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'follow-graph',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+if os.getenv('REDIS_URL'):
+    # One cache for every worker process: response cache versions, user rows, token blacklist, trends, replica pins.
+    # locmem (the fallback) is private to each process. Uses the redis package from requirements.txt.
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication',  # No user SELECT per request (see users/user_cache.py)
     ),
+    'DEFAULT_PAGINATION_CLASS': 'tweets.pagination.KeysetCursorPagination',  # Cursor pages keyed on (created_at, id)
+    'PAGE_SIZE': 20,
 }
 
 
@@ -84,6 +109,7 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),  # Authorization: Bearer <token>
+    'TOKEN_REFRESH_SERIALIZER': 'users.tokens.CachedTokenRefreshSerializer',  # Blacklist checks from the cache
 }
 
 TEMPLATES = [
@@ -103,6 +129,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'  # Needed for the /api/events/ push stream
 
 
 # Database
@@ -119,6 +146,43 @@ DATABASES = {
     }
 }
 
+# Connection reuse (see config/db_connections.py). DB_CONN_MODE is one of:
+#   persistent - each worker thread keeps its connection for DB_CONN_MAX_AGE seconds (WSGI default)
+#   pool       - a psycopg 3 pool per process, shared by its threads (ASGI default)
+#   none       - a new connection per request
+DB_CONN_MODE = os.getenv('DB_CONN_MODE', 'persistent')
+if DB_CONN_MODE == 'pool':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),  # Per process; workers x max_size < max_connections
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),  # Seconds to wait for a free connection
+        },
+    }
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # Required with a pool; connections go back to it after each request
+elif DB_CONN_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True  # Drop broken connections before reusing them
+
+# Read replicas (see config/db_router.py): DB_REPLICA_HOSTS=replica1.internal,replica2.internal
+for number, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},  # Tests read and write the one test database
+    }
+
+DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+
+REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias.startswith('replica_')],
+    'PIN_SECONDS': int(os.getenv('DB_REPLICA_PIN_SECONDS', '5')),  # Keep above the usual replication lag
+    'MAX_LAG': 30,  # Seconds
+    'CACHE_ALIAS': 'default',  # Holds read-your-writes pins; must be shared by every process (set REDIS_URL)
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -160,3 +224,107 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Home timelines (see tweets/timeline.py)
+
+TIMELINE = {
+    'ASYNC': True,  # Fan tweets out from a background thread after the request commits
+    'FANOUT_FOLLOWER_LIMIT': 10000,  # Authors above this are merged into feeds at read time
+    'BACKFILL_SIZE': 200,  # Recent tweets copied into a timeline on follow
+    'BATCH_SIZE': 1000,  # Rows per bulk insert during fan-out
+    'FANOUT_ON_READ_CACHE_TIMEOUT': 60,  # Seconds the set of read-time authors is cached
+}
+
+
+# Comment threads (see tweets/threads.py)
+
+COMMENT_THREADS = {
+    'MAX_DEPTH': 5,  # Levels of nested replies rendered inline
+    'REPLY_LIMIT': 10,  # Replies rendered per comment before a "load more" link
+}
+
+
+# Notification delivery (see tweets/notifications.py)
+
+NOTIFICATIONS = {
+    'ASYNC': True,  # Write notifications from a background worker after commit
+    'BATCH_SIZE': 500,  # Most notifications per bulk insert
+    'FLUSH_INTERVAL': 0.5,  # Seconds the worker waits to fill a batch
+    'AGGREGATION_WINDOW': 6 * 60 * 60,  # Seconds of likes/replies/follows folded into one notification
+    'SENDER_SAMPLE_SIZE': 3,  # Recent senders shown on an aggregated notification
+}
+
+
+# Follow-graph cache (see users/graph_cache.py)
+
+FOLLOW_GRAPH = {
+    'CACHE_ALIAS': 'follow_graph',
+    'TIMEOUT': 300,  # Seconds a cached following set stays valid
+}
+
+
+# Response cache for hot read endpoints (see tweets/response_cache.py).
+# Point CACHE_ALIAS at a shared backend (memcached/Redis) when running several workers.
+
+RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60,  # Seconds a cached response is kept
+}
+
+
+# Tweet search (see tweets/search.py)
+
+SEARCH = {
+    'CONFIG': 'english',  # PostgreSQL text search configuration
+    'FALLBACK_MAX_RESULTS': 1000,  # Matches ranked by the in-process index used on other databases
+}
+
+
+# Users behind JWT access tokens, cached for authentication (see users/user_cache.py)
+
+AUTH_USER_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60,  # Seconds; bounds how long a deactivation done outside save() takes to apply
+}
+
+
+# Refresh token blacklist lookups (see users/tokens.py); prune expired rows with manage.py prune_tokens
+
+TOKEN_BLACKLIST = {
+    'CACHE_ALIAS': 'default',  # Ignored unless shared by every process (see config/caches.py)
+}
+
+
+# Trending hashtags and tweets, counted in memory as they are written (see tweets/trending.py)
+
+TRENDING = {
+    'BUCKET_SECONDS': 300,
+    'WINDOW_BUCKETS': 12,  # One hour of counts
+    'HALF_LIFE': 1800,  # Seconds; shorter favours what is rising right now
+    'TOP_K': 10,
+    'SYNC_SECONDS': 5,  # How often each worker shares its counts through CACHES['default'] and re-merges everyone's
+}
+
+
+# Server-Sent Events push of notifications and timeline tweets (see tweets/push.py)
+
+PUSH = {
+    'ENABLED': True,
+    # Redis pub/sub reaches streams on every process; the in-process broker only those on the publishing one
+    'BROKER': 'tweets.push.RedisBroker' if os.getenv('REDIS_URL') else 'tweets.push.InProcessBroker',
+    'REDIS_URL': os.getenv('REDIS_URL'),
+    'PRESENCE_TTL': 60,  # Seconds a process's listed streams outlive it if it stops without unlisting them
+    'HEARTBEAT': 15,  # Seconds
+}
+
+
+# Request instrumentation: Server-Timing headers and /metrics/ (see config/metrics.py)
+
+METRICS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': float(os.getenv('METRICS_SAMPLE_RATE', '1.0')),  # Lower it on busy production hosts
+    'SERVER_TIMING': True,
+    'TOKEN': os.getenv('METRICS_TOKEN'),  # Bearer token for scrapers; unset means /metrics/ is DEBUG-only
+}
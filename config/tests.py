@@ -0,0 +1,247 @@
+import os
+import runpy
+import tempfile
+import time
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.checks import run_checks
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tweets.models import Tweet
+from tweets.serializers import TweetSerializer
+
+from . import db_connections, db_router
+
+User = get_user_model()
+
+HAS_REPLICA = 'replica_1' in settings.DATABASES
+
+
+def pin_caches(location):
+    """The project's caches plus a file-based one, which every process on the machine shares."""
+    return {**settings.CACHES,
+            'pins': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+
+
+class ReplicaCheckTests(SimpleTestCase):
+
+    def errors(self):
+        return [message.id for message in run_checks(tags=['caches'])]
+
+    @override_settings(REPLICAS={'ALIASES': ['replica_1'], 'CACHE_ALIAS': 'default'},
+                       CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_pins_in_a_per_process_cache_fail(self):
+        self.assertIn('replicas.E001', self.errors())
+
+    def test_pins_in_a_shared_cache_pass(self):
+        with tempfile.TemporaryDirectory() as location, \
+                self.settings(REPLICAS={'ALIASES': ['replica_1'], 'CACHE_ALIAS': 'pins'}, CACHES=pin_caches(location)):
+            self.assertNotIn('replicas.E001', self.errors())
+
+    @override_settings(REPLICAS={'ALIASES': []})
+    def test_no_replicas_need_no_shared_cache(self):
+        self.assertNotIn('replicas.E001', self.errors())
+
+
+@skipUnless(HAS_REPLICA, "needs a replica alias, e.g. DB_REPLICA_HOSTS=localhost")
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """Two aliases on one test database: reads that reach `replica_1` show up in its query log."""
+    databases = {'default', 'replica_1'} if HAS_REPLICA else {'default'}  # The runner reads it even when skipped
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        location = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(
+            CACHES=pin_caches(location),
+            REPLICAS={**settings.REPLICAS, 'ALIASES': ['replica_1'], 'CACHE_ALIAS': 'pins'},
+        ))
+
+    def setUp(self):
+        db_router.health.__init__()
+        user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def get_tweets(self):
+        with CaptureQueriesContext(connections['replica_1']) as replica:
+            response = self.client.get(reverse('tweet-list'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(replica)
+
+    def test_reads_go_to_the_replica(self):
+        self.assertGreater(self.get_tweets()[1], 0)
+
+    def test_writer_reads_the_primary_without_the_cookie(self):
+        self.assertEqual(self.client.post(reverse('tweet-list'), {'content': "Hello"}).status_code, 201)
+        self.client.cookies.clear()  # API clients, and other workers, only have the token
+
+        response, replica_queries = self.get_tweets()
+        self.assertEqual(replica_queries, 0)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_unhealthy_replica_is_skipped(self):
+        with mock.patch.object(db_router.ReplicaHealth, '_check', return_value=False):
+            self.assertEqual(self.get_tweets()[1], 0)
+
+
+class FakeReplicaConnection:
+    """A PostgreSQL replica connection whose lag query returns `row`."""
+    vendor = 'postgresql'
+
+    def __init__(self, row):
+        self.row = row
+
+    def cursor(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchone.return_value = self.row
+        return cursor
+
+
+@override_settings(REPLICAS={'ALIASES': ['replica_1'], 'MAX_LAG': 30})
+class ReplicaLagTests(SimpleTestCase):
+
+    def check(self, row):
+        with mock.patch.object(db_router, 'connections', {'replica_1': FakeReplicaConnection(row)}):
+            return db_router.ReplicaHealth()._check('replica_1')
+
+    def test_caught_up_replica_of_an_idle_primary_is_healthy(self):
+        self.assertTrue(self.check((True, 3600.0)))
+
+    def test_replica_behind_on_received_wal_is_skipped(self):
+        with self.assertLogs('config.db_router', 'WARNING'):
+            self.assertFalse(self.check((False, 45.0)))
+
+    def test_replica_replaying_received_wal_within_the_limit_is_healthy(self):
+        self.assertTrue(self.check((False, 5.0)))
+
+    def test_replica_that_has_not_replayed_anything_is_healthy(self):
+        self.assertTrue(self.check((None, None)))
+
+
+def settings_with(**environ):
+    """config/settings.py evaluated with these environment variables (and no DB_CONN_MODE unless given)."""
+    with mock.patch.dict(os.environ, environ):
+        if 'DB_CONN_MODE' not in environ:
+            os.environ.pop('DB_CONN_MODE', None)
+        return runpy.run_path(os.path.join(os.path.dirname(__file__), 'settings.py'))
+
+
+class ConnectionModeTests(SimpleTestCase):
+
+    def test_persistent_by_default(self):
+        database = settings_with()['DATABASES']['default']
+        self.assertEqual(database['CONN_MAX_AGE'], 60)
+        self.assertNotIn('pool', database.get('OPTIONS', {}))
+
+    def test_pool(self):
+        database = settings_with(DB_CONN_MODE='pool', DB_POOL_MAX_SIZE='4')['DATABASES']['default']
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['OPTIONS']['pool'], {'min_size': 2, 'max_size': 4, 'timeout': 10.0})
+
+    def test_none(self):
+        database = settings_with(DB_CONN_MODE='none')['DATABASES']['default']
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertNotIn('OPTIONS', database)
+
+    def test_asgi_defaults_to_the_pool(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('DB_CONN_MODE', None)
+            runpy.run_module('config.asgi')
+            self.assertEqual(os.environ['DB_CONN_MODE'], 'pool')
+
+    def test_asgi_keeps_an_explicit_mode(self):
+        with mock.patch.dict(os.environ, DB_CONN_MODE='persistent'):
+            runpy.run_module('config.asgi')
+            self.assertEqual(os.environ['DB_CONN_MODE'], 'persistent')
+
+
+class FakePool:
+
+    def get_stats(self):
+        return {'pool_size': 4, 'pool_available': 3, 'pool_max': 10, 'requests_num': 20, 'requests_queued': 2,
+                'requests_wait_ms': 1500, 'connections_num': 4}
+
+
+class ConnectionMetricsTests(SimpleTestCase):
+
+    def test_opened_connections_are_counted(self):
+        tracker = db_connections.ConnectionTracker()
+        tracker.connection_created(sender=None, connection=connections['default'])
+        self.assertIn('db_connections_opened_total{alias="default"} 1', tracker.collect())
+
+    def test_pool_statistics(self):
+        tracker = db_connections.ConnectionTracker()
+        pools = {'default': FakePool()}
+        with mock.patch.object(db_connections, '_existing_pool', lambda wrapper: pools.get(wrapper.alias)):
+            lines = tracker.collect()
+        self.assertIn('db_pool_size{alias="default"} 4', lines)
+        self.assertIn('db_pool_requests_queued_total{alias="default"} 2', lines)
+        self.assertIn('db_pool_wait_seconds_total{alias="default"} 1.5', lines)
+        self.assertIn('db_pool_timeouts_total{alias="default"} 0', lines)
+        self.assertIn('# TYPE db_pool_available gauge', lines)
+
+    def test_no_pool_statistics_without_a_pool(self):
+        lines = db_connections.ConnectionTracker().collect()
+        self.assertFalse(any(line.startswith('db_pool_') for line in lines))
+
+
+def server_timing(response):
+    """Server-Timing phases as {name: milliseconds}."""
+    phases = {}
+    for phase in response['Server-Timing'].split(', '):
+        name, *params = phase.split(';')
+        phases[name] = float(dict(param.split('=', 1) for param in params)['dur'])
+    return phases
+
+
+@override_settings(METRICS={'ENABLED': True, 'SAMPLE_RATE': 1.0, 'SERVER_TIMING': True, 'TOKEN': 'scraper'},
+                   RESPONSE_CACHE={'ENABLED': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class MetricsMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        Tweet.objects.create(user=cls.user, content="Hello")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_serializers_are_their_own_phase(self):
+        to_representation = TweetSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.05)
+            return to_representation(serializer, instance)
+
+        with mock.patch.object(TweetSerializer, 'to_representation', autospec=True, side_effect=slow):
+            response = self.client.get(reverse('tweet-list'))
+        self.assertEqual(response.status_code, 200)
+        phases = server_timing(response)
+        self.assertEqual(set(phases), {'db', 'app', 'serialize', 'render', 'total'})
+        self.assertGreaterEqual(phases['serialize'], 50)
+        self.assertLess(phases['app'], 50)
+        self.assertLessEqual(phases['db'] + phases['app'] + phases['serialize'] + phases['render'],
+                             phases['total'] + 0.1)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('tweet-list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scraper')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE api_serialize_duration_seconds histogram', body)
+        self.assertIn('api_serialize_duration_seconds_count{endpoint="tweet-list"}', body)
+        self.assertIn('api_db_queries_count{endpoint="tweet-list"}', body)
+        self.assertIn('api_responses_total{endpoint="tweet-list",status="200"}', body)
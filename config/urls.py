@@ -17,9 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from config.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/users/", include("users.urls")),  # This should be present
     path('api/', include('tweets.urls')),
+    path('metrics/', metrics_view, name='metrics'),  # Prometheus scrape endpoint
 ]
 
@@ -0,0 +1,95 @@
+"""
+Background work queues.
+
+A ``BackgroundQueue`` takes items from requests once their transaction
+commits and hands them in batches to a daemon thread, so slow writes
+(notification inserts, timeline fan-out) stay off the request path. Queues
+live in the process that filled them and are drained at exit; subclasses
+choose the batch size and whether to run inline instead (tests, management
+commands).
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundQueue:
+    """Queue plus a lazily started daemon worker that passes queued items to `handle()` in batches."""
+    thread_name = 'background-queue'
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def is_async(self):
+        return True
+
+    def batch_size(self):
+        return 1
+
+    def flush_interval(self):
+        """Seconds the worker waits to fill a batch."""
+        return 0
+
+    def handle(self, batch):
+        raise NotImplementedError
+
+    def put(self, item):
+        if not self.is_async():
+            self.handle([item])
+            return
+        # Only hand over work once the triggering write is actually committed.
+        transaction.on_commit(lambda: self._enqueue(item))
+
+    def _enqueue(self, item):
+        self._ensure_worker()
+        self.queue.put(item)
+
+    def _ensure_worker(self):
+        with self._lock:
+            # A forked worker process inherits the queue but not the thread.
+            if self._worker is None or not self._worker.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._worker.start()
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval()
+        batch_size = self.batch_size()
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                close_old_connections()
+                self.handle(batch)
+            except Exception:
+                logger.exception("%s failed on %d item(s)", self.thread_name, len(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def flush(self):
+        """Block until every queued item has been handled."""
+        if self._worker is not None and self._worker.is_alive():
+            self.queue.join()
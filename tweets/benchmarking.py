@@ -0,0 +1,133 @@
+"""
+API benchmark harness.
+
+Requests go through the real URLconf, authentication, views and serializers
+via the DRF test client, pointed at the busiest rows in the database (the
+largest feed, the most commented tweet, the most followed user). For each GET
+endpoint it reports latency percentiles, queries per request and rows
+returned, in a JSON-friendly dict so runs can be compared across commits.
+"""
+import math
+import time
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.test import APIClient
+
+from tweets import urls as tweet_urls
+from users import urls as user_urls
+
+from .models import Tweet, Comment, Hashtag
+
+BenchmarkTarget = namedtuple('BenchmarkTarget', ['name', 'url', 'viewer'])
+
+QUERY_STRINGS = {'tweet-search': 'q=django'}  # Endpoints that need parameters to do any work
+
+
+def benchmark_targets():
+    """One target per GET endpoint of the API, skipping admin-only ones and those with nothing to point at."""
+    User = get_user_model()
+    reader = User.objects.order_by('-following_count', 'id').first()  # Largest home feed
+    celebrity = User.objects.order_by('-followers_count', 'id').first()  # Most notifications and followers
+    busiest_comment = (
+        Comment.objects.filter(parent__isnull=False).values('parent')
+        .annotate(replies=Count('id')).order_by('-replies', 'parent').first()
+    )
+    samples = {
+        Tweet: Tweet.objects.order_by('-comments_count', 'id').values_list('id', flat=True).first(),
+        Comment: busiest_comment['parent'] if busiest_comment else None,
+        User: celebrity.pk if celebrity else None,
+        Hashtag: Hashtag.objects.annotate(tweets=Count('tweet_hashtags')).order_by('-tweets', 'id')
+        .values_list('name', flat=True).first(),
+    }
+    if reader is None:
+        return []
+
+    targets = []
+    for pattern in tweet_urls.urlpatterns + user_urls.urlpatterns:
+        view_class = getattr(pattern.callback, 'view_class', None)  # None for the endless event stream
+        if view_class is None or not hasattr(view_class, 'get') or IsAdminUser in view_class.permission_classes:
+            continue
+        kwargs = {}
+        for name in pattern.pattern.converters:
+            if name == 'tweet_id':
+                model = Tweet
+            elif name == 'user_id':
+                model = User
+            elif name == 'name':
+                model = Hashtag
+            else:
+                model = view_class.serializer_class.Meta.model
+            kwargs[name] = samples.get(model)
+        if None in kwargs.values():
+            continue
+        viewer = celebrity if 'notification' in pattern.name else reader
+        url = reverse(pattern.name, kwargs=kwargs)
+        if pattern.name in QUERY_STRINGS:
+            url = f'{url}?{QUERY_STRINGS[pattern.name]}'
+        targets.append(BenchmarkTarget(pattern.name, url, viewer))
+    return targets
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _rows(response):
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict) and 'results' in data:
+        return len(data['results'])
+    if isinstance(data, list):
+        return len(data)
+    return 1 if data else 0
+
+
+def benchmark_endpoint(target, iterations=50, warmup=5):
+    """Time `iterations` GETs of one target after `warmup` untimed ones."""
+    client = APIClient()
+    client.force_authenticate(target.viewer)
+    for _ in range(warmup):
+        client.get(target.url)
+
+    timings, queries = [], []
+    response = None
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = client.get(target.url)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(context.captured_queries))
+
+    return {
+        'url': target.url,
+        'status': response.status_code,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': max(queries),
+        'rows': _rows(response),
+        'bytes': len(response.content),
+    }
+
+
+def compare_results(baseline, current):
+    """Per-endpoint change in p95 latency (percent) and queries between two benchmark runs."""
+    changes = {}
+    for name, result in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if before is None:
+            continue
+        changes[name] = {
+            'p95_change_pct': round((result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100, 1)
+            if before['p95_ms'] else None,
+            'queries_change': result['queries'] - before['queries'],
+        }
+    return changes
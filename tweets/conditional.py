@@ -0,0 +1,70 @@
+"""
+Conditional GET for polling clients.
+
+Views derive an ETag from a cheap query over the rows their response depends
+on: ``updated_at`` plus the denormalized like/comment counters, which change
+without touching ``updated_at``. A request whose ``If-None-Match`` still
+matches gets ``304 Not Modified`` before the response is built or serialized.
+
+Views that name the response-cache namespaces their response depends on
+(``get_etag_namespaces()``) skip that query while the cache is shared by every
+process: the namespace versions, bumped by every write, make the ETag. With a
+per-process cache a version bumped on another worker would go unseen, so the
+query is used instead. Views that also use ``CachedResponseMixin`` list it
+first; a cache hit then answers with the ETag stored alongside the payload.
+
+No ``Last-Modified`` header is sent, since ``updated_at`` alone would miss
+counter changes and ``If-Modified-Since`` would then answer 304 wrongly.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from config.caches import is_shared
+
+from .response_cache import namespace_versions, response_cache_setting
+
+
+def make_etag(*parts):
+    """A strong ETag for the given values."""
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return quote_etag(digest)
+
+
+class ConditionalGetMixin:
+    """
+    Answer GET with 304 Not Modified while the client's ETag is current.
+
+    Views implement `get_etag_parts()`, returning the values their response
+    depends on, or None to skip the check (e.g. for a missing object), and may
+    implement `get_etag_namespaces()` to derive the ETag from the cache instead.
+    """
+
+    def get_etag_parts(self):
+        raise NotImplementedError
+
+    def get_etag_namespaces(self):
+        return None
+
+    def get_validators(self):
+        namespaces = self.get_etag_namespaces()
+        if namespaces and is_shared(response_cache_setting('CACHE_ALIAS')):
+            return namespace_versions(namespaces)
+        return self.get_etag_parts()
+
+    def get(self, request, *args, **kwargs):
+        parts = self.get_validators()
+        if parts is None:
+            return super().get(request, *args, **kwargs)
+
+        etag = make_etag(request.query_params.urlencode(), parts)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+        return response
@@ -0,0 +1,37 @@
+"""
+Denormalized engagement counters on ``Tweet``.
+
+Counters are adjusted atomically next to the write that changes them (see
+``tweets.likes`` for likes), so concurrent writes never lose an increment.
+Anything that bypasses these helpers (cascading user deletes, admin edits,
+raw SQL) can make them drift; ``manage.py reconcile_tweet_counters``
+rebuilds them.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Tweet, Like, Comment
+
+
+def adjust_comments_count(tweet_id, delta):
+    """Add `delta` (may be negative) to a tweet's comment counter."""
+    Tweet.objects.filter(id=tweet_id).update(comments_count=Greatest(F('comments_count') + delta, Value(0)))
+
+
+def _count_subquery(model):
+    counts = (
+        model.objects.filter(tweet=OuterRef('pk'))
+        .order_by()
+        .values('tweet')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def reconcile_counters(start_id, end_id):
+    """Recompute both counters for tweets with start_id <= id < end_id in one UPDATE."""
+    return Tweet.objects.filter(id__gte=start_id, id__lt=end_id).update(
+        likes_count=_count_subquery(Like),
+        comments_count=_count_subquery(Comment),
+    )
@@ -0,0 +1,120 @@
+"""
+Automatic select_related/prefetch_related planning from serializer fields.
+
+``plan_eager_loading`` walks a serializer's declared fields, follows
+``source=`` dotted paths and nested serializers through the model graph, and
+works out which relations will be touched during serialization. Forward
+foreign keys and one-to-ones are joined with ``select_related``; anything
+to-many is batched with ``prefetch_related``.
+
+Relations only reached from a ``SerializerMethodField`` cannot be discovered
+this way; list them on the serializer's ``Meta.select_related`` or
+``Meta.prefetch_related``.
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+
+
+class EagerLoadingPlan:
+    """The relation paths a serializer needs, split by how to load them."""
+
+    def __init__(self):
+        self.select_related = set()
+        self.prefetch_related = set()
+
+    def add(self, path, to_many):
+        if to_many:
+            self.prefetch_related.add(path)
+        else:
+            self.select_related.add(path)
+
+    def apply(self, queryset):
+        # A prefetched path already covers the select_related paths nested under it.
+        select = sorted(
+            path for path in self.select_related
+            if not any(path.startswith(f'{prefetch}__') for prefetch in self.prefetch_related)
+        )
+        if select:
+            queryset = queryset.select_related(*select)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch_related))
+        return queryset
+
+
+def _resolve_relation_path(model, attrs, prefix, through_many):
+    """
+    Follow attribute names across relations starting at `model`.
+
+    Returns (relation path, is_to_many, target model); the path is empty if the
+    first attribute is not a relation.
+    """
+    path = []
+    for attr in attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation or field.related_model is None:
+            break
+        through_many = through_many or field.one_to_many or field.many_to_many
+        path.append(attr)
+        model = field.related_model
+    full_path = '__'.join(filter(None, [prefix, *path]))
+    return (full_path if path else ''), through_many, model
+
+
+def _plan_serializer(serializer, model, plan, prefix='', through_many=False):
+    meta = getattr(serializer, 'Meta', None)
+    for hint in getattr(meta, 'select_related', ()):
+        plan.add('__'.join(filter(None, [prefix, hint])), through_many)
+    for hint in getattr(meta, 'prefetch_related', ()):
+        plan.add('__'.join(filter(None, [prefix, hint])), True)
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+
+        path, to_many, target = _resolve_relation_path(model, field.source_attrs, prefix, through_many)
+        if not path:
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            plan.add(path, True)
+            _plan_serializer(field.child, target, plan, path, True)
+        elif isinstance(field, serializers.BaseSerializer):
+            plan.add(path, to_many)
+            _plan_serializer(field, target, plan, path, to_many)
+        elif isinstance(field, ManyRelatedField):
+            plan.add(path, True)
+        elif isinstance(field, PrimaryKeyRelatedField) and len(field.source_attrs) == 1:
+            continue  # Reads the local <name>_id column, no query
+        else:
+            plan.add(path, to_many)  # Related field or dotted source such as 'user.username'
+    return plan
+
+
+@lru_cache(maxsize=None)
+def plan_eager_loading(serializer_class, model):
+    """Build (and memoize) the eager loading plan for a serializer over a model."""
+    return _plan_serializer(serializer_class(), model, EagerLoadingPlan())
+
+
+def eager_load(queryset, serializer_class):
+    """Apply the serializer's eager loading plan to a queryset."""
+    return plan_eager_loading(serializer_class, queryset.model).apply(queryset)
+
+
+class EagerLoadingMixin:
+    """
+    Generic view mixin that preloads every relation the serializer touches.
+
+    Hooks `filter_queryset` so it also applies when the view overrides
+    `get_queryset`, and to both list and detail lookups.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return eager_load(queryset, self.get_serializer_class())
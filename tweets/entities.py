@@ -0,0 +1,78 @@
+"""
+Hashtag and @mention extraction.
+
+When a tweet is created or edited its content is parsed once and the results
+are stored in the ``Hashtag``/``TweetHashtag``/``Mention`` tables, so topic
+pages and "mentions" lists are indexed range scans instead of regex scans
+over every tweet. ``index_entities`` works on batches of tweets with a fixed
+number of queries per batch; ``manage.py backfill_entities`` runs it over
+existing tweets.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+
+from .models import Hashtag, TweetHashtag, Mention
+from .notifications import notify
+
+HASHTAG_RE = re.compile(r'(?<![\w#])#(\w{1,100})')
+MENTION_RE = re.compile(r'(?<![\w@])@(\w{1,150})')
+
+
+def extract_hashtags(text):
+    """Lowercased hashtags in order of first appearance, e.g. "#Django #django" -> ['django']."""
+    return list(dict.fromkeys(tag.lower() for tag in HASHTAG_RE.findall(text)))
+
+
+def extract_mentions(text):
+    """Mentioned usernames in order of first appearance."""
+    return list(dict.fromkeys(MENTION_RE.findall(text)))
+
+
+def index_entities(tweets):
+    """
+    Replace the stored hashtags and mentions of these tweets with what their content contains now.
+
+    Returns {tweet id: set of user ids mentioned for the first time}, for notifications.
+    """
+    tweets = list(tweets)
+    if not tweets:
+        return {}
+    tweet_ids = [tweet.pk for tweet in tweets]
+    hashtags = {tweet.pk: extract_hashtags(tweet.content) for tweet in tweets}
+    mentions = {tweet.pk: extract_mentions(tweet.content) for tweet in tweets}
+
+    names = {name for names in hashtags.values() for name in names}
+    if names:
+        Hashtag.objects.bulk_create([Hashtag(name=name) for name in names], ignore_conflicts=True)
+    hashtag_ids = dict(Hashtag.objects.filter(name__in=names).values_list('name', 'id'))
+
+    usernames = {username for usernames in mentions.values() for username in usernames}
+    user_ids = dict(get_user_model().objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    previously_mentioned = {}
+    for tweet_id, user_id in Mention.objects.filter(tweet_id__in=tweet_ids).values_list('tweet_id', 'user_id'):
+        previously_mentioned.setdefault(tweet_id, set()).add(user_id)
+
+    TweetHashtag.objects.filter(tweet_id__in=tweet_ids).delete()
+    Mention.objects.filter(tweet_id__in=tweet_ids).delete()
+    TweetHashtag.objects.bulk_create([
+        TweetHashtag(tweet_id=tweet.pk, hashtag_id=hashtag_ids[name], created_at=tweet.created_at)
+        for tweet in tweets for name in hashtags[tweet.pk]
+    ])
+
+    new_mentions = {}
+    links = []
+    for tweet in tweets:
+        mentioned = {user_ids[username] for username in mentions[tweet.pk] if username in user_ids}
+        links.extend(Mention(tweet_id=tweet.pk, user_id=user_id, created_at=tweet.created_at) for user_id in mentioned)
+        new_mentions[tweet.pk] = mentioned - previously_mentioned.get(tweet.pk, set()) - {tweet.user_id}
+    Mention.objects.bulk_create(links)
+    return new_mentions
+
+
+def process_tweet_entities(tweet):
+    """Index a new or edited tweet's hashtags and mentions, notifying users mentioned for the first time."""
+    User = get_user_model()
+    for user_id in index_entities([tweet])[tweet.pk]:
+        notify(user=User(pk=user_id), sender=tweet.user, notification_type='mention', tweet=tweet)
@@ -0,0 +1,76 @@
+"""
+Idempotent like/unlike operations.
+
+Each operation is one conditional write that reports whether it changed
+anything, followed (only when it did) by the counter update:
+
+* like:   ``INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING id``
+* unlike: ``DELETE ... RETURNING id``
+
+Concurrent double-taps therefore can't race on the (user, tweet) unique
+constraint, and a retried request is a no-op. Requires a database with
+``ON CONFLICT`` and ``RETURNING`` support (PostgreSQL, SQLite 3.35+).
+"""
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Tweet, Like
+from .notifications import notify
+from .response_cache import invalidate, tweet_namespaces
+from .trending import record_like
+
+LikeResult = namedtuple('LikeResult', ['changed', 'tweet_exists'])
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return quote(Like._meta.db_table), quote(Tweet._meta.db_table)
+
+
+def like_tweet(user, tweet_id):
+    """Like a tweet; liking an already liked tweet changes nothing."""
+    like_table, tweet_table = _tables()
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {like_table} (user_id, tweet_id, created_at) "
+            f"SELECT %s, id, %s FROM {tweet_table} WHERE id = %s "
+            f"ON CONFLICT DO NOTHING RETURNING id",
+            [user.pk, created_at, tweet_id],
+        )
+        if cursor.fetchone() is None:
+            return LikeResult(changed=False, tweet_exists=Tweet.objects.filter(id=tweet_id).exists())
+
+        cursor.execute(
+            f"UPDATE {tweet_table} SET likes_count = likes_count + 1 WHERE id = %s RETURNING user_id",
+            [tweet_id],
+        )
+        owner_id = cursor.fetchone()[0]
+        invalidate(*tweet_namespaces(tweet_id))
+
+    notify(user=get_user_model()(pk=owner_id), sender=user, notification_type='like', tweet=Tweet(pk=tweet_id))
+    record_like(tweet_id)
+    return LikeResult(changed=True, tweet_exists=True)
+
+
+def unlike_tweet(user, tweet_id):
+    """Remove a like; unliking a tweet that isn't liked changes nothing."""
+    like_table, tweet_table = _tables()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {like_table} WHERE user_id = %s AND tweet_id = %s RETURNING id",
+            [user.pk, tweet_id],
+        )
+        if cursor.fetchone() is None:
+            return LikeResult(changed=False, tweet_exists=Tweet.objects.filter(id=tweet_id).exists())
+
+        cursor.execute(
+            f"UPDATE {tweet_table} SET likes_count = CASE WHEN likes_count > 0 THEN likes_count - 1 ELSE 0 END "
+            f"WHERE id = %s",
+            [tweet_id],
+        )
+        invalidate(*tweet_namespaces(tweet_id))
+    return LikeResult(changed=True, tweet_exists=True)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tweets.entities import index_entities
+from tweets.models import Tweet
+
+
+class Command(BaseCommand):
+    help = "Extract hashtags and @mentions from existing tweets into the hashtag and mention tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Number of tweets indexed per transaction.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        tweets = Tweet.objects.only('id', 'user_id', 'content', 'created_at').order_by('id')
+        batch, indexed = [], 0
+        for tweet in tweets.iterator(chunk_size=batch_size):
+            batch.append(tweet)
+            if len(batch) == batch_size:
+                indexed += self._index(batch)
+                batch = []
+        indexed += self._index(batch)
+        self.stdout.write(self.style.SUCCESS(f"Indexed hashtags and mentions of {indexed} tweet(s)."))
+
+    def _index(self, batch):
+        """Old tweets are indexed silently: nobody is notified about mentions they already saw."""
+        with transaction.atomic():
+            index_entities(batch)
+        return len(batch)
@@ -0,0 +1,84 @@
+import json
+import platform
+import subprocess
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from tweets.benchmarking import benchmark_endpoint, benchmark_targets, compare_results
+from tweets.seeding import SEED_DEFAULTS, seed_social_graph
+
+
+class Command(BaseCommand):
+    help = ("Benchmark every GET endpoint through the DRF test client and report p50/p95/p99 latency, "
+            "queries per request and rows returned.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help="Timed requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=5, help="Untimed requests per endpoint first.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="Print the change against a previous JSON results file.")
+        parser.add_argument('--seed-data', action='store_true',
+                            help="Benchmark against a freshly seeded graph that is rolled back afterwards.")
+        parser.add_argument('--users', type=int, default=SEED_DEFAULTS['users'])
+        parser.add_argument('--tweets', type=int, default=SEED_DEFAULTS['tweets'])
+        parser.add_argument('--no-response-cache', action='store_true',
+                            help="Disable the response cache to measure the uncached path.")
+
+    def handle(self, *args, **options):
+        overrides = {'NOTIFICATIONS': {'ASYNC': False}}
+        if options['no_response_cache']:
+            overrides['RESPONSE_CACHE'] = {'ENABLED': False}
+
+        setup_test_environment()  # Lets the test client reach the views
+        try:
+            with override_settings(**overrides), transaction.atomic():
+                if options['seed_data']:
+                    seed_social_graph(log=self.stdout.write, users=options['users'], tweets=options['tweets'])
+                endpoints = {}
+                for target in benchmark_targets():
+                    endpoints[target.name] = benchmark_endpoint(target, options['iterations'], options['warmup'])
+                    self.report(target.name, endpoints[target.name])
+                transaction.set_rollback(True)  # GETs shouldn't write, but never leave seeded data behind
+        finally:
+            teardown_test_environment()
+
+        results = {'meta': self.metadata(options), 'endpoints': endpoints}
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                changes = compare_results(json.load(baseline), results)
+            for name, change in changes.items():
+                style = self.style.ERROR if (change['p95_change_pct'] or 0) > 10 or change['queries_change'] > 0 \
+                    else self.style.SUCCESS
+                self.stdout.write(style(f"{name:32} p95 {change['p95_change_pct']:+}%  "
+                                        f"queries {change['queries_change']:+}"))
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:32} {result['status']}  p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"p99 {result['p99_ms']:8.2f} ms  {result['queries']:3} queries  {result['rows']:4} rows"
+        )
+
+    def metadata(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                    check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'commit': commit,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'seeded': options['seed_data'],
+            'response_cache': not options['no_response_cache'],
+        }
@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, \
+    teardown_test_environment
+from rest_framework.test import APIClient
+
+from tweets.benchmarking import benchmark_targets
+from tweets.models import Tweet, Comment, Notification, TimelineEntry, TweetHashtag, Mention
+from tweets.seeding import SEED_DEFAULTS, seed_social_graph
+
+INDEXED_MODELS = (Tweet, Comment, Notification, TimelineEntry, TweetHashtag, Mention)
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway dataset and print the query plans behind every GET endpoint of the API, "
+            "with and without the composite/partial indexes. Runs in a scratch test database (like `manage.py "
+            "test`) that is destroyed afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=SEED_DEFAULTS['users'])
+        parser.add_argument('--tweets', type=int, default=SEED_DEFAULTS['tweets'])
+        parser.add_argument('--seed', type=int, default=SEED_DEFAULTS['seed'])
+        parser.add_argument('--analyze', action='store_true',
+                            help="Run EXPLAIN ANALYZE (PostgreSQL only) to include actual timings.")
+        parser.add_argument('--force', action='store_true',
+                            help="Use the configured database instead of a scratch one. The seed data and dropped "
+                                 "indexes are rolled back, but the drops lock the tables until then: never on a "
+                                 "live database.")
+
+    def handle(self, *args, **options):
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        configured_name = None
+        if not options['force']:
+            configured_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        setup_test_environment()  # Lets the test client reach the views
+        try:
+            with override_settings(RESPONSE_CACHE={'ENABLED': False}), transaction.atomic():
+                seed_social_graph(log=self.stdout.write, users=options['users'], tweets=options['tweets'],
+                                  seed=options['seed'])
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+                captured = [(target.url, self.capture(target.url, target.viewer)) for target in benchmark_targets()]
+                with_indexes = [[self.explain(sql, 'with indexes', explain_options) for sql in queries]
+                                for _, queries in captured]
+                self.drop_indexes()
+                without_indexes = [[self.explain(sql, 'without indexes', explain_options) for sql in queries]
+                                   for _, queries in captured]
+                transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+            if configured_name is not None:
+                connection.creation.destroy_test_db(configured_name, verbosity=0)
+
+        for (url, queries), after, before in zip(captured, with_indexes, without_indexes):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"GET {url} ({len(queries)} queries)"))
+            for sql, plan_after, plan_before in zip(queries, after, before):
+                self.stdout.write(f"\n  {sql}")
+                self.stdout.write(self.style.SUCCESS("  -- with indexes"))
+                self.stdout.write(plan_after)
+                self.stdout.write(self.style.WARNING("  -- without indexes"))
+                self.stdout.write(plan_before)
+            self.stdout.write("")
+
+    def capture(self, url, viewer):
+        client = APIClient()
+        client.force_authenticate(viewer)
+        with CaptureQueriesContext(connection) as context:
+            client.get(url)
+        return [query['sql'] for query in context.captured_queries if query['sql'].lstrip().upper().startswith('SELECT')]
+
+    def explain(self, sql, label, options):
+        # The label also keeps SQLite from reusing a statement prepared before the indexes were dropped.
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix(**options)} /* {label} */ {sql}")
+            rows = cursor.fetchall()
+        return '\n'.join(f"    {row[-1]}" for row in rows)
+
+    def drop_indexes(self):
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute(f"DROP INDEX IF EXISTS {quote(index.name)}")  # PostgreSQL-only ones may be absent
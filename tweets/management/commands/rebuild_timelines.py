@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from tweets.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized home timelines from the current follow graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help="Only rebuild the timeline of this user id (repeatable).")
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('id')
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+
+        rebuilt = 0
+        for user in users.iterator():
+            rebuild_timeline(user)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} timeline(s)."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from tweets.counters import reconcile_counters
+from tweets.models import Tweet
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized likes_count/comments_count columns on tweets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of tweet ids recomputed per UPDATE statement.")
+
+    def handle(self, *args, **options):
+        bounds = Tweet.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            self.stdout.write("No tweets to reconcile.")
+            return
+
+        batch_size = options['batch_size']
+        updated = 0
+        for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+            updated += reconcile_counters(start, start + batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled counters on {updated} tweet(s)."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tweets.seeding import SEED_DEFAULTS, seed_social_graph
+
+
+class Command(BaseCommand):
+    help = ("Seed a synthetic social graph: users with power-law follower counts, tweets, timelines, "
+            "likes, comment trees and notifications.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=SEED_DEFAULTS['users'])
+        parser.add_argument('--tweets', type=int, default=SEED_DEFAULTS['tweets'])
+        parser.add_argument('--follows-per-user', type=int, default=SEED_DEFAULTS['follows_per_user'],
+                            help="Mean number of accounts each user follows.")
+        parser.add_argument('--likes-per-tweet', type=int, default=SEED_DEFAULTS['likes_per_tweet'],
+                            help="Mean number of likes per tweet.")
+        parser.add_argument('--comments-per-tweet', type=int, default=SEED_DEFAULTS['comments_per_tweet'],
+                            help="Mean number of comments (including replies) per tweet.")
+        parser.add_argument('--reply-ratio', type=float, default=SEED_DEFAULTS['reply_ratio'],
+                            help="Share of comments that reply to an earlier comment.")
+        parser.add_argument('--popularity-exponent', type=float, default=SEED_DEFAULTS['popularity_exponent'],
+                            help="Zipf exponent of the follower distribution; higher is more skewed.")
+        parser.add_argument('--mention-ratio', type=float, default=SEED_DEFAULTS['mention_ratio'],
+                            help="Share of tweets that @mention another account.")
+        parser.add_argument('--days', type=int, default=SEED_DEFAULTS['days'],
+                            help="Spread tweets over this many days.")
+        parser.add_argument('--seed', type=int, default=SEED_DEFAULTS['seed'], help="Random seed.")
+        parser.add_argument('--batch-size', type=int, default=SEED_DEFAULTS['batch_size'],
+                            help="Rows per bulk insert.")
+
+    def handle(self, *args, **options):
+        seed_options = {name: options[name] for name in SEED_DEFAULTS}
+        with transaction.atomic():
+            created = seed_social_graph(log=self.stdout.write, **seed_options)
+        summary = ', '.join(f"{count} {kind.replace('_', ' ')}" for kind, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary}."))
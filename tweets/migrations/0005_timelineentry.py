@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0004_notification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('tweet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='tweets.tweet')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at', '-tweet'], name='timeline_user_recent_idx'), models.Index(fields=['user', 'author'], name='timeline_user_author_idx')],
+                'unique_together': {('user', 'tweet')},
+            },
+        ),
+    ]
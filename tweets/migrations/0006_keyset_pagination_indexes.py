@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+from tweets.operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run inside a transaction
+
+    dependencies = [
+        ('tweets', '0005_timelineentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='comment',
+            index=models.Index(fields=['tweet', 'parent', 'created_at', 'id'], name='comment_thread_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='notification_user_recent_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='tweet',
+            index=models.Index(fields=['-created_at', '-id'], name='tweet_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Tweet = apps.get_model('tweets', 'Tweet')
+    Like = apps.get_model('tweets', 'Like')
+    Comment = apps.get_model('tweets', 'Comment')
+
+    def count_of(model):
+        counts = model.objects.filter(tweet=OuterRef('pk')).order_by().values('tweet').annotate(total=Count('id')).values('total')
+        return Coalesce(Subquery(counts), Value(0))
+
+    Tweet.objects.update(likes_count=count_of(Like), comments_count=count_of(Comment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+PATH_STEP = 12
+BATCH_SIZE = 2000
+
+
+def backfill_paths(apps, schema_editor):
+    """Fill in paths one tree level at a time, top-level comments first."""
+    Comment = apps.get_model('tweets', 'Comment')
+
+    roots = Comment.objects.filter(path='', parent__isnull=True)
+    # Replies become eligible once their parent has a path, so this walks down level by level.
+    replies = Comment.objects.filter(path='', parent__isnull=False).exclude(parent__path='')
+    for pending in (roots, replies):
+        while True:
+            rows = list(pending.values_list('id', 'parent__path')[:BATCH_SIZE])
+            if not rows:
+                break
+            Comment.objects.bulk_update(
+                [Comment(id=comment_id, path=(parent_path or '') + str(comment_id).zfill(PATH_STEP))
+                 for comment_id, parent_path in rows],
+                ['path'],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0007_tweet_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=600),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['path'], name='comment_path_idx'),
+        ),
+    ]
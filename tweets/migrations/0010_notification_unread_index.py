@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+from tweets.operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run inside a transaction
+
+    dependencies = [
+        ('tweets', '0009_notification_aggregation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user'], name='notification_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+from tweets.operations import AddPostgresIndexConcurrently
+
+BATCH_SIZE = 10000
+
+
+def backfill_search_vectors(apps, schema_editor):
+    """Compute vectors for existing tweets in id ranges, each batch its own short transaction."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from django.contrib.postgres.search import SearchVector
+    from django.db.models import Max
+
+    Tweet = apps.get_model('tweets', 'Tweet')
+    config = getattr(settings, 'SEARCH', {}).get('CONFIG', 'english')
+    high = Tweet.objects.aggregate(high=Max('id'))['high'] or 0
+    for start in range(0, high + 1, BATCH_SIZE):
+        Tweet.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE).update(
+            search_vector=SearchVector('content', config=config))
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run inside a transaction
+
+    dependencies = [
+        ('tweets', '0011_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+        AddPostgresIndexConcurrently(
+            model_name='tweet',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='tweet_search_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from tweets.operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run inside a transaction
+
+    dependencies = [
+        ('tweets', '0012_tweet_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hashtag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('like', 'Like'), ('reply', 'Reply'), ('follow', 'Follow'), ('mention', 'Mention')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='Mention',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('tweet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='tweets.tweet')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('tweet', 'user')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TweetHashtag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tweet_hashtags', to='tweets.hashtag')),
+                ('tweet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tweet_hashtags', to='tweets.tweet')),
+            ],
+            options={
+                'unique_together': {('tweet', 'hashtag')},
+            },
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='mention',
+            index=models.Index(fields=['user', '-created_at', '-tweet'], name='mention_user_recent_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='tweethashtag',
+            index=models.Index(fields=['hashtag', '-created_at', '-tweet'], name='tweethashtag_recent_idx'),
+        ),
+    ]
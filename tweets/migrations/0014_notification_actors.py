@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:48
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+
+SENDER_SAMPLE_SIZE = 3
+BATCH_SIZE = 2000
+
+
+def merge_groups(apps, schema_editor):
+    """Fold duplicate groups into their oldest row, then record every sampled sender as an actor."""
+    Notification = apps.get_model('tweets', 'Notification')
+    NotificationActor = apps.get_model('tweets', 'NotificationActor')
+    Notification.objects.update(updated_at=F('created_at'))
+
+    key_fields = ('user_id', 'notification_type', 'tweet_id', 'comment_id', 'bucket')
+    duplicates = (
+        Notification.objects.filter(bucket__isnull=False)
+        .values(*key_fields).annotate(rows=Count('id')).filter(rows__gt=1)
+    )
+    for group in list(duplicates):
+        rows = list(Notification.objects.filter(**{field: group[field] for field in key_fields}).order_by('id'))
+        keep = rows[0]
+        sample = {}
+        for row in sorted(rows, key=lambda row: row.updated_at, reverse=True):
+            for sender in row.recent_senders:
+                sample.setdefault(sender['id'], sender)
+        repeated = sum(len(row.recent_senders) for row in rows) - len(sample)  # Actors known to be in several rows
+        keep.actor_count = max(1, sum(row.actor_count for row in rows) - repeated)
+        keep.recent_senders = list(sample.values())[:SENDER_SAMPLE_SIZE]
+        keep.updated_at = max(row.updated_at for row in rows)
+        keep.is_read = all(row.is_read for row in rows)
+        keep.save(update_fields=['actor_count', 'recent_senders', 'updated_at', 'is_read'])
+        Notification.objects.filter(id__in=[row.id for row in rows[1:]]).delete()
+
+    last_id = 0
+    while True:
+        rows = list(
+            Notification.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'sender_id', 'recent_senders')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        NotificationActor.objects.bulk_create(
+            [NotificationActor(notification_id=notification_id, sender_id=sender_id)
+             for notification_id, first_sender_id, senders in rows
+             for sender_id in {first_sender_id, *(sender['id'] for sender in senders)}],
+            ignore_conflicts=True,
+        )
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0013_hashtags_mentions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationactor',
+            name='notification',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='tweets.notification'),
+        ),
+        migrations.AddField(
+            model_name='notificationactor',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='notificationactor',
+            unique_together={('notification', 'sender')},
+        ),
+        migrations.RunPython(merge_groups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(models.F('user'), models.F('notification_type'), django.db.models.functions.comparison.Coalesce('tweet', models.Value(0)), django.db.models.functions.comparison.Coalesce('comment', models.Value(0)), models.F('bucket'), condition=models.Q(('bucket__isnull', False)), name='notification_group_unique'),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.conf import settings
 
 class Tweet(models.Model):
@@ -7,14 +10,16 @@ class Tweet(models.Model):
     content = models.TextField(max_length=280)  # Max 280 characters
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    likes_count = models.PositiveIntegerField(default=0)  # Denormalized, see tweets.counters
+    comments_count = models.PositiveIntegerField(default=0)  # Denormalized, includes replies
+    search_vector = SearchVectorField(null=True, editable=False)  # PostgreSQL only, see tweets.search
 
-    def likes_count(self):
-        """Returns the number of likes on this tweet."""
-        return self.likes.count()
-
-    def comments_count(self):
-        """Returns the number of comments on this tweet."""
-        return self.comments.count()
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='tweet_recent_idx'),  # Keyset pagination
+            models.Index(fields=['user', '-created_at', '-id'], name='tweet_user_recent_idx'),  # Per-author reads
+            GinIndex(fields=['search_vector'], name='tweet_search_idx'),  # Only created on PostgreSQL
+        ]
 
     def __str__(self):
         return f"{self.user.username}: {self.content[:50]}"
@@ -35,23 +40,75 @@ class Like(models.Model):
 
 class Comment(models.Model):
     """Model for comments on tweets, now supports nested replies."""
+    PATH_STEP = 12  # Digits per id in the materialized path
+    PATH_MAX_DEPTH = 50  # Deepest reply chain the path column can hold
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="comments")
     content = models.TextField()
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name="replies")
+    # Zero-padded ids from the root down to this comment, e.g. "000000000007000000000042".
+    # Subtrees are contiguous ranges of this column.
+    path = models.CharField(max_length=PATH_STEP * PATH_MAX_DEPTH, blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['tweet', 'parent', 'created_at', 'id'], name='comment_thread_idx'),  # Keyset pagination
+            models.Index(fields=['parent', 'created_at', 'id'], name='comment_replies_idx'),  # "Load more" replies
+            models.Index(fields=['path'], name='comment_path_idx'),  # Subtree range scans
+        ]
+
     def __str__(self):
         return f"{self.user.username} commented on {self.tweet.id}"
 
+    @classmethod
+    def path_segment(cls, comment_id):
+        return str(comment_id).zfill(cls.PATH_STEP)
+
+    def save(self, *args, **kwargs):
+        """Assign the materialized path once the comment has an id."""
+        super().save(*args, **kwargs)
+        if not self.path:
+            parent_path = self.parent.path if self.parent_id else ''
+            self.path = parent_path + self.path_segment(self.pk)
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+    @property
+    def depth(self):
+        """0 for a top-level comment, 1 for a direct reply, and so on."""
+        return len(self.path) // self.PATH_STEP - 1
+
+    def subtree_bounds(self):
+        """(low, high) such that descendants are exactly the rows with low < path < high."""
+        parent_path = self.path[:-self.PATH_STEP]
+        return self.path, parent_path + self.path_segment(self.pk + 1)
+
+    def descendants(self):
+        """All replies below this comment, at any depth, in one range scan."""
+        low, high = self.subtree_bounds()
+        return Comment.objects.filter(path__gt=low, path__lt=high)
+
+    def descendants_count(self):
+        return self.descendants().count()
+
+    def ancestor_ids(self):
+        step = self.PATH_STEP
+        return [int(self.path[i:i + step]) for i in range(0, len(self.path) - step, step)]
+
+    def ancestors(self):
+        """The reply chain from the top-level comment down to this comment's parent."""
+        return Comment.objects.filter(id__in=self.ancestor_ids()).order_by('path')
+
 
 class Notification(models.Model):
     """Model to store notifications for user interactions."""
     NOTIFICATION_TYPES = (
         ('like', 'Like'),
         ('reply', 'Reply'),
-        ('follow', 'Follow')
+        ('follow', 'Follow'),
+        ('mention', 'Mention'),
     )
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="notifications")
@@ -59,8 +116,98 @@ class Notification(models.Model):
     notification_type = models.CharField(max_length=10, choices=NOTIFICATION_TYPES)
     tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, null=True, blank=True)
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True)  # Fixed once written, so cursors over the list stay valid
+    updated_at = models.DateTimeField(null=True, blank=True)  # Newest event folded into the group
     is_read = models.BooleanField(default=False)  # Track if notification is read
+    # Aggregation: one row per (user, type, tweet, comment) per time bucket, see tweets.notifications
+    bucket = models.DateTimeField(null=True, blank=True)
+    actor_count = models.PositiveIntegerField(default=1)  # Distinct senders, one NotificationActor row each
+    recent_senders = models.JSONField(default=list, blank=True)  # [{"id": ..., "username": ...}], newest first
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_user_recent_idx'),  # Keyset pagination
+            models.Index(fields=['user', 'notification_type', 'bucket'], name='notification_group_idx'),
+            models.Index(fields=['user'], condition=models.Q(is_read=False), name='notification_unread_idx'),  # Badge counts
+        ]
+        constraints = [
+            # One row per group, also when tweet/comment are NULL; rows from before aggregation have no bucket
+            models.UniqueConstraint(
+                'user', 'notification_type', Coalesce('tweet', models.Value(0)), Coalesce('comment', models.Value(0)),
+                'bucket', condition=models.Q(bucket__isnull=False), name='notification_group_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.sender.username} {self.notification_type} notification for {self.user.username}"
+
+
+class NotificationActor(models.Model):
+    """A distinct sender folded into an aggregated notification, so repeat actors are never counted twice."""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name="actors")
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        unique_together = ('notification', 'sender')
+
+    def __str__(self):
+        return f"{self.sender_id} in notification {self.notification_id}"
+
+
+class TimelineEntry(models.Model):
+    """Materialized home timeline row: one per (follower, tweet), written at tweet time."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="timeline_entries")
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="timeline_entries")
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")  # Lets unfollow drop rows without a join
+    created_at = models.DateTimeField()  # Copied from the tweet so the feed reads in index order
+
+    class Meta:
+        unique_together = ('user', 'tweet')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-tweet'], name='timeline_user_recent_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tweet_id} in {self.user_id}'s timeline"
+
+
+class Hashtag(models.Model):
+    """A normalized hashtag: lowercase, without the leading '#'."""
+    name = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.name}"
+
+
+class TweetHashtag(models.Model):
+    """Links a tweet to each hashtag in its content, see tweets.entities."""
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="tweet_hashtags")
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name="tweet_hashtags")
+    created_at = models.DateTimeField()  # Copied from the tweet so topic pages read in index order
+
+    class Meta:
+        unique_together = ('tweet', 'hashtag')
+        indexes = [
+            models.Index(fields=['hashtag', '-created_at', '-tweet'], name='tweethashtag_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tweet_id} tagged {self.hashtag_id}"
+
+
+class Mention(models.Model):
+    """An @username in a tweet's content that matched an existing user."""
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="mentions")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="mentions")
+    created_at = models.DateTimeField()  # Copied from the tweet
+
+    class Meta:
+        unique_together = ('tweet', 'user')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-tweet'], name='mention_user_recent_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.sender.username} {self.notification_type} notification for {self.user.username}"
\ No newline at end of file
+        return f"{self.tweet_id} mentions {self.user_id}"
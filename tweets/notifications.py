@@ -0,0 +1,173 @@
+"""
+Notification dispatch off the request path.
+
+``notify()`` hands an event to an in-process queue once the surrounding
+transaction commits; a background worker thread drains the queue and writes
+each batch. If a batch fails (say one event points at a tweet deleted since),
+its events are retried one at a time and only the failing ones are logged and
+dropped. Set ``NOTIFICATIONS['ASYNC'] = False`` to write inline, which is
+what tests and management commands usually want.
+
+Events are aggregated: all likes on the same tweet (replies to the same
+comment, new followers) within one ``AGGREGATION_WINDOW`` share a single row
+that keeps an actor count and the last few senders, so "bob and 41 others
+liked your tweet" is one row rather than 42. A unique constraint keeps one
+row per group, and each distinct sender is recorded once in
+``NotificationActor`` so the count stays exact when someone likes, unlikes
+and likes again. Writers lock the group rows they fold into, so concurrent
+workers queue up instead of losing each other's senders. A group's
+``created_at`` never changes (it is the list's cursor); ``updated_at`` moves
+to the newest event.
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .background import BackgroundQueue
+from .models import Notification, NotificationActor
+from .push import push_notifications
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_DEFAULTS = {
+    'ASYNC': True,  # Write from a background thread instead of inside the request
+    'BATCH_SIZE': 500,  # Most events written per bulk insert
+    'FLUSH_INTERVAL': 0.5,  # Seconds the worker waits to fill a batch
+    'AGGREGATION_WINDOW': 6 * 60 * 60,  # Seconds of events grouped into one notification
+    'SENDER_SAMPLE_SIZE': 3,  # Recent senders kept on an aggregated notification
+}
+
+
+def notification_setting(name):
+    """Read a NOTIFICATIONS setting, falling back to the defaults above."""
+    return getattr(settings, 'NOTIFICATIONS', {}).get(name, NOTIFICATIONS_DEFAULTS[name])
+
+
+def _bucket(moment):
+    """Start of the aggregation window containing `moment`."""
+    window = notification_setting('AGGREGATION_WINDOW')
+    return datetime.fromtimestamp(moment.timestamp() // window * window, tz=dt_timezone.utc)
+
+
+def _group_key(event):
+    return (event['user_id'], event['notification_type'], event['tweet_id'], event['comment_id'],
+            _bucket(event['created_at']))
+
+
+def _merge_senders(newest_first, existing):
+    """Prepend new senders to the sample, moving repeats to the front."""
+    sample = list(existing)
+    for sender in reversed(newest_first):
+        sample = [s for s in sample if s['id'] != sender['id']]
+        sample.insert(0, sender)
+    return sample[:notification_setting('SENDER_SAMPLE_SIZE')]
+
+
+def write_notifications(events):
+    """Fold events into their aggregated notification rows, creating rows for new groups."""
+    groups = {}
+    for event in sorted(events, key=lambda event: event['created_at'], reverse=True):
+        groups.setdefault(_group_key(event), []).append(event)
+
+    with transaction.atomic():
+        # Groups that already exist are skipped by the unique constraint, whoever created them.
+        Notification.objects.bulk_create([
+            Notification(user_id=key[0], sender_id=group[0]['sender_id'], notification_type=key[1],
+                         tweet_id=key[2], comment_id=key[3], bucket=key[4], actor_count=0)
+            for key, group in groups.items()
+        ], ignore_conflicts=True)
+
+        # Lock the candidate rows in id order: writers of the same group take turns, without deadlocks.
+        candidates = Notification.objects.select_for_update().filter(
+            user_id__in={key[0] for key in groups},
+            notification_type__in={key[1] for key in groups},
+            bucket__in={key[4] for key in groups},
+        ).order_by('id')
+        rows = {}
+        for notification in candidates:
+            key = (notification.user_id, notification.notification_type, notification.tweet_id,
+                   notification.comment_id, notification.bucket)
+            if key in groups:
+                rows[key] = notification
+
+        known = {}  # notification id -> senders already counted
+        for notification_id, sender_id in NotificationActor.objects.filter(
+                notification__in=rows.values(), sender_id__in={event['sender_id'] for event in events},
+        ).values_list('notification_id', 'sender_id'):
+            known.setdefault(notification_id, set()).add(sender_id)
+
+        actors = []
+        for key, group in groups.items():
+            notification = rows[key]
+            latest = group[0]
+            new_sender_ids = {event['sender_id'] for event in group} - known.get(notification.pk, set())
+            actors.extend(NotificationActor(notification=notification, sender_id=sender_id)
+                          for sender_id in new_sender_ids)
+            senders = [{'id': event['sender_id'], 'username': event['sender_username']} for event in group]
+            Notification.objects.filter(pk=notification.pk).update(
+                sender_id=latest['sender_id'], recent_senders=_merge_senders(senders, notification.recent_senders),
+                actor_count=F('actor_count') + len(new_sender_ids), updated_at=latest['created_at'], is_read=False,
+            )
+        NotificationActor.objects.bulk_create(actors)
+
+    push_notifications({notification.pk: notification.user_id for notification in rows.values()})
+    return len(groups)
+
+
+class NotificationDispatcher(BackgroundQueue):
+    """Writes queued notification events in batches."""
+    thread_name = 'notification-dispatcher'
+
+    def is_async(self):
+        return notification_setting('ASYNC')
+
+    def batch_size(self):
+        return notification_setting('BATCH_SIZE')
+
+    def flush_interval(self):
+        return notification_setting('FLUSH_INTERVAL')
+
+    def dispatch(self, event):
+        self.put(event)
+
+    def handle(self, batch):
+        if not self.is_async():
+            write_notifications(batch)  # Inline: let the caller see the error
+            return
+        self.write(batch)
+
+    def write(self, batch):
+        """Write a batch; if it fails, write its events one at a time and drop only those that fail again."""
+        try:
+            write_notifications(batch)
+            return
+        except Exception:
+            if len(batch) == 1:
+                logger.exception("Dropped notification %r", batch[0])
+                return
+            logger.warning("Failed to write %d notifications; retrying one by one", len(batch), exc_info=True)
+        for event in batch:
+            try:
+                write_notifications([event])
+            except Exception:
+                logger.exception("Dropped notification %r", event)
+
+
+dispatcher = NotificationDispatcher()
+
+
+def notify(user, sender, notification_type, tweet=None, comment=None):
+    """Record a notification for `user` without waiting on the insert."""
+    dispatcher.dispatch({
+        'user_id': user.pk,
+        'sender_id': sender.pk,
+        'sender_username': sender.username,
+        'created_at': timezone.now(),
+        'notification_type': notification_type,
+        'tweet_id': tweet.pk if tweet is not None else None,
+        'comment_id': comment.pk if comment is not None else None,
+    })
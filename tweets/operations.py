@@ -0,0 +1,46 @@
+"""
+Migration operations for adding indexes to large, live tables.
+
+On PostgreSQL these build and drop indexes ``CONCURRENTLY``, so writes to the
+table keep flowing while the index is built; other databases get the plain
+statement. Indexes that only exist on PostgreSQL (GIN over a tsvector) are
+skipped elsewhere but still recorded in the migration state. Concurrent index
+builds cannot run in a transaction, so migrations using them must set
+``atomic = False``.
+"""
+from django.db.migrations.operations import AddIndex
+
+
+class AddIndexConcurrentlyIfSupported(AddIndex):
+    """AddIndex that builds the index without locking out writes where the database allows it."""
+
+    def _concurrently(self, schema_editor):
+        return {'concurrently': True} if schema_editor.connection.vendor == 'postgresql' else {}
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, **self._concurrently(schema_editor))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, **self._concurrently(schema_editor))
+
+    def describe(self):
+        return super().describe() + " (concurrently where supported)"
+
+
+class AddPostgresIndexConcurrently(AddIndexConcurrentlyIfSupported):
+    """A PostgreSQL-only index (e.g. GIN); on other databases only the migration state changes."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return AddIndex.describe(self) + " (PostgreSQL only, concurrently)"
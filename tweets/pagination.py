@@ -0,0 +1,172 @@
+"""
+Keyset (cursor) pagination shared by every list endpoint.
+
+Pages are addressed by the ordering values of the last row seen, e.g.
+``(created_at, id)``, instead of an OFFSET, so page 1000 costs the same
+indexed range scan as page 1. Cursors are opaque base64 strings.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """Paginates on a unique ordering such as ('-created_at', '-id')."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')  # Views may override with a `cursor_ordering` attribute
+    invalid_cursor_message = 'Invalid cursor'
+
+    def page_queryset(self, queryset, request, view=None):
+        """The unevaluated query for the requested page, plus one extra row to detect more pages."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = tuple(getattr(view, 'cursor_ordering', self.ordering))
+
+        position, reverse = self.decode_cursor(request.query_params.get(self.cursor_query_param), queryset.model)
+        self.has_cursor = position is not None
+        self.reverse = reverse
+
+        ordering = self.reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, position))
+        return queryset[:self.page_size + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        results = list(self.page_queryset(queryset, request, view))
+        self.has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    # -------------------------- CURSORS --------------------------
+
+    def encode_cursor(self, position, reverse=False):
+        """Turn a tuple of ordering values into an opaque cursor string."""
+        payload = {'p': [self._to_json(value) for value in position]}
+        if reverse:
+            payload['r'] = 1
+        raw = json.dumps(payload, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, model):
+        """Return (position, reverse) for a cursor string; (None, False) when absent."""
+        if not cursor:
+            return None, False
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = tuple(self._from_json(model, name, value) for name, value in zip(self.ordering, values))
+        except (TypeError, ValueError, KeyError, json.JSONDecodeError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(payload.get('r'))
+
+    def position_from_instance(self, instance):
+        return tuple(getattr(instance, name.lstrip('-')) for name in self.ordering)
+
+    def cursor_for_instance(self, instance, reverse=False):
+        """Cursor that resumes right after (or, reversed, right before) the given row."""
+        return self.encode_cursor(self.position_from_instance(instance), reverse=reverse)
+
+    @staticmethod
+    def _to_json(value):
+        return value.isoformat() if hasattr(value, 'isoformat') else value
+
+    @staticmethod
+    def _from_json(model, name, value):
+        try:
+            field = model._meta.get_field(name.lstrip('-'))
+        except FieldDoesNotExist:
+            return value  # Annotation, e.g. a search rank
+        return field.to_python(value)
+
+    # -------------------------- QUERIES --------------------------
+
+    @staticmethod
+    def reverse_ordering(ordering):
+        return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+
+    @staticmethod
+    def keyset_filter(ordering, position):
+        """
+        Build `(a, b) > (x, y)` in the direction of the ordering.
+
+        The leading `a <= x` (or `>=`) term is redundant but lets the database
+        turn the whole condition into a single index range scan.
+        """
+        lookups = []
+        for name in ordering:
+            field = name.lstrip('-')
+            lookups.append((field, 'lt' if name.startswith('-') else 'gt'))
+
+        after = Q()
+        for i, (field, op) in enumerate(lookups):
+            term = Q(**{f'{field}__{op}': position[i]})
+            for j, (prev_field, _) in enumerate(lookups[:i]):
+                term &= Q(**{prev_field: position[j]})
+            after |= term
+
+        lead_field, lead_op = lookups[0]
+        return Q(**{f'{lead_field}__{lead_op}e': position[0]}) & after
+
+    # -------------------------- RESPONSE --------------------------
+
+    def get_next_link(self):
+        if not self.page:
+            return None
+        if self.reverse or self.has_more:
+            cursor = self.cursor_for_instance(self.page[-1])
+            return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+        return None
+
+    def get_previous_link(self):
+        if not self.page:
+            return None
+        if (self.reverse and self.has_more) or (not self.reverse and self.has_cursor):
+            cursor = self.cursor_for_instance(self.page[0], reverse=True)
+            return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+        return None
+
+    def get_first_link(self):
+        return remove_query_param(self.base_url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
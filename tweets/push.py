@@ -0,0 +1,359 @@
+"""
+Server-Sent Events push for notifications and timelines.
+
+Clients open one long-lived ``GET /api/events/`` connection instead of
+polling the notification list and the feed. Whenever notifications are
+written (see ``notifications.write_notifications``) or a tweet is fanned out
+into timelines (``timeline.fan_out_tweet``), the payload is serialized once
+and published to the affected users through a broker; each open stream
+forwards what it receives as ``notification`` and ``tweet`` events, with
+comment-line heartbeats in between to keep proxies from closing it.
+
+The stream is an async view, so it only holds a connection and an
+``asyncio`` queue, not a worker thread: serve the project with an ASGI server
+(``uvicorn config.asgi:application``). Under WSGI Django would buffer the
+endless stream in a worker without ever sending it, so the view answers 501
+there instead.
+
+Every broker delivers to the streams open on its own process. The default
+``InProcessBroker`` stops there; ``RedisBroker`` publishes frames on a Redis
+pub/sub channel that every process listens to, so streams on any worker or
+node get them. Settings pick it when ``REDIS_URL`` is set. Its processes list
+the users they hold streams for in a shared sorted set, scored by when the
+entry expires and refreshed while the stream is open, so publishers still
+skip users nobody is listening for; a batch of notifications goes out as one
+message. Other transports (PostgreSQL LISTEN/NOTIFY, ...) subclass ``Broker``
+the same way: override ``listening()`` and ``publish_many()`` and call
+``deliver()`` for what arrives.
+
+A stream that falls too far behind gets a ``resync`` event and should refetch
+over the REST endpoints.
+
+Browsers' ``EventSource`` cannot send an ``Authorization`` header. Instead of
+putting the day-long access token in the URL (and so in proxy and access
+logs), they ``POST /api/events/ticket/`` and open ``/api/events/?ticket=...``:
+a random ticket kept in the cache for ``TICKET_TTL`` seconds and deleted by the
+first stream that uses it.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from users.authentication import ClaimsJWTAuthentication
+
+from .models import Notification
+from .serializers import NotificationSerializer, TweetSerializer
+
+logger = logging.getLogger(__name__)
+
+PUSH_DEFAULTS = {
+    'ENABLED': True,
+    'BROKER': 'tweets.push.InProcessBroker',
+    'HEARTBEAT': 15,  # Seconds between keep-alive comments on an idle stream
+    'QUEUE_SIZE': 100,  # Events buffered per stream before it is told to resync
+    'RETRY': 3000,  # Milliseconds browsers wait before reconnecting
+    'TICKET_TTL': 30,  # Seconds a stream ticket stays valid; each one opens a single stream
+    'CACHE_ALIAS': 'default',  # Where tickets are kept; must be shared if streams and API calls hit different processes
+    'REDIS_URL': None,  # Server used by RedisBroker
+    'CHANNEL': 'push:events',  # Pub/sub channel RedisBroker publishes on
+    'PRESENCE_TTL': 60,  # Seconds a user stays listed as listening unless their stream's process refreshes it
+}
+
+RESYNC = 'event: resync\ndata: {}\n\n'
+
+
+def push_setting(name):
+    """Read a PUSH setting, falling back to the defaults above."""
+    return getattr(settings, 'PUSH', {}).get(name, PUSH_DEFAULTS[name])
+
+
+def format_event(event, data):
+    """One SSE frame."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+class Broker:
+    """
+    Routes SSE frames to the streams of the users they are addressed to.
+
+    Streams subscribe on the process serving them and ``deliver()`` hands them
+    frames; ``publish()`` is the transport that gets a frame to ``deliver()`` on
+    every process that may hold one of the users' streams.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)  # user id -> Subscriptions open on this process
+
+    def listening(self, user_ids):
+        """The subset of `user_ids` that may have an open stream; lets publishers skip unneeded work."""
+        with self._lock:
+            return {user_id for user_id in user_ids if user_id in self._subscriptions}
+
+    def publish(self, user_ids, frame):
+        self.publish_many([(user_ids, frame)])
+
+    def publish_many(self, messages):
+        """Publish (user ids, frame) pairs together."""
+        for user_ids, frame in messages:
+            self.deliver(user_ids, frame)
+
+    def deliver(self, user_ids, frame):
+        """Queue a frame on this process's streams of these users."""
+        with self._lock:
+            targets = [subscription for user_id in user_ids for subscription in self._subscriptions.get(user_id, ())]
+        for subscription in targets:
+            subscription.put(frame)
+
+    def subscribe(self, user_id):
+        """Return a Subscription; called from the event loop serving the stream."""
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+
+class Subscription:
+    """A stream's bounded queue, fed from any thread."""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=push_setting('QUEUE_SIZE'))
+        self.overflowed = False
+
+    def put(self, frame):
+        self.loop.call_soon_threadsafe(self._put, frame)
+
+    def _put(self, frame):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """The next frame, or None if nothing arrived within `timeout` seconds."""
+        if self.overflowed and self.queue.empty():
+            self.overflowed = False
+            return RESYNC
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker(Broker):
+    """Delivers to streams held by this process only."""
+
+
+class RedisBroker(Broker):
+    """Carries frames between processes over one Redis pub/sub channel; each process delivers to its own streams."""
+
+    def __init__(self, client=None):
+        super().__init__()
+        self.client = client if client is not None else self._connect()
+        self._listener = None
+        self._pid = None
+        self._unannounced = set()  # Users whose first stream here is not in the shared set yet
+
+    @staticmethod
+    def _connect():
+        import redis
+
+        return redis.Redis.from_url(push_setting('REDIS_URL'))
+
+    def _presence_key(self):
+        return f"{push_setting('CHANNEL')}:listening"
+
+    def listening(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        expiries = self.client.zmscore(self._presence_key(), user_ids)
+        now = time.time()
+        return {user_id for user_id, expires in zip(user_ids, expiries) if expires is not None and expires > now}
+
+    def publish_many(self, messages):
+        if messages:
+            payload = json.dumps([[list(user_ids), frame] for user_ids, frame in messages])
+            self.client.publish(push_setting('CHANNEL'), payload)
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        with self._lock:
+            self._unannounced.add(user_id)  # The listener thread adds it; no Redis round trip on the event loop
+        self._ensure_listener()
+        return subscription
+
+    def _ensure_listener(self):
+        with self._lock:
+            # A forked worker process inherits the client but not the thread.
+            if self._listener is None or not self._listener.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._listener = threading.Thread(target=self._listen, name='push-listener', daemon=True)
+                self._listener.start()
+
+    def _announce(self, everyone):
+        """List this process's users in the shared set: new ones, or all of them to extend their expiry."""
+        with self._lock:
+            user_ids = set(self._subscriptions) if everyone else self._unannounced & set(self._subscriptions)
+            self._unannounced.clear()
+        now = time.time()
+        if user_ids:
+            expires = now + push_setting('PRESENCE_TTL')
+            self.client.zadd(self._presence_key(), {user_id: expires for user_id in user_ids})
+        if everyone:
+            self.client.zremrangebyscore(self._presence_key(), '-inf', now)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(push_setting('CHANNEL'))
+                refreshed_at = float('-inf')
+                while True:
+                    everyone = time.monotonic() - refreshed_at >= push_setting('PRESENCE_TTL') / 3
+                    if everyone:
+                        refreshed_at = time.monotonic()
+                    self._announce(everyone)
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None and message['type'] == 'message':
+                        for user_ids, frame in json.loads(message['data']):
+                            self.deliver(user_ids, frame)
+            except Exception:
+                with self._lock:
+                    self._unannounced.update(self._subscriptions)
+                logger.exception("Lost the push channel; reconnecting")
+                time.sleep(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(push_setting('BROKER'))()
+        return _broker
+
+
+def push_notifications(recipients):
+    """Send freshly written notifications, {id: recipient id}, to their recipients once the write commits."""
+    if not push_setting('ENABLED') or not recipients:
+        return
+
+    def publish():
+        broker = get_broker()
+        listening = broker.listening(set(recipients.values()))
+        ids = [pk for pk, user_id in recipients.items() if user_id in listening]
+        if not ids:
+            return  # Nobody is connected: no query at all
+        broker.publish_many([
+            ([notification.user_id], format_event('notification', NotificationSerializer(notification).data))
+            for notification in Notification.objects.filter(pk__in=ids).select_related('sender')
+        ])
+
+    transaction.on_commit(publish)
+
+
+def push_tweet(tweet, user_ids):
+    """Send a tweet just added to these users' timelines, serialized once for all of them."""
+    if not push_setting('ENABLED'):
+        return
+
+    def publish():
+        broker = get_broker()
+        listening = broker.listening(user_ids)
+        if listening:
+            broker.publish(listening, format_event('tweet', TweetSerializer(tweet).data))
+
+    transaction.on_commit(publish)
+
+
+def _ticket_key(ticket):
+    return f'push-ticket:{ticket}'
+
+
+def issue_ticket(user_id):
+    """A random single-use credential that opens one stream for `user_id` within TICKET_TTL seconds."""
+    ticket = secrets.token_urlsafe(32)
+    caches[push_setting('CACHE_ALIAS')].set(_ticket_key(ticket), user_id, push_setting('TICKET_TTL'))
+    return ticket
+
+
+def redeem_ticket(ticket):
+    """The user id a ticket was issued to, or None; of concurrent redemptions only the one that deletes it wins."""
+    cache = caches[push_setting('CACHE_ALIAS')]
+    user_id = cache.get(_ticket_key(ticket))
+    if user_id is None or not cache.delete(_ticket_key(ticket)):
+        return None
+    return user_id
+
+
+def _authenticate(request):
+    """The id of the user behind the stream ticket or the JWT access token header, or None."""
+    ticket = request.GET.get('ticket')
+    if ticket:
+        return redeem_ticket(ticket)
+    authentication = ClaimsJWTAuthentication()
+    try:
+        result = authentication.authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return result[0].pk if result else None
+
+
+async def _stream(user_id):
+    # Subscribe from the loop that consumes the stream, which is not the one the view ran on.
+    subscription = get_broker().subscribe(user_id)
+    try:
+        yield f"retry: {push_setting('RETRY')}\n\n"
+        while True:
+            frame = await subscription.get(push_setting('HEARTBEAT'))
+            yield frame if frame is not None else ': keep-alive\n\n'
+    finally:
+        subscription.close()
+
+
+async def event_stream(request):
+    """Long-lived SSE stream of the current user's notifications and timeline tweets."""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"detail": "Live updates need the ASGI server (config.asgi)."}, status=501)
+    user_id = await sync_to_async(_authenticate)(request)
+    if user_id is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+    response = StreamingHttpResponse(_stream(user_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
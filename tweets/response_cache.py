@@ -0,0 +1,158 @@
+"""
+Response caching for hot read endpoints.
+
+Cached payloads are keyed on the endpoint, the object, the whitelisted query
+parameters (cursor, normalized page size) and the current *version* of every
+namespace the response depends on, e.g. ``tweet:42``. Writes call
+``invalidate()``, which bumps those versions after the transaction commits,
+so stale entries are never read again and simply age out of the cache.
+
+List pages depend on their contents rather than on every tweet ever written:
+``tweet-list`` only changes when tweets are added or removed, and a cached
+page stores the ``tweet:<id>`` versions of the rows it shows. A like on one of
+them turns the next read into a miss; likes elsewhere leave the page cached.
+
+Works with any Django cache backend (locmem, file-based, memcached, Redis);
+use a shared backend so invalidations reach every worker process.
+"""
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+RESPONSE_CACHE_DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60,  # Seconds a cached response is kept
+}
+
+
+def response_cache_setting(name):
+    """Read a RESPONSE_CACHE setting, falling back to the defaults above."""
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(name, RESPONSE_CACHE_DEFAULTS[name])
+
+
+def _cache():
+    return caches[response_cache_setting('CACHE_ALIAS')]
+
+
+def _version_key(namespace):
+    return f'response-cache:version:{namespace}'
+
+
+def namespace_versions(namespaces):
+    """Current version of each namespace, creating missing ones."""
+    cache = _cache()
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        # Versions start at a timestamp so a flushed cache never revives old keys.
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*namespaces):
+    """Invalidate every cached response depending on these namespaces, once the write commits."""
+    def bump():
+        _cache().set_many({_version_key(namespace): time.time_ns() for namespace in namespaces}, None)
+    transaction.on_commit(bump)
+
+
+def tweet_namespaces(tweet_id):
+    """Namespaces touched by any change to a tweet or its likes/comments; add ``tweet-list`` when it is deleted."""
+    return (f'tweet:{tweet_id}',)
+
+
+def comment_namespaces(comment):
+    """Namespaces of a comment and of every comment above it, whose rendered replies include it."""
+    return tuple(f'comment:{comment_id}' for comment_id in [*comment.ancestor_ids(), comment.pk])
+
+
+class CacheStats:
+    """Per-endpoint hit/miss counters for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, endpoint, hit):
+        with self._lock:
+            self._counts[endpoint]['hits' if hit else 'misses'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(counts) for endpoint, counts in self._counts.items()}
+
+
+stats = CacheStats()
+
+
+class CachedResponseMixin:
+    """
+    Serve GET responses from the cache.
+
+    Views list the namespaces their response depends on in
+    `get_cache_namespaces()`; per-user responses also override `get_cache_object()`,
+    and list views name the namespaces of the rows on a page in `get_content_namespaces()`.
+    An ETag set further down the view (see `ConditionalGetMixin`) is cached with the
+    payload, so a hit can answer If-None-Match without touching the database.
+    """
+    cache_endpoint = None
+    cache_query_params = ('cursor',)  # Other parameters do not change the response, so they never split the cache
+
+    def get_cache_namespaces(self):
+        raise NotImplementedError
+
+    def get_content_namespaces(self, data):
+        return []
+
+    def get_cache_object(self):
+        return ':'.join(f'{name}={value}' for name, value in sorted(self.kwargs.items()))
+
+    def get_cache_query(self, request):
+        params = {name: request.query_params[name] for name in self.cache_query_params if name in request.query_params}
+        if getattr(self.paginator, 'page_size_query_param', None):
+            params['page_size'] = self.paginator.get_page_size(request)  # Clamped, so ?page_size=1..N share keys
+        return urlencode(sorted(params.items()))
+
+    def get_cache_key(self, request):
+        namespaces = self.get_cache_namespaces()
+        versions = '.'.join(str(version) for version in namespace_versions(namespaces))
+        query = self.get_cache_query(request)
+        return f'response-cache:{self.cache_endpoint}:{versions}:{self.get_cache_object()}:{query}'
+
+    def get(self, request, *args, **kwargs):
+        if not response_cache_setting('ENABLED'):
+            return super().get(request, *args, **kwargs)
+
+        key = self.get_cache_key(request)
+        entry = _cache().get(key)
+        if entry is not None:
+            data, content_versions, etag = entry
+            if not content_versions or namespace_versions(content_versions) == list(content_versions.values()):
+                stats.record(self.cache_endpoint, hit=True)
+                response = get_conditional_response(request, etag=etag) if etag else None
+                if response is None:
+                    response = Response(data)
+                if etag:
+                    response['ETag'] = etag
+                response['X-Cache'] = 'HIT'
+                return response
+
+        stats.record(self.cache_endpoint, hit=False)
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            content = self.get_content_namespaces(response.data)
+            content_versions = dict(zip(content, namespace_versions(content))) if content else {}
+            entry = (response.data, content_versions, response.get('ETag'))
+            _cache().set(key, entry, response_cache_setting('TIMEOUT'))
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,148 @@
+"""
+Full-text tweet search.
+
+On PostgreSQL every tweet keeps a precomputed ``search_vector`` (a tsvector
+over its content) behind a GIN index, refreshed whenever a tweet is created
+or edited, so a search is an index lookup plus ``ts_rank`` over the matches
+instead of a ``LIKE '%term%'`` scan.
+
+Other databases (SQLite in development and tests) use an in-process
+inverted index instead. It is built from the tweets table on first use and
+catches up with newer tweets before each search; it is meant for a single
+process and caps how many matches it ranks.
+
+Both return a Tweet queryset annotated with ``rank``, meant to be paginated
+on ``('-rank', '-id')``.
+"""
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from .models import Tweet
+
+SEARCH_DEFAULTS = {
+    'CONFIG': 'english',  # PostgreSQL text search configuration (stemming, stop words)
+    'FALLBACK_MAX_RESULTS': 1000,  # Most matches ranked by the in-process index
+}
+
+SEARCH_ORDERING = ('-rank', '-id')
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def search_setting(name):
+    """Read a SEARCH setting, falling back to the defaults above."""
+    return getattr(settings, 'SEARCH', {}).get(name, SEARCH_DEFAULTS[name])
+
+
+def uses_search_vector():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class InvertedIndex:
+    """term -> {tweet id: term frequency}, for databases without full-text search."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.postings = defaultdict(dict)
+        self.documents = {}  # tweet id -> Counter of its terms
+        self.last_id = 0  # Highest tweet id read from the database so far
+
+    def _add(self, tweet_id, content):
+        self._remove(tweet_id)
+        terms = Counter(tokenize(content))
+        self.documents[tweet_id] = terms
+        for term, frequency in terms.items():
+            self.postings[term][tweet_id] = frequency
+
+    def _remove(self, tweet_id):
+        for term in self.documents.pop(tweet_id, ()):
+            self.postings[term].pop(tweet_id, None)
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def add(self, tweet_id, content):
+        with self._lock:
+            self._add(tweet_id, content)
+
+    def remove(self, tweet_id):
+        with self._lock:
+            self._remove(tweet_id)
+
+    def catch_up(self):
+        """Index tweets created since the last read, including ones written by other code paths."""
+        with self._lock:
+            newer = Tweet.objects.filter(id__gt=self.last_id).order_by('id').values_list('id', 'content')
+            for tweet_id, content in newer.iterator(chunk_size=2000):
+                self._add(tweet_id, content)
+                self.last_id = tweet_id
+
+    def search(self, text, limit):
+        """[(rank, tweet id)] of tweets containing every term, best first (tf-idf)."""
+        terms = set(tokenize(text))
+        with self._lock:
+            if not terms or any(term not in self.postings for term in terms):
+                return []
+            total = len(self.documents)
+            rarest_first = sorted(terms, key=lambda term: len(self.postings[term]))
+            matches = set(self.postings[rarest_first[0]])
+            for term in rarest_first[1:]:
+                matches &= self.postings[term].keys()
+            idf = {term: math.log(1 + total / len(self.postings[term])) for term in terms}
+            ranked = [
+                (round(sum(self.postings[term][tweet_id] * idf[term] for term in terms), 6), tweet_id)
+                for tweet_id in matches
+            ]
+        ranked.sort(reverse=True)
+        return ranked[:limit]
+
+
+memory_index = InvertedIndex()
+
+
+def index_tweet(tweet):
+    """Refresh a tweet's search entry after it is created or its content changes."""
+    if uses_search_vector():
+        Tweet.objects.filter(pk=tweet.pk).update(search_vector=SearchVector('content', config=search_setting('CONFIG')))
+    else:
+        memory_index.add(tweet.pk, tweet.content)
+
+
+def unindex_tweet(tweet_id):
+    """Drop a deleted tweet from the in-process index (PostgreSQL deletes the row and its vector together)."""
+    if not uses_search_vector():
+        memory_index.remove(tweet_id)
+
+
+def refresh_search_vectors(queryset):
+    """Recompute search vectors for many tweets at once, e.g. after a bulk import."""
+    if uses_search_vector():
+        return queryset.update(search_vector=SearchVector('content', config=search_setting('CONFIG')))
+    return 0
+
+
+def search_tweets(text):
+    """Tweets matching `text`, annotated with a relevance `rank`."""
+    if uses_search_vector():
+        query = SearchQuery(text, config=search_setting('CONFIG'), search_type='websearch')
+        # ts_rank returns a float4; as a double it survives the round trip through the cursor unchanged.
+        rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+        return Tweet.objects.filter(search_vector=query).annotate(rank=rank)
+
+    memory_index.catch_up()
+    ranked = memory_index.search(text, search_setting('FALLBACK_MAX_RESULTS'))
+    if not ranked:
+        return Tweet.objects.none().annotate(rank=Value(0.0, output_field=FloatField()))
+    rank = Case(*[When(id=tweet_id, then=Value(score)) for score, tweet_id in ranked], output_field=FloatField())
+    return Tweet.objects.filter(id__in=[tweet_id for _, tweet_id in ranked]).annotate(rank=rank)
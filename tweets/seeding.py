@@ -0,0 +1,222 @@
+"""
+Synthetic social graphs for benchmarks and query-plan checks.
+
+Follower counts follow a power law: a handful of accounts are followed by
+most users and a long tail by almost nobody, and popular accounts also tweet
+more, and are the ones @mentioned. Likes and comment trees are heavy-tailed
+per tweet. Everything is
+written with bulk inserts, and the derived data (counters, materialized
+comment paths, home timelines, aggregated notifications) is filled in
+afterwards so the result looks like what the API itself would have produced.
+"""
+import itertools
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.utils import timezone
+
+from .counters import reconcile_counters
+from .entities import index_entities
+from .models import Tweet, Like, Comment, TimelineEntry
+from .notifications import write_notifications
+from .search import refresh_search_vectors
+from .threads import thread_setting
+from .timeline import FANOUT_ON_READ_CACHE_KEY, timeline_setting
+
+SEED_DEFAULTS = {
+    'users': 1000,
+    'tweets': 5000,
+    'follows_per_user': 20,  # Mean; the actual count per user is heavy-tailed
+    'likes_per_tweet': 5,  # Mean
+    'comments_per_tweet': 3,  # Mean
+    'reply_ratio': 0.5,  # Share of comments that reply to an earlier comment
+    'popularity_exponent': 1.1,  # Zipf exponent of follower counts
+    'mention_ratio': 0.2,  # Share of tweets that @mention another account
+    'days': 30,  # Tweets are spread over this many days
+    'seed': 0,
+    'batch_size': 1000,
+}
+
+
+def _heavy_tailed(rng, mean, cap):
+    """A Pareto-distributed count with the given mean (shape 1.5 has mean 3)."""
+    return min(cap, int(rng.paretovariate(1.5) * mean / 3))
+
+
+def _cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def _draw_distinct(rng, population, cum_weights, k, exclude=None):
+    """Up to k distinct weighted picks from population."""
+    picked = set()
+    for _ in range(3):  # Popular picks repeat; a few rounds top the set up
+        if len(picked) >= k:
+            break
+        picked.update(rng.choices(population, cum_weights=cum_weights, k=k - len(picked)))
+        picked.discard(exclude)
+    return list(picked)[:k]
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def seed_social_graph(log=None, **options):
+    """
+    Create users, follows, tweets, timelines, likes, comment trees and notifications.
+
+    Options default to SEED_DEFAULTS; returns the number of rows created per kind.
+    """
+    options = {**SEED_DEFAULTS, **options}
+    rng = random.Random(options['seed'])
+    batch_size = options['batch_size']
+    log = log or (lambda message: None)
+    User = get_user_model()
+    now = timezone.now()
+
+    # Users, ranked by popularity in random order
+    run = uuid.uuid4().hex[:6]
+    password = make_password(None)
+    users = User.objects.bulk_create(
+        [User(username=f'seed-{run}-{i}', email=f'seed-{run}-{i}@example.com', password=password)
+         for i in range(options['users'])],
+        batch_size=batch_size,
+    )
+    user_ids = [user.pk for user in users]
+    ranked = user_ids[:]
+    rng.shuffle(ranked)
+    popularity = [1 / (rank + 1) ** options['popularity_exponent'] for rank in range(len(ranked))]
+    popularity_cum = _cumulative(popularity)
+    usernames = {user.pk: user.username for user in users}
+    log(f"Created {len(users)} users")
+
+    # Follows: following[a] is the set of accounts a follows
+    following = {}
+    for user_id in user_ids:
+        count = _heavy_tailed(rng, options['follows_per_user'], len(user_ids) - 1)
+        following[user_id] = _draw_distinct(rng, ranked, popularity_cum, count, exclude=user_id)
+    Follow = User.followers.through  # (from=followee, to=follower)
+    follows = [Follow(from_customuser_id=followee, to_customuser_id=follower)
+               for follower, followees in following.items() for followee in followees]
+    Follow.objects.bulk_create(follows, batch_size=batch_size, ignore_conflicts=True)
+    followers = {user_id: [] for user_id in user_ids}
+    for follower, followees in following.items():
+        for followee in followees:
+            followers[followee].append(follower)
+    for user in users:
+        user.followers_count = len(followers[user.pk])
+        user.following_count = len(following[user.pk])
+    User.objects.bulk_update(users, ['followers_count', 'following_count'], batch_size=batch_size)
+    log(f"Created {len(follows)} follows")
+
+    # Tweets, mostly by popular accounts, spread over the last few days
+    activity_cum = _cumulative(weight ** 0.5 for weight in popularity)
+    authors = rng.choices(ranked, cum_weights=activity_cum, k=options['tweets'])
+    span = options['days'] * 24 * 60 * 60
+    contents = [f'Seed tweet {i} #{rng.choice(["django", "python", "news", "music"])}' for i in range(len(authors))]
+    for i in range(len(contents)):
+        if rng.random() < options['mention_ratio']:
+            contents[i] += f' @{usernames[rng.choices(ranked, cum_weights=popularity_cum)[0]]}'
+    tweets = Tweet.objects.bulk_create(
+        [Tweet(user_id=author, content=content) for author, content in zip(authors, contents)],
+        batch_size=batch_size,
+    )
+    for tweet in tweets:  # auto_now_add ignores values passed to bulk_create
+        tweet.created_at = tweet.updated_at = now - timedelta(seconds=rng.uniform(0, span))
+    Tweet.objects.bulk_update(tweets, ['created_at', 'updated_at'], batch_size=batch_size)
+    if tweets:
+        refresh_search_vectors(Tweet.objects.filter(id__gte=tweets[0].pk, id__lte=tweets[-1].pk))
+    mentioned = {}
+    for chunk in _chunks(tweets, batch_size):
+        mentioned.update(index_entities(chunk))
+    log(f"Created {len(tweets)} tweets")
+
+    # Home timelines, as fan-out on write would have built them
+    limit = timeline_setting('FANOUT_FOLLOWER_LIMIT')
+    entries = [
+        TimelineEntry(user_id=follower, tweet_id=tweet.pk, author_id=tweet.user_id, created_at=tweet.created_at)
+        for tweet in tweets if len(followers[tweet.user_id]) <= limit
+        for follower in followers[tweet.user_id]
+    ]
+    TimelineEntry.objects.bulk_create(entries, batch_size=batch_size, ignore_conflicts=True)
+    cache.delete(FANOUT_ON_READ_CACHE_KEY)
+    log(f"Created {len(entries)} timeline entries")
+
+    events = []
+
+    # Likes
+    likes = []
+    for tweet in tweets:
+        for liker in rng.sample(user_ids, _heavy_tailed(rng, options['likes_per_tweet'], len(user_ids))):
+            likes.append(Like(user_id=liker, tweet_id=tweet.pk))
+            if liker != tweet.user_id:
+                events.append({'user_id': tweet.user_id, 'sender_id': liker, 'notification_type': 'like',
+                               'tweet_id': tweet.pk, 'comment_id': None})
+    Like.objects.bulk_create(likes, batch_size=batch_size, ignore_conflicts=True)
+    log(f"Created {len(likes)} likes")
+
+    # Comment trees, inserted one depth level at a time so parents have paths
+    levels = {}
+    max_depth = thread_setting('MAX_DEPTH') + 2  # Deep enough to exercise "load more" links
+    for tweet in tweets:
+        thread = []
+        for i in range(_heavy_tailed(rng, options['comments_per_tweet'], 200)):
+            parent = rng.choice(thread) if thread and rng.random() < options['reply_ratio'] else None
+            depth = parent['depth'] + 1 if parent is not None else 0
+            if depth >= max_depth:
+                parent, depth = None, 0
+            node = {
+                'depth': depth, 'parent': parent,
+                'comment': Comment(user_id=rng.choice(user_ids), tweet_id=tweet.pk, content=f'Seed comment {i}'),
+                'created_at': tweet.created_at + timedelta(seconds=60 * (i + 1)),
+            }
+            thread.append(node)
+            levels.setdefault(depth, []).append(node)
+
+    comments = 0
+    for depth in sorted(levels):
+        nodes = levels[depth]
+        for node in nodes:
+            if node['parent'] is not None:
+                node['comment'].parent_id = node['parent']['comment'].pk
+        created = Comment.objects.bulk_create([node['comment'] for node in nodes], batch_size=batch_size)
+        for node, comment in zip(nodes, created):
+            parent = node['parent']
+            comment.path = (parent['comment'].path if parent else '') + Comment.path_segment(comment.pk)
+            comment.created_at = comment.updated_at = node['created_at']
+            if parent is not None and parent['comment'].user_id != comment.user_id:
+                events.append({'user_id': parent['comment'].user_id, 'sender_id': comment.user_id,
+                               'notification_type': 'reply', 'tweet_id': None, 'comment_id': parent['comment'].pk})
+        Comment.objects.bulk_update(created, ['path', 'created_at', 'updated_at'], batch_size=batch_size)
+        comments += len(created)
+    log(f"Created {comments} comments")
+
+    if tweets:
+        reconcile_counters(tweets[0].pk, tweets[-1].pk + 1)
+
+    # Notifications, aggregated the same way the dispatcher writes them
+    for tweet in tweets:
+        for user_id in mentioned[tweet.pk]:
+            events.append({'user_id': user_id, 'sender_id': tweet.user_id, 'notification_type': 'mention',
+                           'tweet_id': tweet.pk, 'comment_id': None})
+    for follower, followees in following.items():
+        for followee in followees:
+            events.append({'user_id': followee, 'sender_id': follower, 'notification_type': 'follow',
+                           'tweet_id': None, 'comment_id': None})
+    for chunk in _chunks(events, batch_size):
+        for event in chunk:
+            event['sender_username'] = usernames[event['sender_id']]
+            event['created_at'] = now
+        write_notifications(chunk)
+    log(f"Wrote {len(events)} notification events")
+
+    return {
+        'users': len(users), 'follows': len(follows), 'tweets': len(tweets), 'timeline_entries': len(entries),
+        'likes': len(likes), 'comments': comments, 'notification_events': len(events),
+    }
@@ -1,16 +1,20 @@
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.reverse import reverse
+
 from .models import Tweet, Like, Comment, Notification
+from .pagination import KeysetCursorPagination
+from .threads import THREAD_ORDERING, CommentThread, thread_setting
 
 
 class TweetSerializer(serializers.ModelSerializer):
     """Serializer for displaying tweets with likes and comments count."""
     user = serializers.StringRelatedField(read_only=True)  # Show username instead of ID
-    likes_count = serializers.IntegerField(source='likes.count', read_only=True)  # More efficient way to count likes
-    comments_count = serializers.IntegerField(source='comments.count', read_only=True)  # More efficient for comments
 
     class Meta:
         model = Tweet
         fields = ['id', 'user', 'content', 'likes_count', 'comments_count', 'created_at', 'updated_at']
+        read_only_fields = ['likes_count', 'comments_count']  # Denormalized counters, no per-row COUNT
 
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -26,33 +30,107 @@ class CommentSerializer(serializers.ModelSerializer):
     """Serializer for comments, including nested replies."""
     user = serializers.StringRelatedField(read_only=True)
     replies = serializers.SerializerMethodField()
+    replies_count = serializers.SerializerMethodField()
+    replies_next = serializers.SerializerMethodField()
 
     class Meta:
         model = Comment
-        fields = ['id', 'user', 'content', 'parent', 'replies', 'created_at', 'updated_at']
+        fields = ['id', 'user', 'content', 'parent', 'replies', 'replies_count', 'replies_next', 'created_at', 'updated_at']
         extra_kwargs = {'tweet': {'required': False}}  # Ensure 'tweet' is not required
 
+    def _thread(self, obj):
+        """Reply tree shared by every comment in this response (loaded once if the view didn't)."""
+        thread = self.context.get('thread')
+        if thread is None or not thread.covers(obj):
+            thread = self.context['thread'] = CommentThread.load([obj])
+        return thread
+
+    def _depth(self):
+        return self.context.get('thread_depth', 0)
+
     def get_replies(self, obj):
-        """Retrieve replies for a comment."""
-        replies = obj.replies.all()
-        return CommentSerializer(replies, many=True).data
+        """Retrieve replies for a comment from the preloaded thread, up to the depth and width limits."""
+        if self._depth() >= thread_setting('MAX_DEPTH'):
+            return []
+        replies = self._thread(obj).replies_for(obj)[:thread_setting('REPLY_LIMIT')]
+        context = {**self.context, 'thread_depth': self._depth() + 1}
+        return CommentSerializer(replies, many=True, context=context).data
+
+    def get_replies_count(self, obj):
+        return len(self._thread(obj).replies_for(obj))
+
+    def get_replies_next(self, obj):
+        """Link to the replies that were not rendered inline, if any."""
+        replies = self._thread(obj).replies_for(obj)
+        url = reverse('comment-replies', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+        if replies and self._depth() >= thread_setting('MAX_DEPTH'):
+            return url
+        limit = thread_setting('REPLY_LIMIT')
+        if len(replies) > limit:
+            paginator = KeysetCursorPagination()
+            paginator.ordering = THREAD_ORDERING
+            return f"{url}?{paginator.cursor_query_param}={paginator.cursor_for_instance(replies[limit - 1])}"
+        return None
 
     def validate(self, data):
         """Ensure a reply belongs to the same tweet as its parent comment."""
+        if self.instance is not None and "parent" in data and data["parent"] != self.instance.parent:
+            raise serializers.ValidationError("A comment cannot be moved to another parent.")
         if data.get("parent"):
-            if data["parent"].tweet != data["tweet"]:
+            if data["parent"].depth + 1 >= Comment.PATH_MAX_DEPTH:
+                raise serializers.ValidationError("This reply chain is too deep.")
+            if "tweet" in data:
+                tweet_id = data["tweet"].id
+            elif self.instance is not None:
+                tweet_id = self.instance.tweet_id
+            else:
+                tweet_id = int(self.context["view"].kwargs["tweet_id"])  # Tweet comes from the URL
+            if data["parent"].tweet_id != tweet_id:
                 raise serializers.ValidationError("Replies must be on the same tweet as the parent comment.")
         return data
 
 
 class NotificationSerializer(serializers.ModelSerializer):
-    """Serializer for user notifications."""
+    """Serializer for user notifications, aggregated per tweet/comment and time window."""
+    ACTIONS = {'like': 'liked your tweet', 'reply': 'replied to your comment', 'follow': 'followed you',
+               'mention': 'mentioned you'}
+
     sender = serializers.StringRelatedField()
     tweet = serializers.PrimaryKeyRelatedField(queryset=Tweet.objects.all(), allow_null=True)
     comment = serializers.PrimaryKeyRelatedField(queryset=Comment.objects.all(), allow_null=True)
+    summary = serializers.SerializerMethodField()
 
     class Meta:
         model = Notification
-        fields = ['id', 'sender', 'notification_type', 'tweet', 'comment', 'is_read', 'created_at']
-
+        fields = ['id', 'sender', 'notification_type', 'tweet', 'comment', 'actor_count', 'recent_senders',
+                  'summary', 'is_read', 'created_at', 'updated_at']
+        read_only_fields = ['actor_count', 'recent_senders', 'updated_at']
+
+    def get_summary(self, obj):
+        """e.g. "bob and 41 others liked your tweet"."""
+        name = obj.recent_senders[0]['username'] if obj.recent_senders else obj.sender.username
+        others = obj.actor_count - 1
+        if others > 0:
+            name = f"{name} and {others} other{'s' if others > 1 else ''}"
+        return f"{name} {self.ACTIONS.get(obj.notification_type, obj.notification_type)}"
+
+
+class NotificationReadSerializer(serializers.Serializer):
+    """Selects notifications to mark as read: all of them, a list of ids, or everything up to a cursor."""
+    all = serializers.BooleanField(required=False, default=False)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+    cursor = serializers.CharField(required=False)
+
+    def validate_cursor(self, value):
+        """Decode the cursor into the (created_at, id) position it points at."""
+        try:
+            position, _ = KeysetCursorPagination().decode_cursor(value, Notification)
+        except NotFound:
+            raise serializers.ValidationError("Invalid cursor.")
+        return position
 
+    def validate(self, data):
+        chosen = [name for name in ('ids', 'cursor') if name in data] + (['all'] if data.get('all') else [])
+        if len(chosen) != 1:
+            raise serializers.ValidationError("Provide exactly one of 'all', 'ids' or 'cursor'.")
+        return data
@@ -0,0 +1,36 @@
+"""Test helpers shared by the apps' test suites."""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.utils.urls import replace_query_param
+
+
+class QueryCountAssertionsMixin:
+    """
+    TestCase mixin that catches N+1 regressions on list endpoints.
+
+    Fetch the same endpoint with a small and a large page size and require the
+    number of SQL queries to be identical; any per-row lookup makes the large
+    page cost more queries and fails the assertion with the offending SQL.
+    """
+
+    def assertQueryCountIndependentOfPageSize(self, client, url, small=2, large=20):
+        self._capture_list_queries(client, url, small)  # Fill lazily cached lookups (follow graph, user rows) first
+        small_queries, small_rows = self._capture_list_queries(client, url, small)
+        large_queries, large_rows = self._capture_list_queries(client, url, large)
+
+        if large_rows <= small_rows:
+            self.fail(f"{url} returned {large_rows} rows for page_size={large}; "
+                      f"seed more than {small} rows so the page sizes differ.")
+
+        if len(large_queries) != len(small_queries):
+            sql = '\n'.join(f"  {query['sql']}" for query in large_queries)
+            self.fail(f"{url} ran {len(small_queries)} queries for {small_rows} rows but "
+                      f"{len(large_queries)} queries for {large_rows} rows:\n{sql}")
+
+    def _capture_list_queries(self, client, url, page_size):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(replace_query_param(url, 'page_size', page_size))
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        rows = data['results'] if isinstance(data, dict) else data
+        return context.captured_queries, len(rows)
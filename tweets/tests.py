@@ -1,3 +1,866 @@
-from django.test import TestCase
+import asyncio
+import json
+import queue
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .benchmarking import benchmark_endpoint, benchmark_targets, compare_results
+from .entities import index_entities
+from .likes import like_tweet
+from .models import Comment, Notification, TimelineEntry, Tweet
+from .notifications import dispatcher, notify
+from .pagination import KeysetCursorPagination
+from .push import RedisBroker, format_event
+from .search import index_tweet, memory_index
+from .seeding import seed_social_graph
+from .testing import QueryCountAssertionsMixin
+from .threads import CommentThread
+from .timeline import FANOUT_ON_READ_CACHE_KEY, backfill_follow, fan_out_queue
+from .trending import TrendingCounter
+
+User = get_user_model()
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False}, NOTIFICATIONS={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ListQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    """Every list endpoint must cost the same number of queries for 2 rows as for 20."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        cls.authors = [User.objects.create_user(f'author{i}', f'author{i}@example.com', 'password123')
+                       for i in range(25)]
+        cls.tweet = Tweet.objects.create(user=cls.reader, content="Hello #django")
+        for author in cls.authors:
+            cls.reader.follow(author)
+            tweet = Tweet.objects.create(user=author, content=f"Hi @reader, this is {author.username} #django")
+            like_tweet(cls.reader, tweet.pk)
+            comment = Comment.objects.create(user=author, tweet=cls.tweet, content="Nice")
+            Comment.objects.create(user=cls.reader, tweet=cls.tweet, parent=comment, content="Thanks")
+            Notification.objects.create(user=cls.reader, sender=author, notification_type='like', tweet=tweet)
+            backfill_follow(cls.reader, author)
+        index_entities(Tweet.objects.all())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_tweet_list(self):
+        self.assertQueryCountIndependentOfPageSize(self.client, reverse('tweet-list'))
+
+    def test_feed(self):
+        self.assertQueryCountIndependentOfPageSize(self.client, reverse('personalized-feed'))
+
+    def test_notifications(self):
+        self.assertQueryCountIndependentOfPageSize(self.client, reverse('notifications'))
+
+    def test_comments(self):
+        self.assertQueryCountIndependentOfPageSize(self.client, reverse('comment-list', args=[self.tweet.pk]))
+
+    def test_hashtag_tweets(self):
+        self.assertQueryCountIndependentOfPageSize(self.client, reverse('hashtag-tweets', args=['django']))
+
+
+@override_settings(TIMELINE={'ASYNC': False, 'FANOUT_FOLLOWER_LIMIT': 2}, NOTIFICATIONS={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class TimelineTests(TestCase):
+    """Authors with up to two followers fan out on write; above that their tweets are merged on read."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password123')
+        cls.readers = [User.objects.create_user(f'reader{i}', f'reader{i}@example.com', 'password123')
+                       for i in range(3)]
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))  # Fresh counters
+        return client
+
+    def follow(self, reader):
+        self.client_for(reader).post(reverse('follow-user', args=[self.author.pk]))
+
+    def unfollow(self, reader):
+        self.client_for(reader).post(reverse('unfollow-user', args=[self.author.pk]))
+
+    def post(self, content):
+        response = self.client_for(self.author).post(reverse('tweet-list'), {'content': content})
+        return response.json()['id']
+
+    def feed(self, reader):
+        return [tweet['id'] for tweet in self.client_for(reader).get(reverse('personalized-feed')).json()['results']]
+
+    def test_tweet_is_fanned_out_to_followers(self):
+        self.follow(self.readers[0])
+        tweet_id = self.post("Hello")
+        self.assertTrue(TimelineEntry.objects.filter(user=self.readers[0], tweet_id=tweet_id).exists())
+        self.assertEqual(self.feed(self.readers[0]), [tweet_id])
+        self.assertEqual(self.feed(self.readers[1]), [])
+
+    def test_fan_out_waits_for_commit_when_async(self):
+        self.follow(self.readers[0])
+        with self.settings(TIMELINE={'ASYNC': True, 'FANOUT_FOLLOWER_LIMIT': 2}), \
+                mock.patch.object(fan_out_queue, '_enqueue') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                tweet_id = self.post("Hello")
+                enqueue.assert_not_called()
+        enqueue.assert_called_once_with(tweet_id)
+        self.assertFalse(TimelineEntry.objects.exists())  # Left to the worker thread
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        first, second = self.post("First"), self.post("Second")
+        self.follow(self.readers[0])
+        self.assertEqual(self.feed(self.readers[0]), [second, first])
+        self.unfollow(self.readers[0])
+        self.assertEqual(self.feed(self.readers[0]), [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.readers[0]).exists())
+
+    def test_widely_followed_author_is_merged_on_read(self):
+        for reader in self.readers:
+            self.follow(reader)
+        fanned_out = TimelineEntry.objects.filter(author=self.author).count()
+        tweet_id = self.post("To many")
+        self.assertEqual(TimelineEntry.objects.filter(author=self.author).count(), fanned_out)
+        self.assertEqual(self.feed(self.readers[0]), [tweet_id])
+
+    def test_going_over_the_limit_drops_the_cached_author_set(self):
+        self.follow(self.readers[0])
+        self.follow(self.readers[1])
+        self.feed(self.readers[0])  # Caches the (empty) set of read-time authors
+        self.assertEqual(caches['default'].get(FANOUT_ON_READ_CACHE_KEY), frozenset())
+
+        self.follow(self.readers[2])
+        self.assertIsNone(caches['default'].get(FANOUT_ON_READ_CACHE_KEY))
+        tweet_id = self.post("Now merged")
+        self.assertEqual(self.feed(self.readers[0]), [tweet_id])
+
+    def test_dropping_back_to_the_limit_copies_merged_tweets(self):
+        for reader in self.readers:
+            self.follow(reader)
+        tweet_id = self.post("Merged")
+        self.unfollow(self.readers[2])
+        self.assertEqual(set(TimelineEntry.objects.filter(tweet_id=tweet_id).values_list('user_id', flat=True)),
+                         {self.readers[0].pk, self.readers[1].pk})
+        self.assertEqual(self.feed(self.readers[0]), [tweet_id])
+
+
+@override_settings(NOTIFICATIONS={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class NotificationAggregationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password123')
+        cls.tweet = Tweet.objects.create(user=cls.author, content="Hello")
+        cls.fans = [User.objects.create_user(f'fan{i}', f'fan{i}@example.com', 'password123') for i in range(5)]
+
+    def test_repeat_actor_outside_sample_is_counted_once(self):
+        for fan in self.fans:
+            notify(user=self.author, sender=fan, notification_type='like', tweet=self.tweet)
+        notify(user=self.author, sender=self.fans[0], notification_type='like', tweet=self.tweet)
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual([sender['id'] for sender in notification.recent_senders],
+                         [self.fans[0].pk, self.fans[4].pk, self.fans[3].pk])
+
+    def test_group_keeps_its_position_in_the_list(self):
+        notify(user=self.author, sender=self.fans[0], notification_type='like', tweet=self.tweet)
+        created_at = Notification.objects.get().created_at
+        notify(user=self.author, sender=self.fans[1], notification_type='like', tweet=self.tweet)
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.created_at, created_at)
+        self.assertGreater(notification.updated_at, created_at)
+
+    def test_one_row_per_group(self):
+        notify(user=self.author, sender=self.fans[0], notification_type='follow')
+        notification = Notification.objects.get()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Notification.objects.create(user=self.author, sender=self.fans[1], notification_type='follow',
+                                        bucket=notification.bucket)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class NotificationBatchTests(TransactionTestCase):
+    """Each batch commits on its own, so foreign keys are checked as in the background worker."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password123')
+        self.fans = [User.objects.create_user(f'fan{i}', f'fan{i}@example.com', 'password123') for i in range(3)]
+        self.tweet = Tweet.objects.create(user=self.author, content="Hello")
+
+    def event(self, sender, **fields):
+        return {'user_id': self.author.pk, 'sender_id': sender.pk, 'sender_username': sender.username,
+                'created_at': timezone.now(), 'notification_type': 'like', 'tweet_id': self.tweet.pk,
+                'comment_id': None, **fields}
+
+    def test_one_bad_event_does_not_lose_the_batch(self):
+        batch = [self.event(self.fans[0]), self.event(self.fans[1], tweet_id=self.tweet.pk + 1000),
+                 self.event(self.fans[2], notification_type='follow', tweet_id=None)]
+        with self.assertLogs('tweets.notifications', 'ERROR') as logs:
+            dispatcher.write(batch)
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn(str(self.tweet.pk + 1000), logs.output[0])
+        self.assertEqual(sorted(Notification.objects.values_list('notification_type', 'actor_count')),
+                         [('follow', 1), ('like', 1)])
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False}, COMMENT_THREADS={'MAX_DEPTH': 2, 'REPLY_LIMIT': 2},
+                   NOTIFICATIONS={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CommentThreadTests(TestCase):
+    """Threads render two levels of replies and two replies per comment, the rest behind replies_next."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        cls.tweet = Tweet.objects.create(user=cls.user, content="Hello")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def comment(self, parent=None, tweet=None):
+        return Comment.objects.create(user=self.user, tweet=tweet or self.tweet, parent=parent, content="Hi")
+
+    def chain(self, length, parent=None):
+        comments = [self.comment(parent)]
+        for _ in range(length - 1):
+            comments.append(self.comment(comments[-1]))
+        return comments
+
+    def comments(self):
+        response = self.client.get(reverse('comment-list', args=[self.tweet.pk]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_one_query_for_every_level_of_replies(self):
+        self.chain(2)
+        with CaptureQueriesContext(connection) as shallow:
+            self.comments()
+        self.chain(6)
+        with CaptureQueriesContext(connection) as deep:
+            self.assertEqual(len(self.comments()), 2)
+        self.assertEqual(len(deep), len(shallow))
+
+    def test_loader_fetches_every_subtree_at_once(self):
+        first, second = self.chain(4), self.chain(3)
+        other_tweet = Tweet.objects.create(user=self.user, content="Elsewhere")
+        self.chain(2, parent=self.comment(tweet=other_tweet))
+
+        with self.assertNumQueries(1):
+            thread = CommentThread.load([first[0], second[0]])
+        self.assertEqual([reply.pk for reply in thread.replies_for(first[1])], [first[2].pk])
+        self.assertEqual([reply.pk for reply in thread.replies_for(second[0])], [second[1].pk])
+        self.assertEqual(sum(len(replies) for replies in thread.children.values()), 5)
+
+    def test_depth_limit_links_to_the_rest(self):
+        _, _, nested, deepest = self.chain(4)
+        [rendered] = self.comments()
+        rendered_nested = rendered['replies'][0]['replies'][0]
+        self.assertEqual(rendered_nested['id'], nested.pk)
+        self.assertEqual(rendered_nested['replies'], [])
+        self.assertEqual(rendered_nested['replies_count'], 1)
+        self.assertTrue(rendered_nested['replies_next'].endswith(reverse('comment-replies', args=[nested.pk])))
+
+        response = self.client.get(rendered_nested['replies_next'])
+        self.assertEqual([comment['id'] for comment in response.json()['results']], [deepest.pk])
+
+    def test_reply_limit_links_to_the_next_replies(self):
+        top = self.comment()
+        replies = [self.comment(top) for _ in range(3)]
+        [rendered] = self.comments()
+        self.assertEqual([reply['id'] for reply in rendered['replies']], [reply.pk for reply in replies[:2]])
+        self.assertEqual(rendered['replies_count'], 3)
+        self.assertIsNotNone(rendered['replies_next'])
+
+        response = self.client.get(rendered['replies_next'])
+        self.assertEqual([comment['id'] for comment in response.json()['results']], [replies[2].pk])
+
+    def test_no_link_when_everything_is_rendered(self):
+        self.chain(2)
+        [rendered] = self.comments()
+        self.assertIsNone(rendered['replies_next'])
+        self.assertIsNone(rendered['replies'][0]['replies_next'])
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False}, NOTIFICATIONS={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CommentPathTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        cls.tweet = Tweet.objects.create(user=cls.user, content="Hello")
+        cls.other_tweet = Tweet.objects.create(user=cls.user, content="Elsewhere")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def comment(self, parent=None, tweet=None):
+        return Comment.objects.create(user=self.user, tweet=tweet or self.tweet, parent=parent, content="Hi")
+
+    def test_path_is_the_chain_of_ids(self):
+        top = self.comment()
+        reply = self.comment(top)
+        nested = self.comment(reply)
+
+        self.assertEqual(top.path, Comment.path_segment(top.pk))
+        self.assertEqual(nested.path, ''.join(Comment.path_segment(c.pk) for c in (top, reply, nested)))
+        self.assertEqual(Comment.objects.get(pk=nested.pk).path, nested.path)
+        self.assertEqual([top.depth, reply.depth, nested.depth], [0, 1, 2])
+        self.assertEqual(nested.ancestor_ids(), [top.pk, reply.pk])
+        self.assertEqual(list(nested.ancestors()), [top, reply])
+
+    def test_descendants_stay_within_the_subtree(self):
+        top = self.comment()
+        reply = self.comment(top)
+        nested = self.comment(reply)
+        sibling = self.comment(top)
+        self.comment(sibling)
+        self.comment()  # Next top-level comment, whose id follows the subtree's
+
+        self.assertEqual(set(reply.descendants()), {nested})
+        self.assertEqual(top.descendants_count(), 4)
+
+    def test_reply_through_the_api_extends_the_parent_path(self):
+        top = self.comment()
+        response = self.client.post(reverse('comment-list', args=[self.tweet.pk]),
+                                    {'content': "Reply", 'parent': top.pk})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Comment.objects.get(pk=response.json()['id']).path,
+                         top.path + Comment.path_segment(response.json()['id']))
+
+    def test_parent_from_another_tweet_is_rejected(self):
+        elsewhere = self.comment(tweet=self.other_tweet)
+        response = self.client.post(reverse('comment-list', args=[self.tweet.pk]),
+                                    {'content': "Reply", 'parent': elsewhere.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Comment.objects.filter(tweet=self.tweet).exists())
+
+    def test_comment_cannot_move_to_another_parent(self):
+        top, other = self.comment(), self.comment()
+        reply = self.comment(top)
+        response = self.client.patch(reverse('comment-detail', args=[reply.pk]), {'parent': other.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Comment.objects.get(pk=reply.pk).path, reply.path)
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False}, NOTIFICATIONS={'ASYNC': False},
+                   TIMELINE={'ASYNC': False, 'FANOUT_FOLLOWER_LIMIT': 3},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SeedAndBenchmarkTests(TestCase):
+    """A small seeded graph must look like one the API built, and every endpoint must serve it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.created = seed_social_graph(users=20, tweets=50, seed=1)
+
+    def test_created_counts_match_the_rows(self):
+        self.assertEqual(self.created['users'], User.objects.count())
+        self.assertEqual(self.created['tweets'], Tweet.objects.count())
+        self.assertEqual(self.created['comments'], Comment.objects.count())
+        self.assertEqual(self.created['timeline_entries'], TimelineEntry.objects.count())
+
+    def test_counters_match_the_rows(self):
+        for user in User.objects.annotate(followed_by=Count('followers', distinct=True),
+                                          follows=Count('following', distinct=True)):
+            self.assertEqual((user.followers_count, user.following_count), (user.followed_by, user.follows))
+        for tweet in Tweet.objects.annotate(likes_total=Count('likes', distinct=True),
+                                            comments_total=Count('comments', distinct=True)):
+            self.assertEqual((tweet.likes_count, tweet.comments_count), (tweet.likes_total, tweet.comments_total))
+
+    def test_comment_paths_extend_their_parents(self):
+        paths = dict(Comment.objects.values_list('pk', 'path'))
+        for comment_id, parent_id in Comment.objects.values_list('pk', 'parent_id'):
+            parent_path = paths[parent_id] if parent_id else ''
+            self.assertEqual(paths[comment_id], parent_path + Comment.path_segment(comment_id))
+
+    def test_timelines_hold_what_fan_out_would_have_written(self):
+        expected = {
+            (follower_id, tweet.pk)
+            for tweet in Tweet.objects.select_related('user') if tweet.user.followers_count <= 3
+            for follower_id in tweet.user.followers.values_list('pk', flat=True)
+        }
+        self.assertEqual(set(TimelineEntry.objects.values_list('user_id', 'tweet_id')), expected)
+
+    def test_feed_merges_both_kinds_of_author(self):
+        reader = User.objects.order_by('-following_count', 'id').first()
+        followed = reader.followers.model.objects.filter(followers=reader)
+        self.assertTrue(any(author.followers_count > 3 for author in followed))
+        expected = list(Tweet.objects.filter(user__in=followed).order_by('-created_at', '-id')
+                        .values_list('pk', flat=True)[:20])
+
+        client = APIClient()
+        client.force_authenticate(reader)
+        response = client.get(reverse('personalized-feed'))
+        self.assertEqual([tweet['id'] for tweet in response.json()['results']], expected)
+
+    def test_every_endpoint_serves_the_seeded_graph(self):
+        targets = benchmark_targets()
+        self.assertIn('personalized-feed', [target.name for target in targets])
+        for target in targets:
+            result = benchmark_endpoint(target, iterations=2, warmup=1)
+            self.assertEqual(result['status'], 200, target.url)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_benchmark_command_writes_comparable_results(self):
+        command = 'tweets.management.commands.benchmark_api'
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch(f'{command}.setup_test_environment'), mock.patch(f'{command}.teardown_test_environment'):
+            output = f'{directory}/results.json'
+            call_command('benchmark_api', iterations=2, warmup=0, output=output, stdout=StringIO())
+            stdout = StringIO()
+            call_command('benchmark_api', iterations=2, warmup=0, compare=output, stdout=stdout)
+            with open(output) as results:
+                endpoints = json.load(results)['endpoints']
+        self.assertIn('personalized-feed', endpoints)
+        self.assertIn('queries +0', stdout.getvalue())
+
+    def test_compare_results(self):
+        baseline = {'endpoints': {'feed': {'p95_ms': 10.0, 'queries': 4}, 'idle': {'p95_ms': 0, 'queries': 1},
+                                  'removed': {'p95_ms': 5.0, 'queries': 2}}}
+        current = {'endpoints': {'feed': {'p95_ms': 12.5, 'queries': 3}, 'idle': {'p95_ms': 1.0, 'queries': 1},
+                                 'added': {'p95_ms': 5.0, 'queries': 2}}}
+        self.assertEqual(compare_results(baseline, current), {
+            'feed': {'p95_change_pct': 25.0, 'queries_change': -1},
+            'idle': {'p95_change_pct': None, 'queries_change': 0},
+        })
+
+
+@override_settings(NOTIFICATIONS={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LikeTweetViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password123')
+        cls.fan = User.objects.create_user('fan', 'fan@example.com', 'password123')
+        cls.tweet = Tweet.objects.create(user=cls.author, content="Hello")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+        self.url = reverse('like-tweet', args=[self.tweet.pk])
+
+    def likes(self):
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, self.tweet.likes.count())  # Counter matches the rows
+        return self.tweet.likes_count
+
+    def test_repeated_put_likes_once(self):
+        response = self.client.put(self.url)
+        self.assertEqual((response.status_code, response.json()['changed']), (201, True))
+        response = self.client.put(self.url)
+        self.assertEqual((response.status_code, response.json()['changed']), (200, False))
+        self.assertEqual(self.likes(), 1)
+        self.assertEqual(Notification.objects.filter(user=self.author, notification_type='like').count(), 1)
+
+    def test_repeated_delete_unlikes_once(self):
+        self.client.put(self.url)
+        response = self.client.delete(self.url)
+        self.assertEqual((response.status_code, response.json()['changed']), (200, True))
+        response = self.client.delete(self.url)
+        self.assertEqual((response.status_code, response.json()['changed']), (200, False))
+        self.assertEqual(self.likes(), 0)
+
+    def test_post_toggles(self):
+        self.assertEqual(self.client.post(self.url).status_code, 201)
+        self.assertEqual(self.likes(), 1)
+        self.assertEqual(self.client.post(self.url).status_code, 200)
+        self.assertEqual(self.likes(), 0)
+
+    def test_missing_tweet(self):
+        url = reverse('like-tweet', args=[self.tweet.pk + 1000])
+        for method in (self.client.put, self.client.delete, self.client.post):
+            self.assertEqual(method(url).status_code, 404)
+        self.assertEqual(self.likes(), 0)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class MarkNotificationsAsReadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        cls.other = User.objects.create_user('other', 'other@example.com', 'password123')
+        tweet = Tweet.objects.create(user=cls.reader, content="Hello")
+        start = timezone.now() - timedelta(hours=1)
+        cls.notifications = []  # Oldest first
+        for minutes in range(4):
+            notification = Notification.objects.create(user=cls.reader, sender=cls.other, notification_type='like',
+                                                       tweet=tweet)
+            Notification.objects.filter(pk=notification.pk).update(created_at=start + timedelta(minutes=minutes))
+            notification.refresh_from_db()
+            cls.notifications.append(notification)
+        cls.foreign = Notification.objects.create(user=cls.other, sender=cls.reader, notification_type='follow')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def mark(self, data):
+        return self.client.post(reverse('mark-notifications-read'), data, format='json')
+
+    def unread(self):
+        response = self.client.get(reverse('unread-notification-count'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['unread_count']
+
+    def read_ids(self):
+        return set(Notification.objects.filter(is_read=True).values_list('pk', flat=True))
+
+    def test_all(self):
+        self.assertEqual(self.unread(), 4)
+        self.assertEqual(self.mark({'all': True}).json(), {'updated': 4})
+        self.assertEqual(self.unread(), 0)
+        self.assertEqual(self.read_ids(), {notification.pk for notification in self.notifications})
+
+    def test_ids(self):
+        chosen = [self.notifications[0].pk, self.notifications[2].pk]
+        self.assertEqual(self.mark({'ids': chosen}).json(), {'updated': 2})
+        self.assertEqual(self.read_ids(), set(chosen))
+        self.assertEqual(self.unread(), 2)
+
+    def test_ids_of_another_user_are_ignored(self):
+        self.assertEqual(self.mark({'ids': [self.foreign.pk, self.notifications[1].pk]}).json(), {'updated': 1})
+        self.assertEqual(self.read_ids(), {self.notifications[1].pk})
+
+    def test_cursor_marks_that_notification_and_everything_older(self):
+        cursor = KeysetCursorPagination().cursor_for_instance(self.notifications[2])
+        self.assertEqual(self.mark({'cursor': cursor}).json(), {'updated': 3})
+        self.assertEqual(self.read_ids(), {notification.pk for notification in self.notifications[:3]})
+        self.assertEqual(self.unread(), 1)
+
+    def test_invalid_cursor(self):
+        response = self.mark({'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json())
+        self.assertEqual(self.unread(), 4)
+
+    def test_exactly_one_mode(self):
+        self.assertEqual(self.mark({}).status_code, 400)
+        self.assertEqual(self.mark({'all': True, 'ids': [self.notifications[0].pk]}).status_code, 400)
+        self.assertEqual(self.unread(), 4)
+
+    def test_already_read_are_not_counted(self):
+        self.mark({'ids': [self.notifications[0].pk]})
+        self.assertEqual(self.mark({'all': True}).json(), {'updated': 3})
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': True, 'CACHE_ALIAS': 'default', 'TIMEOUT': 60},
+                   NOTIFICATIONS={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ResponseCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        cls.old_tweet = Tweet.objects.create(user=cls.user, content="Old")
+        cls.tweets = [Tweet.objects.create(user=cls.user, content=f"Tweet {i}") for i in range(3)]
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('tweet-list') + '?page_size=3'
+
+    def like(self, tweet):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('like-tweet', args=[tweet.pk]))
+
+    def test_like_outside_the_page_keeps_it_cached(self):
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        self.like(self.old_tweet)
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+
+    def test_like_on_the_page_refreshes_it(self):
+        self.client.get(self.url)
+        self.like(self.tweets[-1])
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['likes_count'], 1)
+
+    def test_unknown_query_parameters_share_the_entry(self):
+        self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url + '&utm_source=mail&_=1700000000')['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(reverse('tweet-list') + '?page_size=1000')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(reverse('tweet-list') + '?page_size=100')['X-Cache'], 'HIT')
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': True, 'CACHE_ALIAS': 'default', 'TIMEOUT': 60},
+                   NOTIFICATIONS={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        cls.tweet = Tweet.objects.create(user=cls.user, content="Hello")
+        cls.comment = Comment.objects.create(user=cls.user, tweet=cls.tweet, content="First")
+        cls.reply = Comment.objects.create(user=cls.user, tweet=cls.tweet, parent=cls.comment, content="Reply")
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, headers={'If-None-Match': etag})
+
+    def write(self, method, url, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url, data)
+
+    def test_cached_tweet_revalidates_without_queries(self):
+        url = reverse('tweet-detail', args=[self.tweet.pk])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_like_changes_the_tweet_etag(self):
+        url = reverse('tweet-detail', args=[self.tweet.pk])
+        etag = self.client.get(url)['ETag']
+        self.write('put', reverse('like-tweet', args=[self.tweet.pk]))
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['likes_count'], 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_edit_changes_the_tweet_etag(self):
+        url = reverse('tweet-detail', args=[self.tweet.pk])
+        etag = self.client.get(url)['ETag']
+        self.write('patch', url, {'content': "Hello again"})
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_tweet_etag_without_the_response_cache(self):
+        url = reverse('tweet-detail', args=[self.tweet.pk])
+        with self.settings(RESPONSE_CACHE={'ENABLED': False}):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.revalidate(url, etag).status_code, 304)
+            Tweet.objects.filter(pk=self.tweet.pk).update(comments_count=5)
+            self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_reply_edit_changes_the_comment_etags(self):
+        urls = [reverse('comment-list', args=[self.tweet.pk]), reverse('comment-detail', args=[self.comment.pk])]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.assertEqual([self.revalidate(url, etag).status_code for url, etag in zip(urls, etags)], [304, 304])
+
+        self.write('patch', reverse('comment-detail', args=[self.reply.pk]), {'content': "Edited"})
+        self.assertEqual([self.revalidate(url, etag).status_code for url, etag in zip(urls, etags)], [200, 200])
+
+    def test_comment_etags_come_from_a_shared_cache(self):
+        with tempfile.TemporaryDirectory() as location, self.settings(
+                CACHES={**settings.CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                      'LOCATION': location}},
+                RESPONSE_CACHE={'ENABLED': True, 'CACHE_ALIAS': 'shared', 'TIMEOUT': 60}):
+            url = reverse('comment-detail', args=[self.comment.pk])
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+            reply = {'content': "Another", 'parent': self.reply.pk}
+            self.write('post', reverse('comment-list', args=[self.tweet.pk]), reply)
+            self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SearchPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        contents = ["Django tips and django tricks", "Django release notes", "Django for beginners",
+                    "Learning django", "Flask only"] * 3
+        cls.tweets = [Tweet.objects.create(user=cls.user, content=content) for content in contents]
+
+    def setUp(self):
+        memory_index.__init__()
+        for tweet in self.tweets:
+            index_tweet(tweet)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_cover_every_match_once(self):
+        url = reverse('tweet-search') + '?q=django&page_size=2'
+        seen = []
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(tweet['id'] for tweet in page['results'])
+            url = page['next']
+        expected = {tweet.pk for tweet in self.tweets if 'django' in tweet.content.lower()}
+        self.assertEqual(len(seen), len(expected))
+        self.assertEqual(set(seen), expected)
+
+
+@override_settings(TRENDING={'SYNC_SECONDS': 0, 'CACHE_ALIAS': 'default'})
+class TrendingTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_workers_see_each_others_counts(self):
+        first, second = TrendingCounter('hashtags'), TrendingCounter('hashtags')
+        first.record('django')
+        second.record('django')
+        second.record('python')
+        self.assertEqual(first.trending(2), second.trending(2))
+        self.assertEqual(first.trending(2), [('django', 2), ('python', 1)])
+
+    def test_counts_survive_a_restart(self):
+        TrendingCounter('hashtags').record('django')
+        self.assertEqual(TrendingCounter('hashtags').trending(1), [('django', 1)])
+
+    @override_settings(TRENDING={'SYNC_SECONDS': 0, 'CACHE_ALIAS': 'default', 'CANDIDATES': 2})
+    def test_workers_publish_only_their_candidates(self):
+        first, second = TrendingCounter('hashtags'), TrendingCounter('hashtags')
+        for key, times in [('django', 3), ('python', 2), ('rust', 1), ('go', 1)]:
+            for _ in range(times):
+                first.record(key)
+        second.record('python')
+        second.record('python')
+
+        snapshot = caches['default'].get(first._cache_key(f'worker:{first.worker_id}'))
+        self.assertEqual(set(snapshot), {'django', 'python'})
+        self.assertEqual(second.trending(2), [('python', 4), ('django', 3)])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EventStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+
+    def test_refused_under_wsgi(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = Client().get(reverse('event-stream'), headers=headers)
+        self.assertEqual(response.status_code, 501)
+
+    async def test_streams_under_asgi(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = await AsyncClient().get(reverse('event-stream'), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        await stream.aclose()
+
+    async def test_ticket_opens_one_stream(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        ticket = (await sync_to_async(client.post)(reverse('event-stream-ticket'))).json()['ticket']
+        url = f"{reverse('event-stream')}?ticket={ticket}"
+
+        response = await AsyncClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        await aiter(response.streaming_content).aclose()
+        self.assertEqual((await AsyncClient().get(url)).status_code, 401)
+
+    async def test_access_token_is_not_accepted_in_the_url(self):
+        url = f"{reverse('event-stream')}?token={AccessToken.for_user(self.user)}"
+        self.assertEqual((await AsyncClient().get(url)).status_code, 401)
+
+
+class FakeRedis:
+    """The slice of redis-py the broker uses (pub/sub, sorted sets), shared in memory by brokers handed this client."""
+
+    def __init__(self):
+        self.channels = {}
+        self.sorted_sets = {}
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append(message)
+        for inbox in self.channels.get(channel, ()):
+            inbox.put({'type': 'message', 'channel': channel, 'data': message.encode()})
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+    def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update({str(member): score for member, score in mapping.items()})
+
+    def zmscore(self, key, members):
+        scores = self.sorted_sets.get(key, {})
+        return [scores.get(str(member)) for member in members]
+
+    def zremrangebyscore(self, key, low, high):
+        scores = self.sorted_sets.get(key, {})
+        for member in [member for member, score in scores.items() if score <= high]:
+            del scores[member]
+
+
+class FakePubSub:
+
+    def __init__(self, server):
+        self.server = server
+        self.inbox = queue.Queue()
+
+    def subscribe(self, channel):
+        self.server.channels.setdefault(channel, []).append(self.inbox)
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.inbox.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class RedisBrokerTests(TestCase):
+
+    async def listed(self, broker, user_ids):
+        """What `broker` sees as listening once the other process's listener has announced its streams."""
+        for _ in range(50):
+            listening = await sync_to_async(broker.listening)(user_ids)
+            if listening:
+                return listening
+            await asyncio.sleep(0.1)
+        return set()
+
+    def test_nobody_listening_without_streams(self):
+        self.assertEqual(RedisBroker(client=FakeRedis()).listening([7, 8]), set())
+
+    async def test_frames_reach_a_stream_held_by_another_process_in_one_message(self):
+        server = FakeRedis()
+        streaming, publishing = RedisBroker(client=server), RedisBroker(client=server)
+        subscription = streaming.subscribe(7)
+        self.assertEqual(await self.listed(publishing, [7, 8]), {7})
+
+        frames = [format_event('tweet', {'id': 1}), format_event('tweet', {'id': 2})]
+        publishing.publish_many([([7, 8], frame) for frame in frames])
+        self.assertEqual(len(server.published), 1)
+        self.assertEqual([await subscription.get(5), await subscription.get(5)], frames)
+        subscription.close()
+
+    def test_expired_streams_are_not_listening(self):
+        server = FakeRedis()
+        broker = RedisBroker(client=server)
+        server.zadd(broker._presence_key(), {7: time.time() - 1, 8: time.time() + 60})
+        self.assertEqual(broker.listening([7, 8]), {8})
@@ -0,0 +1,72 @@
+"""
+Comment thread loading.
+
+All replies under a set of comments are fetched in a single query (one
+materialized-path range per comment) and grouped by parent in one pass, so
+serializing a thread costs the same number of queries however deep or wide
+it is. Rendering is bounded by ``COMMENT_THREADS['MAX_DEPTH']`` levels and
+``COMMENT_THREADS['REPLY_LIMIT']`` replies per comment; anything cut off is
+reachable through the comment's ``replies_next`` link.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Comment
+
+COMMENT_THREADS_DEFAULTS = {
+    'MAX_DEPTH': 5,  # Levels of replies rendered under a top-level comment
+    'REPLY_LIMIT': 10,  # Replies rendered per comment before paginating
+}
+
+THREAD_ORDERING = ('created_at', 'id')  # Oldest first, also the cursor ordering of comment lists
+
+
+def thread_setting(name):
+    """Read a COMMENT_THREADS setting, falling back to the defaults above."""
+    return getattr(settings, 'COMMENT_THREADS', {}).get(name, COMMENT_THREADS_DEFAULTS[name])
+
+
+class CommentThread:
+    """The reply subtrees of a set of comments, grouped by parent comment."""
+
+    def __init__(self, roots, replies):
+        self.root_paths = [root.path for root in roots]
+        self.children = defaultdict(list)
+        for reply in replies:  # Already in (created_at, id) order
+            self.children[reply.parent_id].append(reply)
+
+    @classmethod
+    def load(cls, comments):
+        """Load every reply below the given comments, at any depth, in one query."""
+        roots = list(comments)
+        if not roots:
+            return cls(roots, [])
+        subtrees = Q()
+        for root in roots:
+            low, high = root.subtree_bounds()
+            subtrees |= Q(path__gt=low, path__lt=high)
+        replies = Comment.objects.filter(subtrees).select_related('user').order_by(*THREAD_ORDERING)
+        return cls(roots, replies)
+
+    def covers(self, comment):
+        return any(comment.path.startswith(path) for path in self.root_paths)
+
+    def replies_for(self, comment):
+        return self.children.get(comment.id, [])
+
+
+class CommentThreadMixin:
+    """Generic view mixin that loads the reply tree for the page being served."""
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        self.comment_thread = CommentThread.load(page if page is not None else queryset)
+        return page
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if getattr(self, 'comment_thread', None) is not None:
+            context['thread'] = self.comment_thread
+        return context
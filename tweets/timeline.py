@@ -0,0 +1,196 @@
+"""
+Fan-out-on-write home timelines.
+
+Every tweet is copied into a ``TimelineEntry`` row for each follower when it is
+posted, so reading the feed is a single range scan over the reader's entries.
+Authors with more followers than ``TIMELINE['FANOUT_FOLLOWER_LIMIT']`` are
+skipped at write time; their tweets are merged into the feed at read time
+instead, so one celebrity post never turns into millions of inserts. When
+such an author drops back to the limit, the tweets they posted in the
+meantime are copied to their followers; when one goes over it, the cached set
+of read-time authors is dropped so their next tweet is merged right away.
+
+Fan-out runs on a background queue once the tweet is committed, so posting
+costs the author one insert however many followers they have. Set
+``TIMELINE['ASYNC'] = False`` to fan out inline (tests, management commands).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Exists, F, FilteredRelation, OuterRef, Q
+from django.db.models.functions import Coalesce
+
+from users.graph_cache import following_ids
+
+from .background import BackgroundQueue
+from .models import Tweet, TimelineEntry
+from .push import push_tweet
+
+TIMELINE_DEFAULTS = {
+    'ASYNC': True,  # Fan out from a background thread instead of inside the request
+    'FANOUT_FOLLOWER_LIMIT': 10000,  # Above this, tweets are merged at read time
+    'BACKFILL_SIZE': 200,  # Recent tweets copied into a timeline on follow
+    'BATCH_SIZE': 1000,  # Rows per bulk insert during fan-out
+    'FANOUT_ON_READ_CACHE_TIMEOUT': 60,  # Seconds the set of read-time authors is cached
+}
+
+FANOUT_ON_READ_CACHE_KEY = 'timeline:fanout-on-read-authors'
+
+
+def timeline_setting(name):
+    """Read a TIMELINE setting, falling back to the defaults above."""
+    return getattr(settings, 'TIMELINE', {}).get(name, TIMELINE_DEFAULTS[name])
+
+
+def is_fanout_on_read(author):
+    """Return True if the author's tweets are too widely followed to fan out on write."""
+    return author.followers_count > timeline_setting('FANOUT_FOLLOWER_LIMIT')
+
+
+def fan_out_tweet(tweet):
+    """Push a newly created tweet into the timeline of every follower of its author."""
+    if is_fanout_on_read(tweet.user):
+        return 0
+
+    follower_ids = tweet.user.followers.values_list('id', flat=True)
+    batch_size = timeline_setting('BATCH_SIZE')
+    written = 0
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=batch_size):
+        batch.append(TimelineEntry(user_id=follower_id, tweet=tweet, author_id=tweet.user_id,
+                                   created_at=tweet.created_at))
+        if len(batch) >= batch_size:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            push_tweet(tweet, [entry.user_id for entry in batch])
+            written += len(batch)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        push_tweet(tweet, [entry.user_id for entry in batch])
+        written += len(batch)
+    return written
+
+
+class FanOutQueue(BackgroundQueue):
+    """Fans out queued tweet ids, one tweet at a time."""
+    thread_name = 'timeline-fan-out'
+
+    def is_async(self):
+        return timeline_setting('ASYNC')
+
+    def handle(self, batch):
+        for tweet in Tweet.objects.select_related('user').filter(pk__in=batch):  # Skips tweets deleted meanwhile
+            fan_out_tweet(tweet)
+
+
+fan_out_queue = FanOutQueue()
+
+
+def schedule_fan_out(tweet):
+    """Fan a new tweet out once it is committed, off the request path."""
+    fan_out_queue.put(tweet.pk)
+
+
+def add_follow(follower, followee):
+    """Bring the follower's timeline up to date after a new follow."""
+    followee.refresh_from_db(fields=['followers_count'])
+    if is_fanout_on_read(followee):
+        served_on_read = cache.get(FANOUT_ON_READ_CACHE_KEY)
+        if served_on_read is not None and followee.pk not in served_on_read:
+            # This follow took them over the limit; their next tweets are only reachable through the merge.
+            cache.delete(FANOUT_ON_READ_CACHE_KEY)
+    return backfill_follow(follower, followee)
+
+
+def backfill_follow(follower, followee):
+    """Copy the followee's most recent tweets into the follower's timeline."""
+    if is_fanout_on_read(followee):
+        return 0
+
+    recent = followee.tweets.order_by('-created_at', '-id').values_list('id', 'created_at')
+    entries = [
+        TimelineEntry(user=follower, tweet_id=tweet_id, author=followee, created_at=created_at)
+        for tweet_id, created_at in recent[:timeline_setting('BACKFILL_SIZE')]
+    ]
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+
+def backfill_followers(author):
+    """Copy the author's recent tweets that were never fanned out into the timelines of all their followers."""
+    missing = (
+        author.tweets.filter(~Exists(TimelineEntry.objects.filter(tweet=OuterRef('pk'))))
+        .order_by('-created_at', '-id').values_list('id', 'created_at')
+    )
+    tweets = list(missing[:timeline_setting('BACKFILL_SIZE')])
+    if not tweets:
+        return 0
+
+    batch_size = timeline_setting('BATCH_SIZE')
+    written = 0
+    batch = []
+    for follower_id in author.followers.values_list('id', flat=True).iterator(chunk_size=batch_size):
+        batch.extend(TimelineEntry(user_id=follower_id, tweet_id=tweet_id, author=author, created_at=created_at)
+                     for tweet_id, created_at in tweets)
+        if len(batch) >= batch_size:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            written += len(batch)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        written += len(batch)
+    return written
+
+
+def remove_follow(follower, followee):
+    """Drop the followee's tweets from the follower's timeline after an unfollow."""
+    deleted, _ = TimelineEntry.objects.filter(user=follower, author=followee).delete()
+    followee.refresh_from_db(fields=['followers_count'])
+    if followee.followers_count == timeline_setting('FANOUT_FOLLOWER_LIMIT'):
+        # This unfollow moved them back to fan-out on write; their read-time tweets are not in any timeline yet.
+        backfill_followers(followee)
+        cache.delete(FANOUT_ON_READ_CACHE_KEY)
+    return deleted
+
+
+def rebuild_timeline(user):
+    """Rebuild a user's timeline from scratch out of the accounts they follow."""
+    TimelineEntry.objects.filter(user=user).delete()
+    for followee in user.following.all():
+        backfill_follow(user, followee)
+
+
+def fanout_on_read_author_ids():
+    """Ids of all accounts served on read; there are few of them, so the set is cached globally."""
+    ids = cache.get(FANOUT_ON_READ_CACHE_KEY)
+    if ids is None:
+        ids = frozenset(
+            get_user_model().objects.filter(followers_count__gt=timeline_setting('FANOUT_FOLLOWER_LIMIT'))
+            .values_list('id', flat=True)
+        )
+        cache.set(FANOUT_ON_READ_CACHE_KEY, ids, timeline_setting('FANOUT_ON_READ_CACHE_TIMEOUT'))
+    return ids
+
+
+def feed_queryset(user):
+    """
+    Tweets for the user's home feed, newest first by ``feed_at``/``feed_tweet``.
+
+    Fanned-out tweets come from the user's timeline rows and are ordered by the
+    rows' own columns, so a page is one range scan of
+    ``timeline_user_recent_idx``. Tweets by followed accounts that are served
+    on read are merged into the same query.
+    """
+    fanout_on_read_ids = fanout_on_read_author_ids() & following_ids(user)
+
+    if not fanout_on_read_ids:
+        queryset = Tweet.objects.filter(timeline_entries__user=user).annotate(
+            feed_at=F('timeline_entries__created_at'), feed_tweet=F('timeline_entries__tweet_id'),
+        )
+    else:
+        queryset = Tweet.objects.annotate(
+            entry=FilteredRelation('timeline_entries', condition=Q(timeline_entries__user=user)),
+        ).filter(Q(entry__isnull=False) | Q(user_id__in=fanout_on_read_ids)).annotate(
+            feed_at=Coalesce(F('entry__created_at'), F('created_at')), feed_tweet=F('id'),
+        )
+    return queryset.order_by('-feed_at', '-feed_tweet')
@@ -0,0 +1,232 @@
+"""
+Trending hashtags and tweets, counted as they are written.
+
+Every posted hashtag and every like bumps a counter in the current time
+bucket. Each bucket is a count-min sketch (fixed memory however many keys
+show up), buckets older than the window are dropped, and a key's score is
+its count in each bucket decayed by the bucket's age. Scores only change
+when a key is counted or a new bucket starts, so a bounded set of the
+highest-scoring candidates is maintained in a min-heap as counts arrive and
+reading the top K never touches the database or sorts all keys.
+
+Each worker counts in its own memory and, at most every ``SYNC_SECONDS``,
+publishes its candidates with their count in each bucket to the shared cache
+(``TRENDING['CACHE_ALIAS']``): at most ``CANDIDATES`` keys, whatever the
+sketch size. ``/trends/`` adds up every worker's counts per key and bucket and
+ranks the result, so a merge costs candidates x workers rather than whole
+sketches. A key only counts on the workers where it is a candidate; one that
+trends overall is a candidate almost everywhere. Snapshots outlive a
+restarted worker for one window, so a deploy does not wipe the rankings. With
+a per-process cache (locmem) each worker only sees its own counts.
+"""
+import hashlib
+import heapq
+import threading
+import time
+import uuid
+from array import array
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .entities import extract_hashtags
+
+TRENDING_DEFAULTS = {
+    'BUCKET_SECONDS': 300,  # Width of one counting bucket
+    'WINDOW_BUCKETS': 12,  # Buckets kept; counts older than BUCKET_SECONDS * WINDOW_BUCKETS are forgotten
+    'HALF_LIFE': 1800,  # Seconds after which a count weighs half as much
+    'TOP_K': 10,  # Entries served by the trends endpoint
+    'CANDIDATES': 200,  # Highest-scoring keys tracked per counter
+    'SKETCH_WIDTH': 2048,  # Counters per sketch row; more means fewer overestimates
+    'SKETCH_DEPTH': 4,  # Sketch rows, each with its own hash
+    'CACHE_ALIAS': 'default',  # Where workers publish their counts; should be shared by all of them
+    'SYNC_SECONDS': 5,  # Most seconds between publishing a worker's counts and re-merging everyone's
+}
+
+
+def trending_setting(name):
+    """Read a TRENDING setting, falling back to the defaults above."""
+    return getattr(settings, 'TRENDING', {}).get(name, TRENDING_DEFAULTS[name])
+
+
+class CountMinSketch:
+    """Approximate counts in fixed memory; estimates are never below the true count."""
+
+    def __init__(self, width, depth):
+        self.width = width
+        self.rows = [array('q', bytes(8 * width)) for _ in range(depth)]
+
+    def _slots(self, key):
+        # Stable across runs, unlike hash() with randomized string hashing.
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+        for number, row in enumerate(self.rows):
+            yield row, (first + number * second) % self.width
+
+    def add(self, key, amount=1):
+        for row, slot in self._slots(key):
+            row[slot] += amount
+
+    def estimate(self, key):
+        return min(row[slot] for row, slot in self._slots(key))
+
+
+class TopK:
+    """The highest-scoring keys offered so far, at most `capacity` of them."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.scores = {}
+        self.heap = []  # (score, key); entries whose score has since changed are skipped
+        self._ranking = None
+
+    def _drop_stale(self):
+        while self.heap and self.scores.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def offer(self, key, score):
+        if key not in self.scores and len(self.scores) >= self.capacity:
+            self._drop_stale()
+            if score <= self.heap[0][0]:
+                return
+            _, evicted = heapq.heappop(self.heap)
+            del self.scores[evicted]
+        self.scores[key] = score
+        heapq.heappush(self.heap, (score, key))
+        if len(self.heap) > 4 * self.capacity:
+            self.replace(self.scores)
+        self._ranking = None
+
+    def replace(self, scores):
+        """Start over from a full set of rescored candidates, dropping those that reached zero."""
+        self.scores = {key: score for key, score in scores.items() if score > 0}
+        self.heap = [(score, key) for key, score in self.scores.items()]
+        heapq.heapify(self.heap)
+        self._ranking = None
+
+    def ranking(self, k):
+        """[(key, score)] best first; reused until the next change."""
+        if self._ranking is None:
+            self._ranking = sorted(self.scores.items(), key=itemgetter(1), reverse=True)
+        return self._ranking[:k]
+
+
+class TrendingCounter:
+    """Time-bucketed count-min sketches with a decayed top-K over them, merged across workers through the cache."""
+
+    def __init__(self, name):
+        self.name = name
+        self.worker_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self.buckets = {}  # bucket number -> CountMinSketch
+        self.current = None
+        self.top = TopK(trending_setting('CANDIDATES'))
+        self._published_at = float('-inf')
+        self._merged = None  # (time, bucket, TopK) of the last merge of every worker's counts
+
+    def _new_sketch(self):
+        return CountMinSketch(trending_setting('SKETCH_WIDTH'), trending_setting('SKETCH_DEPTH'))
+
+    @staticmethod
+    def _decayed(counts, current):
+        """Score of {bucket number: count}, each count weighed by its bucket's age."""
+        decay = 0.5 ** (trending_setting('BUCKET_SECONDS') / trending_setting('HALF_LIFE'))
+        return round(sum(count * decay ** (current - number) for number, count in counts.items()), 6)
+
+    def _counts(self, key):
+        """{bucket number: estimated count} of a key in this worker's buckets."""
+        return {number: count for number, sketch in self.buckets.items() if (count := sketch.estimate(key))}
+
+    def _score(self, key):
+        return self._decayed(self._counts(key), self.current)
+
+    def _advance(self, now):
+        """Move to the bucket containing `now`, expiring old buckets and rescoring candidates."""
+        number = int(now // trending_setting('BUCKET_SECONDS'))
+        if self.current is not None and number <= self.current:
+            return
+        self.current = number
+        oldest = number - trending_setting('WINDOW_BUCKETS') + 1
+        self.buckets = {n: sketch for n, sketch in self.buckets.items() if n >= oldest}
+        self.top.replace({key: self._score(key) for key in self.top.scores})
+
+    # -------------------------- SHARING --------------------------
+
+    def _cache_key(self, suffix):
+        return f'trending:v2:{self.name}:{suffix}'  # v2: snapshot layout; workers on older code keep to their own keys
+
+    def _window_seconds(self):
+        return trending_setting('BUCKET_SECONDS') * trending_setting('WINDOW_BUCKETS')
+
+    def _publish(self, now, force=False):
+        """Store this worker's snapshot and make sure the worker is listed; call with the lock held."""
+        if not force and now - self._published_at < trending_setting('SYNC_SECONDS'):
+            return
+        self._published_at = now
+        cache = caches[trending_setting('CACHE_ALIAS')]
+        snapshot = {key: self._counts(key) for key in self.top.scores}  # key -> {bucket number: count}
+        cache.set(self._cache_key(f'worker:{self.worker_id}'), snapshot, self._window_seconds())
+        # Read-modify-write: a registration lost to a concurrent writer is repaired by the next publish.
+        workers = cache.get(self._cache_key('workers')) or {}
+        workers = {worker: seen for worker, seen in workers.items() if now - seen < self._window_seconds()}
+        workers[self.worker_id] = now
+        cache.set(self._cache_key('workers'), workers, self._window_seconds())
+
+    def _merge(self):
+        """Ranking of every live worker's candidates, their counts added up per bucket."""
+        cache = caches[trending_setting('CACHE_ALIAS')]
+        workers = cache.get(self._cache_key('workers')) or {}
+        snapshots = cache.get_many([self._cache_key(f'worker:{worker}') for worker in workers]).values()
+
+        oldest = self.current - trending_setting('WINDOW_BUCKETS') + 1
+        totals = {}  # key -> {bucket number: count}
+        for snapshot in snapshots:
+            for key, counts in snapshot.items():
+                merged = totals.setdefault(key, {})
+                for number, count in counts.items():
+                    if number >= oldest:
+                        merged[number] = merged.get(number, 0) + count
+        top = TopK(trending_setting('CANDIDATES'))
+        top.replace({key: self._decayed(counts, self.current) for key, counts in totals.items()})
+        return top
+
+    # -------------------------- API --------------------------
+
+    def record(self, key, amount=1):
+        with self._lock:
+            now = time.time()
+            self._advance(now)
+            sketch = self.buckets.get(self.current)
+            if sketch is None:
+                sketch = self.buckets[self.current] = self._new_sketch()
+            sketch.add(key, amount)
+            self.top.offer(key, self._score(key))
+            self._publish(now)
+
+    def trending(self, k):
+        """The top `k` keys right now across all workers, as [(key, score)]."""
+        with self._lock:
+            now = time.time()
+            self._advance(now)
+            merged_at, bucket, top = self._merged or (float('-inf'), None, None)
+            if now - merged_at >= trending_setting('SYNC_SECONDS') or bucket != self.current:
+                self._publish(now, force=True)
+                top = self._merge()
+                self._merged = (now, self.current, top)
+            return top.ranking(k)
+
+
+hashtag_trends = TrendingCounter('hashtags')
+tweet_trends = TrendingCounter('tweets')
+
+
+def record_tweet(tweet):
+    """Count the hashtags of a newly posted tweet."""
+    for name in extract_hashtags(tweet.content):
+        hashtag_trends.record(name)
+
+
+def record_like(tweet_id):
+    """Count a like towards the tweet's engagement velocity."""
+    tweet_trends.record(tweet_id)
@@ -1,14 +1,26 @@
 from django.urls import path
-from .views import TweetListCreateView, TweetDetailView, LikeTweetView, CommentListCreateView, CommentDetailView, \
-    PersonalizedFeedView, NotificationListView, MarkNotificationAsReadView
+from .push import event_stream
+from .views import TweetListCreateView, TweetDetailView, TweetSearchView, HashtagTweetListView, TrendsView, \
+    LikeTweetView, CommentListCreateView, CommentDetailView, CommentReplyListView, PersonalizedFeedView, \
+    NotificationListView, MarkNotificationAsReadView, MarkNotificationsAsReadView, UnreadNotificationCountView, \
+    StreamTicketView, ResponseCacheStatsView
 
 urlpatterns = [
     path('tweets/', TweetListCreateView.as_view(), name='tweet-list'),
+    path('tweets/search/', TweetSearchView.as_view(), name='tweet-search'),
     path('tweets/<int:pk>/', TweetDetailView.as_view(), name='tweet-detail'),
+    path('hashtags/<str:name>/', HashtagTweetListView.as_view(), name='hashtag-tweets'),
+    path('trends/', TrendsView.as_view(), name='trends'),
+    path('events/', event_stream, name='event-stream'),
+    path('events/ticket/', StreamTicketView.as_view(), name='event-stream-ticket'),
     path('tweets/<int:tweet_id>/like/', LikeTweetView.as_view(), name='like-tweet'),
     path('tweets/<int:tweet_id>/comments/', CommentListCreateView.as_view(), name='comment-list'),
     path('comments/<int:pk>/', CommentDetailView.as_view(), name='comment-detail'),
+    path('comments/<int:pk>/replies/', CommentReplyListView.as_view(), name='comment-replies'),
     path('feed/', PersonalizedFeedView.as_view(), name='personalized-feed'),
     path('notifications/', NotificationListView.as_view(), name='notifications'),
+    path('notifications/read/', MarkNotificationsAsReadView.as_view(), name='mark-notifications-read'),
+    path('notifications/unread-count/', UnreadNotificationCountView.as_view(), name='unread-notification-count'),
     path('notifications/<int:notification_id>/read/', MarkNotificationAsReadView.as_view(), name='mark-notification-read'),
+    path('cache/stats/', ResponseCacheStatsView.as_view(), name='response-cache-stats'),
 ]
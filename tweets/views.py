@@ -1,88 +1,184 @@
+from django.db.models import Count, F, Max, Q
 from rest_framework import status
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView, ListAPIView
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Tweet, Like, Comment, Notification
-from .serializers import TweetSerializer, CommentSerializer, NotificationSerializer
+from .conditional import ConditionalGetMixin
+from .counters import adjust_comments_count
+from .entities import process_tweet_entities
+from .eager_loading import EagerLoadingMixin
+from .likes import like_tweet, unlike_tweet
+from .models import Tweet, Comment, Notification
+from .notifications import notify
+from .pagination import KeysetCursorPagination
+from .push import issue_ticket, push_setting
+from .response_cache import CachedResponseMixin, comment_namespaces, invalidate, stats, tweet_namespaces
+from .search import SEARCH_ORDERING, index_tweet, search_tweets, unindex_tweet
+from .serializers import TweetSerializer, CommentSerializer, NotificationSerializer, NotificationReadSerializer
+from .threads import THREAD_ORDERING, CommentThreadMixin
+from .timeline import feed_queryset, schedule_fan_out
+from .trending import hashtag_trends, record_tweet, trending_setting, tweet_trends
 
 
 # -------------------------- TWEETS CRUD --------------------------
 
-class TweetListCreateView(ListCreateAPIView):
+class TweetListCreateView(CachedResponseMixin, EagerLoadingMixin, ListCreateAPIView):
     """Allows users to view all tweets and post new ones."""
-    queryset = Tweet.objects.all().order_by('-created_at')
+    queryset = Tweet.objects.all().order_by('-created_at', '-id')
     serializer_class = TweetSerializer
     permission_classes = [IsAuthenticated]
+    cache_endpoint = 'tweet-list'
+
+    def get_cache_namespaces(self):
+        return ['tweet-list']
+
+    def get_content_namespaces(self, data):
+        return [f"tweet:{tweet['id']}" for tweet in data['results']]
 
     def perform_create(self, serializer):
-        """Assign the logged-in user to the tweet."""
-        serializer.save(user=self.request.user)
+        """Assign the logged-in user to the tweet and push it to followers' timelines."""
+        tweet = serializer.save(user=self.request.user)
+        index_tweet(tweet)
+        process_tweet_entities(tweet)
+        record_tweet(tweet)
+        schedule_fan_out(tweet)
+        invalidate('tweet-list')
 
 
-class TweetDetailView(RetrieveUpdateDestroyAPIView):
+class TweetDetailView(CachedResponseMixin, ConditionalGetMixin, EagerLoadingMixin, RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a specific tweet."""
     queryset = Tweet.objects.all()
     serializer_class = TweetSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    cache_endpoint = 'tweet-detail'
+
+    def get_cache_namespaces(self):
+        return [f"tweet:{self.kwargs['pk']}"]
+
+    def get_etag_namespaces(self):
+        return self.get_cache_namespaces()
+
+    def get_etag_parts(self):
+        return Tweet.objects.filter(pk=self.kwargs['pk']).values_list(
+            'updated_at', 'likes_count', 'comments_count', 'user__username').first()
 
     def perform_update(self, serializer):
         """Ensure only the tweet owner can edit."""
         if self.get_object().user != self.request.user:
             raise PermissionDenied("You can only edit your own tweets.")
         serializer.save()
+        index_tweet(serializer.instance)
+        process_tweet_entities(serializer.instance)
+        invalidate(*tweet_namespaces(serializer.instance.pk))
 
     def perform_destroy(self, instance):
         """Ensure only the tweet owner can delete."""
         if instance.user != self.request.user:
             raise PermissionDenied("You can only delete your own tweets.")
+        invalidate(*tweet_namespaces(instance.pk), 'tweet-list')
+        unindex_tweet(instance.pk)
         instance.delete()
 
 
+class TweetSearchView(EagerLoadingMixin, ListAPIView):
+    """Full-text search over tweets, best matches first: /tweets/search/?q=..."""
+    serializer_class = TweetSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = SEARCH_ORDERING
+
+    def get_queryset(self):
+        text = self.request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': ["This query parameter is required."]})
+        return search_tweets(text)
+
+
+class HashtagTweetListView(EagerLoadingMixin, ListAPIView):
+    """Tweets tagged with a hashtag, newest first."""
+    serializer_class = TweetSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-tagged_at', '-tagged_tweet')
+
+    def get_queryset(self):
+        """Order on the link table's own columns so its (hashtag, created_at, tweet) index needs no sort."""
+        return Tweet.objects.filter(tweet_hashtags__hashtag__name=self.kwargs['name'].lower()).annotate(
+            tagged_at=F('tweet_hashtags__created_at'), tagged_tweet=F('tweet_hashtags__tweet_id'))
+
+
+class TrendsView(APIView):
+    """Trending hashtags and most-liked recent tweets, ranked from counts merged across workers."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        k = trending_setting('TOP_K')
+        hashtags = [{"name": name, "score": score} for name, score in hashtag_trends.trending(k)]
+        ranked = tweet_trends.trending(k)
+        found = Tweet.objects.select_related('user').in_bulk([tweet_id for tweet_id, _ in ranked])
+        tweets = [
+            {**TweetSerializer(found[tweet_id]).data, "score": score}
+            for tweet_id, score in ranked if tweet_id in found  # Skip tweets deleted since they were liked
+        ]
+        return Response({"hashtags": hashtags, "tweets": tweets}, status=status.HTTP_200_OK)
+
+
 # -------------------------- LIKES --------------------------
 
 class LikeTweetView(APIView):
-    """Allows users to like/unlike a tweet."""
+    """Allows users to like/unlike a tweet: PUT likes, DELETE unlikes, POST toggles."""
     permission_classes = [IsAuthenticated]
+    not_found = {"error": "Tweet not found"}
+
+    def put(self, request, tweet_id):
+        """Like a tweet. Safe to retry: liking twice leaves a single like."""
+        result = like_tweet(request.user, tweet_id)
+        if not result.tweet_exists:
+            return Response(self.not_found, status=status.HTTP_404_NOT_FOUND)
+        if result.changed:
+            return Response({"message": "Tweet liked", "changed": True}, status=status.HTTP_201_CREATED)
+        return Response({"message": "Tweet already liked", "changed": False}, status=status.HTTP_200_OK)
+
+    def delete(self, request, tweet_id):
+        """Unlike a tweet. Safe to retry: unliking twice is a no-op."""
+        result = unlike_tweet(request.user, tweet_id)
+        if not result.tweet_exists:
+            return Response(self.not_found, status=status.HTTP_404_NOT_FOUND)
+        message = "Tweet unliked" if result.changed else "Tweet was not liked"
+        return Response({"message": message, "changed": result.changed}, status=status.HTTP_200_OK)
 
     def post(self, request, tweet_id):
         """Like or unlike a tweet."""
-        try:
-            tweet = Tweet.objects.get(id=tweet_id)
-        except Tweet.DoesNotExist:
-            return Response({"error": "Tweet not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        like, created = Like.objects.get_or_create(user=request.user, tweet=tweet)
-
-        if created:
-            # Create a notification for the tweet owner
-            Notification.objects.create(
-                user=tweet.user,
-                sender=request.user,
-                notification_type='like',
-                tweet=tweet
-            )
-            return Response({"message": "Tweet liked"}, status=status.HTTP_201_CREATED)
-        else:
-            like.delete()  # Unlike if already liked
+        if unlike_tweet(request.user, tweet_id).changed:
             return Response({"message": "Tweet unliked"}, status=status.HTTP_200_OK)
-
+        if like_tweet(request.user, tweet_id).tweet_exists:
+            return Response({"message": "Tweet liked"}, status=status.HTTP_201_CREATED)
+        return Response(self.not_found, status=status.HTTP_404_NOT_FOUND)
 
 
 # -------------------------- COMMENTS CRUD --------------------------
 
-class CommentListCreateView(ListCreateAPIView):
+class CommentListCreateView(ConditionalGetMixin, CommentThreadMixin, EagerLoadingMixin, ListCreateAPIView):
     """Allows users to view and post comments (including replies)."""
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = THREAD_ORDERING
 
     def get_queryset(self):
         """Fetch top-level comments for a tweet."""
         tweet_id = self.kwargs.get('tweet_id')
         return Comment.objects.filter(tweet_id=tweet_id, parent__isnull=True)
 
+    def get_etag_namespaces(self):
+        return [f"tweet:{self.kwargs.get('tweet_id')}"]  # Bumped by every comment written on the tweet
+
+    def get_etag_parts(self):
+        """Any new, edited or deleted comment on the tweet changes the count or the latest edit."""
+        stamp = Comment.objects.filter(tweet_id=self.kwargs.get('tweet_id')).aggregate(
+            count=Count('id'), latest=Max('updated_at'))
+        return stamp['count'], stamp['latest']
+
     def perform_create(self, serializer):
         """Assign the tweet and user to the comment, allow replies."""
         try:
@@ -99,55 +195,85 @@ class CommentListCreateView(ListCreateAPIView):
                 raise PermissionDenied("Parent comment does not exist.")
 
             # Create a notification for the original commenter
-            Notification.objects.create(
-                user=parent_comment.user,
-                sender=self.request.user,
-                notification_type='reply',
-                comment=parent_comment
-            )
+            notify(user=parent_comment.user, sender=self.request.user, notification_type='reply',
+                   comment=parent_comment)
 
-        serializer.save(user=self.request.user, tweet=tweet, parent=parent_comment)
+        comment = serializer.save(user=self.request.user, tweet=tweet, parent=parent_comment)
+        adjust_comments_count(tweet.id, 1)
+        invalidate(*tweet_namespaces(tweet.id), *comment_namespaces(comment))
 
 
 
 
 
-class CommentDetailView(RetrieveUpdateDestroyAPIView):
+class CommentReplyListView(CommentThreadMixin, EagerLoadingMixin, ListAPIView):
+    """Pages through the direct replies of a comment ("load more")."""
+    serializer_class = CommentSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = THREAD_ORDERING
+
+    def get_queryset(self):
+        return Comment.objects.filter(parent_id=self.kwargs.get('pk'))
+
+
+class CommentDetailView(ConditionalGetMixin, EagerLoadingMixin, RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a specific comment."""
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_etag_namespaces(self):
+        return [f"comment:{self.kwargs['pk']}"]  # Bumped by writes to the comment or any reply below it
+
+    def get_etag_parts(self):
+        """The comment and its rendered replies, from one range scan over the subtree."""
+        path = Comment.objects.filter(pk=self.kwargs['pk']).values_list('path', flat=True).first()
+        if path is None:
+            return None
+        _, high = Comment(pk=self.kwargs['pk'], path=path).subtree_bounds()
+        stamp = Comment.objects.filter(path__gte=path, path__lt=high).aggregate(
+            count=Count('id'), latest=Max('updated_at'))
+        return stamp['count'], stamp['latest']
+
     def perform_update(self, serializer):
         """Ensure only the comment owner can edit."""
         if self.get_object().user != self.request.user:
             raise PermissionDenied("You can only edit your own comments.")
-        serializer.save()
+        comment = serializer.save()
+        invalidate(*tweet_namespaces(comment.tweet_id), *comment_namespaces(comment))
 
     def perform_destroy(self, instance):
         """Ensure only the comment owner can delete."""
         if instance.user != self.request.user:
             raise PermissionDenied("You can only delete your own comments.")
-        instance.delete()
+        namespaces = (*tweet_namespaces(instance.tweet_id), *comment_namespaces(instance))
+        _, deleted = instance.delete()  # Replies are deleted with their parent
+        adjust_comments_count(instance.tweet_id, -deleted.get(Comment._meta.label, 0))
+        invalidate(*namespaces)
 
-class PersonalizedFeedView(ListAPIView):
+class PersonalizedFeedView(ConditionalGetMixin, EagerLoadingMixin, ListAPIView):
     """Shows tweets from users that the logged-in user follows."""
     serializer_class = TweetSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-feed_at', '-feed_tweet')  # Timeline row columns, see tweets.timeline.feed_queryset
 
     def get_queryset(self):
-        followed_users = self.request.user.following.values_list('id', flat=True)
-        return Tweet.objects.filter(user_id__in=followed_users).order_by('-created_at')
+        """Read the materialized timeline instead of scanning every followed user's tweets."""
+        return feed_queryset(self.request.user)
 
+    def get_etag_parts(self):
+        """Version stamps of the tweets on the requested page, without loading them."""
+        page = self.paginator.page_queryset(self.get_queryset(), self.request, view=self)
+        return list(page.values_list('id', 'updated_at', 'likes_count', 'comments_count', 'user__username'))
 
 
-class NotificationListView(ListAPIView):
+class NotificationListView(EagerLoadingMixin, ListAPIView):
     """Fetches all notifications for the logged-in user."""
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user).order_by('-created_at')
+        return Notification.objects.filter(user=self.request.user).order_by('-created_at', '-id')
 
 
 class MarkNotificationAsReadView(APIView):
@@ -155,10 +281,55 @@ class MarkNotificationAsReadView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, notification_id):
-        try:
-            notification = Notification.objects.get(id=notification_id, user=request.user)
-            notification.is_read = True
-            notification.save()
-            return Response({"message": "Notification marked as read"}, status=status.HTTP_200_OK)
-        except Notification.DoesNotExist:
+        updated = Notification.objects.filter(id=notification_id, user=request.user).update(is_read=True)
+        if not updated:
             return Response({"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"message": "Notification marked as read"}, status=status.HTTP_200_OK)
+
+
+class MarkNotificationsAsReadView(APIView):
+    """Marks many notifications as read in a single UPDATE."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = NotificationReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        notifications = Notification.objects.filter(user=request.user, is_read=False)
+        if 'ids' in data:
+            notifications = notifications.filter(id__in=data['ids'])
+        elif 'cursor' in data:
+            # The cursor names the last notification the client has seen; mark it and everything older.
+            created_at, notification_id = position = data['cursor']
+            older = KeysetCursorPagination.keyset_filter(KeysetCursorPagination.ordering, position)
+            notifications = notifications.filter(older | Q(created_at=created_at, id=notification_id))
+
+        updated = notifications.update(is_read=True)
+        return Response({"updated": updated}, status=status.HTTP_200_OK)
+
+
+class UnreadNotificationCountView(APIView):
+    """Returns the number of unread notifications, for badge polling."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        count = Notification.objects.filter(user=request.user, is_read=False).count()  # Partial index scan
+        return Response({"unread_count": count}, status=status.HTTP_200_OK)
+
+
+class StreamTicketView(APIView):
+    """Issues a short-lived, single-use ticket for opening the event stream from a browser."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        ticket = issue_ticket(request.user.pk)
+        return Response({"ticket": ticket, "expires_in": push_setting('TICKET_TTL')}, status=status.HTTP_201_CREATED)
+
+
+class ResponseCacheStatsView(APIView):
+    """Hit/miss counters of the response cache in this process, per endpoint."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(stats.snapshot(), status=status.HTTP_200_OK)
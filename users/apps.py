@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from config import db_router  # noqa: F401  Registers the replica settings check
+
+        from . import tokens  # noqa: F401  Keeps the blacklisted-jti set in step with new rows
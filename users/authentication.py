@@ -0,0 +1,32 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import ClaimsUser
+from .user_cache import REVOKE_HASH, cached_user_row
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that does not SELECT the user on every request.
+
+    The account checks simplejwt performs (the user exists, is active and, with CHECK_REVOKE_TOKEN,
+    has not changed password) run against the cached user row; the request user is a ClaimsUser
+    holding only the id from the token.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        row = cached_user_row(user_id)
+        if row is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not row['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != row[REVOKE_HASH]:
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return ClaimsUser.from_claims(user_id)
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from users.tokens import load_blacklist
+
+
+class Command(BaseCommand):
+    help = ("Delete expired outstanding and blacklisted refresh tokens in small batches, "
+            "then reload the shared set of blacklisted jtis.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of expired tokens deleted per transaction.")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches, to go easy on a busy database.")
+
+    def handle(self, *args, **options):
+        now = aware_utcnow()
+        batch_size = options['batch_size']
+        last_id = 0
+        pruned = 0
+        while True:
+            # Walk the primary key: expired tokens are the oldest, so each batch is found near the start of the index.
+            ids = list(
+                OutstandingToken.objects.filter(id__gt=last_id, expires_at__lte=now)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                BlacklistedToken.objects.filter(token_id__in=ids).delete()
+                OutstandingToken.objects.filter(id__in=ids).delete()
+            pruned += len(ids)
+            last_id = ids[-1]
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {pruned} expired token(s)."))
+
+        loaded = load_blacklist(batch_size)
+        if loaded is None:
+            self.stdout.write("TOKEN_BLACKLIST['CACHE_ALIAS'] is not shared; blacklist checks read the database.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Loaded {loaded} blacklisted jti(s) into the cache."))
@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized followers_count/following_count columns on users."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of user ids recomputed per UPDATE statement.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        Follow = User.followers.through
+
+        def count_of(column):
+            counts = (
+                Follow.objects.filter(**{column: OuterRef('pk')})
+                .order_by()
+                .values(column)
+                .annotate(total=Count('id'))
+                .values('total')
+            )
+            return Coalesce(Subquery(counts), Value(0))
+
+        bounds = User.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            self.stdout.write("No users to reconcile.")
+            return
+
+        batch_size = options['batch_size']
+        updated = 0
+        for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+            # A row (from_customuser=A, to_customuser=B) means B follows A.
+            updated += User.objects.filter(id__gte=start, id__lt=start + batch_size).update(
+                followers_count=count_of('from_customuser'),
+                following_count=count_of('to_customuser'),
+            )
+        self.stdout.write(self.style.SUCCESS(f"Reconciled follow counts on {updated} user(s)."))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_follow_counts(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Follow = CustomUser.followers.through
+
+    def count_of(column):
+        counts = Follow.objects.filter(**{column: OuterRef('pk')}).order_by().values(column).annotate(total=Count('id')).values('total')
+        return Coalesce(Subquery(counts), Value(0))
+
+    # A row (from_customuser=A, to_customuser=B) means B follows A.
+    CustomUser.objects.update(followers_count=count_of('from_customuser'), following_count=count_of('to_customuser'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_follow_counts, migrations.RunPython.noop),
+    ]
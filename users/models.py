@@ -1,5 +1,12 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from tweets.response_cache import invalidate
+
+from .graph_cache import following_ids, invalidate_following
+from .user_cache import cached_user_row, invalidate_user
 
 
 class CustomUser(AbstractUser):
@@ -7,32 +14,83 @@ class CustomUser(AbstractUser):
     bio = models.TextField(blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
     followers = models.ManyToManyField('self', symmetrical=False, related_name='following', blank=True)
+    # Denormalized graph counters, maintained by follow()/unfollow()
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
 
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_user(self.pk)
+
+    def delete(self, *args, **kwargs):
+        user_id = self.pk
+        result = super().delete(*args, **kwargs)
+        invalidate_user(user_id)
+        return result
 
     def follow(self, user):
-        """Follow another user."""
-        if user != self:
-            self.following.add(user)
+        """Follow another user. Returns True if this created a new follow."""
+        if user == self:
+            return False
+        Follow = CustomUser.followers.through
+        with transaction.atomic():
+            _, created = Follow.objects.get_or_create(from_customuser=user, to_customuser=self)
+            if created:
+                CustomUser.objects.filter(pk=self.pk).update(following_count=F('following_count') + 1)
+                CustomUser.objects.filter(pk=user.pk).update(followers_count=F('followers_count') + 1)
+                invalidate_following(self)
+                invalidate_user(self.pk, user.pk)
+                invalidate(f'profile:{self.pk}', f'profile:{user.pk}')
+        return created
 
     def unfollow(self, user):
-        """Unfollow another user."""
-        if user in self.following.all():
-            self.following.remove(user)
+        """Unfollow another user. Returns True if there was a follow to remove."""
+        Follow = CustomUser.followers.through
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(from_customuser=user, to_customuser=self).delete()
+            if deleted:
+                CustomUser.objects.filter(pk=self.pk).update(following_count=Greatest(F('following_count') - 1, 0))
+                CustomUser.objects.filter(pk=user.pk).update(followers_count=Greatest(F('followers_count') - 1, 0))
+                invalidate_following(self)
+                invalidate_user(self.pk, user.pk)
+                invalidate(f'profile:{self.pk}', f'profile:{user.pk}')
+        return bool(deleted)
 
     def is_following(self, user):
-        """Check if the user is following another user."""
-        return self.following.filter(id=user.id).exists()
+        """Check if the user is following another user (served from the follow-graph cache)."""
+        return user.pk in following_ids(self)
+
+
+class ClaimsUser(CustomUser):
+    """
+    The request user as known from a verified access token: only the id is loaded.
+
+    Reading any other field fills all of them at once from the user cache instead of the database. That copy
+    may be stale, so saving one only writes the fields named in ``update_fields``; edit a fresh ``CustomUser``
+    to change anything else.
+    """
 
-    def followers_count(self):
-        """Get count of followers."""
-        return self.followers.count()
+    class Meta:
+        proxy = True
 
-    def following_count(self):
-        """Get count of following users."""
-        return self.following.count()
+    @classmethod
+    def from_claims(cls, user_id):
+        return cls.from_db(None, ['id'], [user_id])
 
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None:
+            raise ValueError("ClaimsUser holds a cached copy of the row; save it with update_fields.")
+        super().save(*args, **kwargs)
 
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        if fields is not None and from_queryset is None:
+            row = cached_user_row(self.pk)
+            if row is not None and all(field in row for field in fields):
+                for attname in self.get_deferred_fields() & row.keys():
+                    setattr(self, attname, row[attname])
+                return
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
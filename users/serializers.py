@@ -1,16 +1,17 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 
+from .graph_cache import following_ids
+
 User = get_user_model()
 
 class SignupSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password', 'bio', 'profile_picture', 'followers_count', 'following_count']
+        read_only_fields = ['followers_count', 'following_count']  # Denormalized counters
 
     def create(self, validated_data):
         """Creates a new user with hashed password."""
@@ -23,8 +24,33 @@ class SignupSerializer(serializers.ModelSerializer):
         )
         return user
 
-    def get_followers_count(self, obj):
-        return obj.followers.count()
+    def update(self, instance, validated_data):
+        """Write only the submitted fields, so counters changed meanwhile by follows are left alone."""
+        password = validated_data.pop('password', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        update_fields = list(validated_data)
+        if password is not None:
+            instance.set_password(password)
+            update_fields.append('password')
+        instance.save(update_fields=update_fields)
+        return instance
+
+
+class FollowUserSerializer(serializers.ModelSerializer):
+    """Compact user representation for follower/following lists, with relationship badges."""
+    is_following = serializers.SerializerMethodField()
+    follows_you = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'bio', 'profile_picture', 'is_following', 'follows_you']
+
+    def get_is_following(self, obj):
+        """Whether the requesting user follows this user."""
+        return obj.pk in following_ids(self.context['request'].user)
+
+    def get_follows_you(self, obj):
+        """Whether this user follows the requesting user (precomputed per page by the view)."""
+        return obj.pk in self.context.get('follows_you_ids', ())
 
-    def get_following_count(self, obj):
-        return obj.following.count()
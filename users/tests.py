@@ -1,3 +1,350 @@
-from django.test import TestCase
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tweets.entities import index_entities
+from tweets.models import Tweet
+from tweets.testing import QueryCountAssertionsMixin
+
+from .graph_cache import following_ids, graph_setting
+from .models import ClaimsUser
+from .tokens import CachedRefreshToken
+
+User = get_user_model()
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False}, NOTIFICATIONS={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ListQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    """Follower, following and mention lists must cost the same number of queries for 2 rows as for 20."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('celebrity', 'celebrity@example.com', 'password123')
+        for i in range(25):
+            other = User.objects.create_user(f'user{i}', f'user{i}@example.com', 'password123')
+            other.follow(cls.user)
+            cls.user.follow(other)
+            Tweet.objects.create(user=other, content=f"Hey @celebrity, it's {other.username}")
+        index_entities(Tweet.objects.all())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_followers(self):
+        self.assertQueryCountIndependentOfPageSize(self.client, reverse('follower-list', args=[self.user.pk]))
+
+    def test_following(self):
+        self.assertQueryCountIndependentOfPageSize(self.client, reverse('following-list', args=[self.user.pk]))
+
+    def test_mentions(self):
+        self.assertQueryCountIndependentOfPageSize(self.client, reverse('user-mentions', args=[self.user.pk]))
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False}, NOTIFICATIONS={'ASYNC': False}, TIMELINE={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class FollowGraphTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        cls.others = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'password123') for i in range(5)]
+
+    def setUp(self):
+        caches[graph_setting('CACHE_ALIAS')].clear()  # Follows in tests are never committed to invalidate it
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counts(self, user):
+        user = User.objects.get(pk=user.pk)
+        return user.followers_count, user.following_count
+
+    def follow(self, user):
+        return self.client.post(reverse('follow-user', args=[user.pk]))
+
+    def unfollow(self, user):
+        return self.client.post(reverse('unfollow-user', args=[user.pk]))
+
+    def pages(self, name, user, page_size=2):
+        """Every page of a follow list, as lists of ids."""
+        pages, url = [], f"{reverse(name, args=[user.pk])}?page_size={page_size}"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([listed['id'] for listed in response.json()['results']])
+            url = response.json()['next']
+        return pages
+
+    def test_counts_follow_the_graph(self):
+        self.assertEqual(self.follow(self.others[0]).status_code, 200)
+        self.assertEqual(self.follow(self.others[0]).status_code, 200)  # Already following
+        self.follow(self.others[1])
+        self.assertEqual(self.counts(self.user), (0, 2))
+        self.assertEqual(self.counts(self.others[0]), (1, 0))
+
+        self.assertEqual(self.unfollow(self.others[0]).status_code, 200)
+        self.assertEqual(self.unfollow(self.others[0]).status_code, 400)  # No longer following
+        self.assertEqual(self.counts(self.user), (0, 1))
+        self.assertEqual(self.counts(self.others[0]), (0, 0))
+
+    def test_cannot_follow_yourself(self):
+        self.assertEqual(self.follow(self.user).status_code, 400)
+        self.assertEqual(self.counts(self.user), (0, 0))
+
+    def test_profile_shows_the_counts(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(client.get(reverse('profile')).json()['following_count'], 0)  # Caches the user row
+        with self.captureOnCommitCallbacks(execute=True):
+            self.follow(self.others[0])
+            self.others[1].follow(self.user)
+        profile = client.get(reverse('profile')).json()
+        self.assertEqual((profile['followers_count'], profile['following_count']), (1, 1))
+
+    def test_reconcile_repairs_drifted_counts(self):
+        self.follow(self.others[0])
+        User.objects.filter(pk__in=[self.user.pk, self.others[0].pk]).update(followers_count=7, following_count=7)
+        call_command('reconcile_follow_counts', batch_size=2, stdout=StringIO())
+        self.assertEqual(self.counts(self.user), (0, 1))
+        self.assertEqual(self.counts(self.others[0]), (1, 0))
+
+    def test_following_list_pages(self):
+        for other in self.others:
+            self.follow(other)
+        pages = self.pages('following-list', self.user)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), sorted((other.pk for other in self.others), reverse=True))
+
+    def test_follower_list_pages_with_badges(self):
+        for other in self.others:
+            other.follow(self.user)
+        self.follow(self.others[0])
+        self.assertEqual(sum(self.pages('follower-list', self.user, page_size=3), []),
+                         sorted((other.pk for other in self.others), reverse=True))
+
+        listed = self.client.get(reverse('follower-list', args=[self.user.pk])).json()['results']
+        badges = {entry['id']: (entry['is_following'], entry['follows_you']) for entry in listed}
+        self.assertEqual(badges[self.others[0].pk], (True, True))
+        self.assertEqual(badges[self.others[1].pk], (False, True))
+
+    def test_lists_of_a_missing_user(self):
+        missing = User(pk=self.others[-1].pk + 1000)
+        self.assertEqual(self.client.get(reverse('follower-list', args=[missing.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('following-list', args=[missing.pk])).status_code, 404)
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False}, NOTIFICATIONS={'ASYNC': False}, TIMELINE={'ASYNC': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class FollowingSetCacheTests(TestCase):
+    """Each user's following set is read once, then served from the follow_graph cache until they (un)follow."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        cls.others = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'password123') for i in range(3)]
+        cls.user.follow(cls.others[0])
+
+    def setUp(self):
+        caches[graph_setting('CACHE_ALIAS')].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_one_query_then_cache_hits(self):
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            self.assertTrue(user.is_following(self.others[0]))
+            self.assertFalse(user.is_following(self.others[1]))  # Memoized on the user for the request
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertEqual(following_ids(user), {self.others[0].pk})  # From the cache
+
+    def test_follow_invalidates_the_cached_set(self):
+        self.assertFalse(self.fresh_user().is_following(self.others[1]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('follow-user', args=[self.others[1].pk])).status_code, 200)
+        self.assertTrue(self.fresh_user().is_following(self.others[1]))
+
+    def test_unfollow_invalidates_the_cached_set(self):
+        self.assertTrue(self.fresh_user().is_following(self.others[0]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('unfollow-user', args=[self.others[0].pk])).status_code, 200)
+        self.assertFalse(self.fresh_user().is_following(self.others[0]))
+
+    def test_following_badges_come_from_the_cached_set(self):
+        url = reverse('following-list', args=[self.others[1].pk])
+        self.others[1].follow(self.others[0])
+        self.others[1].follow(self.others[2])
+        follow_table = User.followers.through._meta.db_table
+        set_query = f'"{follow_table}"."to_customuser_id" = {self.user.pk}'  # following_ids() of the reader
+
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as second:
+            listed = self.client.get(url).json()['results']
+        self.assertEqual({entry['id']: entry['is_following'] for entry in listed},
+                         {self.others[0].pk: True, self.others[2].pk: False})
+        self.assertTrue(any(set_query in query['sql'] for query in first))
+        self.assertFalse(any(set_query in query['sql'] for query in second))
+
+
+WORKER_CACHES = {
+    **settings.CACHES,
+    'worker-a': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-a'},
+    'worker-b': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-b'},
+}
+
+
+@override_settings(CACHES=WORKER_CACHES, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class TokenBlacklistTests(TestCase):
+    """Each worker process has its own locmem cache; a blacklisting on one must hold on the others."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+
+    def refresh(self, token, worker):
+        with self.settings(TOKEN_BLACKLIST={'CACHE_ALIAS': worker}):
+            return APIClient().post(reverse('token_refresh'), {'refresh': str(token)})
+
+    def test_logout_on_another_worker_revokes_a_rotated_token(self):
+        rotated = self.refresh(CachedRefreshToken.for_user(self.user), 'worker-b').json()['refresh']
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.settings(TOKEN_BLACKLIST={'CACHE_ALIAS': 'worker-a'}):
+            self.assertEqual(client.post(reverse('logout'), {'refresh': rotated}).status_code, 200)
+
+        self.assertEqual(self.refresh(rotated, 'worker-b').status_code, 401)
+
+    def test_blacklisting_outside_the_token_is_seen(self):
+        token = CachedRefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token, 'worker-b').status_code, 200)
+        self.assertEqual(self.refresh(token, 'worker-b').status_code, 401)
+
+        token = CachedRefreshToken.for_user(self.user)
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        self.assertEqual(self.refresh(token, 'worker-a').status_code, 401)
+
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SharedTokenBlacklistTests(TestCase):
+    """With a shared cache the set of blacklisted jtis answers every check once it has been loaded."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+
+    def setUp(self):
+        location = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(
+            CACHES={**settings.CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                  'LOCATION': location}},
+            TOKEN_BLACKLIST={'CACHE_ALIAS': 'shared'},
+        ))
+
+    def load(self):
+        call_command('prune_tokens', stdout=StringIO())
+
+    def test_check_needs_no_query_once_loaded(self):
+        self.load()
+        token = str(CachedRefreshToken.for_user(self.user))
+        with self.assertNumQueries(0):
+            CachedRefreshToken(token)
+
+    def test_rows_saved_anywhere_are_seen_without_a_query(self):
+        self.load()
+        token = CachedRefreshToken.for_user(self.user)
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))  # e.g. the admin
+        with self.assertNumQueries(0), self.assertRaises(TokenError):
+            CachedRefreshToken(str(token))
+
+    def test_rotated_token_is_refused(self):
+        self.load()
+        token = CachedRefreshToken.for_user(self.user)
+        url = reverse('token_refresh')
+        self.assertEqual(APIClient().post(url, {'refresh': str(token)}).status_code, 200)
+        self.assertEqual(APIClient().post(url, {'refresh': str(token)}).status_code, 401)
+
+    def test_database_answers_until_the_set_is_loaded(self):
+        token = CachedRefreshToken.for_user(self.user)
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        caches['shared'].clear()  # e.g. a restarted cache server
+        with self.assertRaises(TokenError):
+            CachedRefreshToken(str(token))
+
+        caches['shared'].clear()
+        self.load()
+        with self.assertNumQueries(0), self.assertRaises(TokenError):
+            CachedRefreshToken(str(token))
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ClaimsAuthenticationTests(TestCase):
+    """Token requests get a ClaimsUser filled from the cached row; writes must not trust that copy."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def user_queries(self, queries):
+        return [query['sql'] for query in queries if 'users_customuser' in query['sql']]
+
+    def test_user_row_is_read_once(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.client.get(reverse('profile')).json()['username'], 'reader')
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.client.get(reverse('profile')).json()['username'], 'reader')
+        self.assertEqual(len(self.user_queries(first)), 1)
+        self.assertEqual(self.user_queries(second), [])
+
+    def test_deactivation_through_save_applies_at_once(self):
+        self.client.get(reverse('profile'))
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 401)
+
+    def test_update_keeps_counters_changed_after_the_row_was_cached(self):
+        self.client.get(reverse('profile'))
+        User.objects.filter(pk=self.user.pk).update(followers_count=5)
+
+        response = self.client.patch(reverse('profile'), {'bio': "Hello"})
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.bio, user.followers_count), ("Hello", 5))
+
+    def test_update_does_not_reactivate_a_deactivated_account(self):
+        self.client.get(reverse('profile'))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)  # Still active in the cached row
+
+        self.client.patch(reverse('profile'), {'bio': "Hello"})
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+
+    def test_claims_user_needs_update_fields(self):
+        user = ClaimsUser.from_claims(self.user.pk)
+        with self.assertRaises(ValueError):
+            user.save()
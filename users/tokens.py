@@ -0,0 +1,145 @@
+"""
+Refresh tokens with a cached blacklist.
+
+With ``ROTATE_REFRESH_TOKENS`` and ``BLACKLIST_AFTER_ROTATION`` every refresh
+blacklists the presented token, so ``token_blacklist`` grows with every
+refresh and checking it is a join against the biggest table in the project.
+``CachedRefreshToken`` checks a set of blacklisted jtis kept in a shared
+cache instead: one key per jti, written whenever a ``BlacklistedToken`` row is
+saved (by ``blacklist()``, the admin or anything else going through the ORM)
+and expiring with the token. ``manage.py prune_tokens`` loads the set from the
+table and marks it complete; from then on a jti missing from it is not
+blacklisted, so a refresh checks the blacklist without a query. Until then
+(a new deployment, or the cache was flushed) misses are looked up in the
+database. The cache must not evict keys early, e.g. Redis with
+``maxmemory-policy noeviction`` or a ``volatile-ttl`` policy with headroom.
+
+``CachedTokenRefreshSerializer`` uses it for ``/users/token/refresh/`` and
+checks the account against the user cache instead of loading the user.
+``manage.py prune_tokens`` deletes expired rows in batches so the tables
+stay at roughly one token lifetime's worth of rows.
+
+The set is only used when ``CACHE_ALIAS`` is shared by every worker process
+(see ``config/caches.py``); with a per-process one every check goes to the
+database, so a blacklisting on one worker is never missed by another.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow, datetime_from_epoch
+
+from config.caches import is_shared
+
+from .models import ClaimsUser
+from .user_cache import cached_user_row
+
+TOKEN_BLACKLIST_DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+}
+
+
+def blacklist_setting(name):
+    """Read a TOKEN_BLACKLIST setting, falling back to the defaults above."""
+    return getattr(settings, 'TOKEN_BLACKLIST', {}).get(name, TOKEN_BLACKLIST_DEFAULTS[name])
+
+
+def _cache():
+    """The blacklist cache, or None when it is private to this process."""
+    alias = blacklist_setting('CACHE_ALIAS')
+    return caches[alias] if is_shared(alias) else None
+
+
+def _key(jti):
+    return f'token-blacklist:{jti}'
+
+
+COMPLETE_KEY = 'token-blacklist:complete'  # Present once the set holds every unexpired blacklisted jti
+
+
+def _seconds_until(expires_at):
+    return max(1, int((expires_at - aware_utcnow()).total_seconds()))
+
+
+@receiver(post_save, sender=BlacklistedToken, dispatch_uid='users.tokens.remember_blacklisted')
+def remember_blacklisted(sender, instance, created, **kwargs):
+    """Add a new blacklisting to the set right away; on a rollback the token is only refused early."""
+    cache = _cache()
+    if created and cache is not None:
+        cache.set(_key(instance.token.jti), True, _seconds_until(instance.token.expires_at))
+
+
+def load_blacklist(batch_size=5000):
+    """Fill the set from the table and mark it complete; the number of jtis loaded, or None without a shared cache."""
+    cache = _cache()
+    if cache is None:
+        return None
+    now = aware_utcnow()
+    rows = BlacklistedToken.objects.filter(token__expires_at__gt=now).values_list('token__jti', 'token__expires_at')
+    loaded = 0
+    batch = {}
+    for jti, expires_at in rows.iterator(chunk_size=batch_size):
+        batch[_key(jti)] = True
+        if len(batch) == batch_size:
+            loaded += _store(cache, batch)
+    loaded += _store(cache, batch)
+    cache.set(COMPLETE_KEY, True, None)
+    return loaded
+
+
+def _store(cache, batch):
+    # One timeout per call: the longest a refresh token lives, which outlasts every entry's own expiry.
+    cache.set_many(batch, int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()))
+    stored = len(batch)
+    batch.clear()
+    return stored
+
+
+class CachedRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist check reads the shared jti set."""
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        cache = _cache()
+        if cache is not None:
+            found = cache.get_many([_key(jti), COMPLETE_KEY])
+            if found.get(_key(jti)):
+                raise TokenError(_("Token is blacklisted"))
+            if found.get(COMPLETE_KEY):
+                return
+        if BlacklistedToken.objects.filter(token__jti=jti).exists():
+            if cache is not None:
+                cache.set(_key(jti), True, _seconds_until(datetime_from_epoch(self.payload['exp'])))
+            raise TokenError(_("Token is blacklisted"))
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """TokenRefreshSerializer using CachedRefreshToken, with the active-account check served from the user cache."""
+    token_class = CachedRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id:
+            user = ClaimsUser.from_claims(user_id) if cached_user_row(user_id) is not None else None
+            if not api_settings.USER_AUTHENTICATION_RULE(user):
+                raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        return data
@@ -1,6 +1,7 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import SignupView, LogoutView, UserProfileView,FollowUserView, UnfollowUserView
+from .views import SignupView, LogoutView, UserProfileView,FollowUserView, UnfollowUserView, FollowerListView, \
+    FollowingListView, UserMentionListView
 
 urlpatterns = [
     path('signup/', SignupView.as_view(), name='signup'),
@@ -10,4 +11,7 @@ urlpatterns = [
     path('profile/', UserProfileView.as_view(), name='profile'),
     path('<int:user_id>/follow/', FollowUserView.as_view(), name='follow-user'),
     path('<int:user_id>/unfollow/', UnfollowUserView.as_view(), name='unfollow-user'),
+    path('<int:user_id>/followers/', FollowerListView.as_view(), name='follower-list'),
+    path('<int:user_id>/following/', FollowingListView.as_view(), name='following-list'),
+    path('<int:user_id>/mentions/', UserMentionListView.as_view(), name='user-mentions'),
 ]
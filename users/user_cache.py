@@ -0,0 +1,60 @@
+"""
+Cached user rows for token authentication.
+
+Authenticated API requests identify the user from the signed JWT claims
+alone (see ``users.authentication``); the rest of the row is only needed
+when a view reads something like ``username`` or ``bio``. Those reads, and
+the per-request active-account check, are served from a copy of the row
+kept in Django's cache for ``AUTH_USER_CACHE['TIMEOUT']`` seconds.
+
+Saving or deleting a user and following/unfollowing drop the entry after
+commit; changes made with ``QuerySet.update()`` show up once it expires.
+Use a shared cache backend so invalidations reach every worker process.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+AUTH_USER_CACHE_DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60,  # Seconds a cached row (and a deactivation done with QuerySet.update) can lag behind
+}
+
+REVOKE_HASH = '_revoke_hash'  # Stands in for the password hash, which is never cached
+
+
+def user_cache_setting(name):
+    """Read an AUTH_USER_CACHE setting, falling back to the defaults above."""
+    return getattr(settings, 'AUTH_USER_CACHE', {}).get(name, AUTH_USER_CACHE_DEFAULTS[name])
+
+
+def _cache():
+    return caches[user_cache_setting('CACHE_ALIAS')]
+
+
+def _key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def cached_user_row(user_id):
+    """{attname: value} for the user's concrete fields except the password, or None if there is no such user."""
+    row = _cache().get(_key(user_id))
+    if row is None:
+        User = get_user_model()
+        attnames = [field.attname for field in User._meta.concrete_fields]
+        row = User.objects.filter(pk=user_id).values(*attnames).first()
+        if row is None:
+            return None
+        password = row.pop('password')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            row[REVOKE_HASH] = get_md5_hash_password(password)
+        _cache().set(_key(user_id), row, user_cache_setting('TIMEOUT'))
+    return row
+
+
+def invalidate_user(*user_ids):
+    """Drop cached rows once the current transaction commits."""
+    transaction.on_commit(lambda: _cache().delete_many([_key(user_id) for user_id in user_ids]))
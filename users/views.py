@@ -1,15 +1,22 @@
 from django.contrib.auth import get_user_model
+from django.db.models import F
 from rest_framework import status
-from rest_framework.generics import CreateAPIView
+from rest_framework.generics import CreateAPIView, ListAPIView, get_object_or_404
 from rest_framework.generics import RetrieveUpdateAPIView
 from rest_framework.permissions import AllowAny
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 
-from .serializers import SignupSerializer
-from tweets.models import Notification
+from .graph_cache import follower_ids_among
+from .serializers import SignupSerializer, FollowUserSerializer
+from .tokens import CachedRefreshToken
+from tweets.eager_loading import EagerLoadingMixin
+from tweets.models import Tweet
+from tweets.notifications import notify
+from tweets.response_cache import CachedResponseMixin, invalidate
+from tweets.serializers import TweetSerializer
+from tweets.timeline import add_follow, remove_follow
 
 class SignupView(CreateAPIView):
     """Handles user registration."""
@@ -27,20 +34,34 @@ class LogoutView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = CachedRefreshToken(refresh_token)
             token.blacklist()  # Blacklist the refresh token
             return Response({"message": "Successfully logged out"}, status=200)
         except Exception as e:
             return Response({"error": "Invalid token"}, status=400)
 
 
-class UserProfileView(RetrieveUpdateAPIView):
+class UserProfileView(CachedResponseMixin, RetrieveUpdateAPIView):
     """Allows users to view and update their profile."""
     serializer_class = SignupSerializer
     permission_classes = [IsAuthenticated]
+    cache_endpoint = 'profile'
 
     def get_object(self):
-        return self.request.user  # Return the logged-in user
+        if self.request.method in SAFE_METHODS:
+            return self.request.user  # Return the logged-in user
+        # request.user is filled from the cached row; updates start from the current one
+        return get_object_or_404(User, pk=self.request.user.pk)
+
+    def get_cache_namespaces(self):
+        return [f'profile:{self.request.user.pk}']
+
+    def get_cache_object(self):
+        return f'user={self.request.user.pk}'
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate(f'profile:{self.request.user.pk}')
 
 
 User = get_user_model()
@@ -56,14 +77,10 @@ class FollowUserView(APIView):
             if request.user == user_to_follow:
                 return Response({"error": "You cannot follow yourself"}, status=status.HTTP_400_BAD_REQUEST)
 
-            request.user.following.add(user_to_follow)
-
-            # Create a notification for the followed user
-            Notification.objects.create(
-                user=user_to_follow,
-                sender=request.user,
-                notification_type='follow'
-            )
+            if request.user.follow(user_to_follow):
+                add_follow(request.user, user_to_follow)
+                # Create a notification for the followed user
+                notify(user=user_to_follow, sender=request.user, notification_type='follow')
 
             return Response({"message": f"You are now following {user_to_follow.username}"}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
@@ -81,40 +98,60 @@ class UnfollowUserView(APIView):
             if request.user == user_to_unfollow:
                 return Response({"error": "You cannot unfollow yourself"}, status=status.HTTP_400_BAD_REQUEST)
 
-            if not request.user.following.filter(id=user_to_unfollow.id).exists():
+            if not request.user.unfollow(user_to_unfollow):
                 return Response({"error": "You are not following this user"}, status=status.HTTP_400_BAD_REQUEST)
 
-            request.user.following.remove(user_to_unfollow)
+            remove_follow(request.user, user_to_unfollow)
             return Response({"message": f"You have unfollowed {user_to_unfollow.username}"}, status=status.HTTP_200_OK)
 
         except User.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
-class FollowerListView(APIView):
-    """Returns a list of users who follow the given user."""
-    permission_classes = [IsAuthenticated]
 
-    def get(self, request, user_id):
-        try:
-            user = User.objects.get(id=user_id)
-            followers = user.followers.all()
-            follower_data = [{"id": u.id, "username": u.username, "bio": u.bio, "profile_picture": u.profile_picture.url if u.profile_picture else None} for u in followers]
+class FollowBadgesMixin:
+    """Works out which users on the current page follow the requesting user, in one query."""
 
-            return Response(follower_data, status=status.HTTP_200_OK)
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        listed = page if page is not None else queryset
+        self.follows_you_ids = follower_ids_among(self.request.user, [user.pk for user in listed])
+        return page
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['follows_you_ids'] = getattr(self, 'follows_you_ids', frozenset())
+        return context
 
-class FollowingListView(APIView):
-    """Returns a list of users that the given user is following."""
+
+class FollowerListView(FollowBadgesMixin, ListAPIView):
+    """Returns a page of users who follow the given user."""
+    serializer_class = FollowUserSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-id',)
 
-    def get(self, request, user_id):
-        try:
-            user = User.objects.get(id=user_id)
-            following = user.following.all()
-            following_data = [{"id": u.id, "username": u.username, "bio": u.bio, "profile_picture": u.profile_picture.url if u.profile_picture else None} for u in following]
+    def get_queryset(self):
+        get_object_or_404(User.objects.only('id'), id=self.kwargs['user_id'])
+        return User.objects.filter(following__id=self.kwargs['user_id']).only('id', 'username', 'bio', 'profile_picture')
 
-            return Response(following_data, status=status.HTTP_200_OK)
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+
+class FollowingListView(FollowBadgesMixin, ListAPIView):
+    """Returns a page of users that the given user is following."""
+    serializer_class = FollowUserSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-id',)
+
+    def get_queryset(self):
+        get_object_or_404(User.objects.only('id'), id=self.kwargs['user_id'])
+        return User.objects.filter(followers__id=self.kwargs['user_id']).only('id', 'username', 'bio', 'profile_picture')
+
+
+class UserMentionListView(EagerLoadingMixin, ListAPIView):
+    """Tweets mentioning the given user, newest first."""
+    serializer_class = TweetSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-mentioned_at', '-mentioning_tweet')
+
+    def get_queryset(self):
+        get_object_or_404(User.objects.only('id'), id=self.kwargs['user_id'])
+        return Tweet.objects.filter(mentions__user_id=self.kwargs['user_id']).annotate(
+            mentioned_at=F('mentions__created_at'), mentioning_tweet=F('mentions__tweet_id'))